@@ -1,5 +1,10 @@
+from datetime import date, datetime, time, timedelta
+
 from django.contrib import admin
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
 
+from .deletion import delete_performances, delete_reservations, delete_tickets
 from .models import (
     TheatreHall,
     Genre,
@@ -8,12 +13,198 @@ from .models import (
     Performance,
     Reservation,
     Ticket,
+    Job,
+)
+from .paginators import EstimatedCountPaginator
+
+
+def _report_deleted(modeladmin, request, deleted):
+    modeladmin.message_user(
+        request,
+        "Deleted "
+        + ", ".join(f"{count} {name}" for name, count in deleted.items()),
+    )
+
+
+@admin.action(
+    description="Delete selected tickets (fast)",
+    permissions=["delete"],
+)
+def bulk_delete_tickets(modeladmin, request, queryset):
+    _report_deleted(modeladmin, request, delete_tickets(queryset))
+
+
+@admin.action(
+    description="Delete selected reservations with their tickets (fast)",
+    permissions=["delete"],
+)
+def bulk_delete_reservations(modeladmin, request, queryset):
+    _report_deleted(modeladmin, request, delete_reservations(queryset))
+
+
+@admin.action(
+    description="Cancel selected performances with their tickets (fast)",
+    permissions=["delete"],
 )
+def bulk_delete_performances(modeladmin, request, queryset):
+    _report_deleted(modeladmin, request, delete_performances(queryset))
+
+
+class SetBasedDeleteAdmin(admin.ModelAdmin):
+    """
+    Only offer the set-based bulk delete actions, Django's
+    delete_selected loads every related ticket into memory.
+    """
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop("delete_selected", None)
+        return actions
+
+
+class LargeTableAdmin(SetBasedDeleteAdmin):
+    """
+    Changelist for tables with millions of rows: estimated page counts,
+    no full-table count next to filter results, ordering by primary key.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ("-pk",)
+
+
+def _month_start(month):
+    return timezone.make_aware(datetime.combine(month, time.min))
+
+
+class ShowMonthFilter(admin.SimpleListFilter):
+    """Months of upcoming and recent performances, from the small table"""
+
+    title = "show month"
+    parameter_name = "show_month"
+
+    def lookups(self, request, model_admin):
+        months = (
+            Performance.objects.filter(
+                show_time__gte=timezone.now() - timedelta(days=365)
+            )
+            .annotate(month=TruncMonth("show_time"))
+            .values_list("month", flat=True)
+            .distinct()
+            .order_by("month")
+        )
+        return [(f"{month:%Y-%m-01}", f"{month:%B %Y}") for month in months]
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+        try:
+            month = date.fromisoformat(self.value()).replace(day=1)
+        except ValueError:
+            return queryset.none()
+        next_month = (month + timedelta(days=31)).replace(day=1)
+        # show_month prunes partitions, the performance ids use the index
+        return queryset.filter(
+            show_month=month,
+            performance__in=Performance.objects.filter(
+                show_time__gte=_month_start(month),
+                show_time__lt=_month_start(next_month),
+            ),
+        )
+
+
+class UpcomingPerformanceFilter(admin.SimpleListFilter):
+    title = "performance"
+    parameter_name = "performance"
+
+    def lookups(self, request, model_admin):
+        performances = (
+            Performance.objects.filter(show_time__gte=timezone.now())
+            .select_related("play")
+            .order_by("show_time")[:50]
+        )
+        return [
+            (
+                performance.pk,
+                f"{performance.play.title} - "
+                f"{timezone.localtime(performance.show_time):%Y-%m-%d %H:%M}",
+            )
+            for performance in performances
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(performance_id=self.value())
+        return queryset
+
+
+class TicketInline(admin.TabularInline):
+    model = Ticket
+    fields = ("performance", "row", "seat")
+    raw_id_fields = ("performance",)
+    extra = 0
+
+
+@admin.register(Ticket)
+class TicketAdmin(LargeTableAdmin):
+    list_display = ("id", "performance", "row", "seat", "reservation")
+    list_select_related = (
+        "performance__theatre_hall",
+        "reservation__user",
+    )
+    list_filter = (UpcomingPerformanceFilter, ShowMonthFilter)
+    raw_id_fields = ("performance", "reservation")
+    search_fields = ("=id",)
+    actions = (bulk_delete_tickets,)
+
+    def delete_model(self, request, obj):
+        delete_tickets(Ticket.objects.filter(pk=obj.pk))
+
+
+@admin.register(Reservation)
+class ReservationAdmin(LargeTableAdmin):
+    list_display = ("id", "user", "created_at")
+    list_select_related = ("user",)
+    raw_id_fields = ("user",)
+    search_fields = ("=id", "=user__email")
+    inlines = (TicketInline,)
+    actions = (bulk_delete_reservations,)
+
+    def delete_model(self, request, obj):
+        delete_reservations(Reservation.objects.filter(pk=obj.pk))
+
+
+@admin.register(Performance)
+class PerformanceAdmin(SetBasedDeleteAdmin):
+    list_display = ("id", "play", "theatre_hall", "show_time")
+    list_select_related = ("play", "theatre_hall")
+    list_filter = ("theatre_hall",)
+    autocomplete_fields = ("play", "theatre_hall")
+    raw_id_fields = ("series",)
+    date_hierarchy = "show_time"
+    ordering = ("-show_time",)
+    actions = (bulk_delete_performances,)
+
+    def delete_model(self, request, obj):
+        delete_performances(Performance.objects.filter(pk=obj.pk))
+
+
+@admin.register(Play)
+class PlayAdmin(admin.ModelAdmin):
+    search_fields = ("title",)
+
+
+@admin.register(TheatreHall)
+class TheatreHallAdmin(admin.ModelAdmin):
+    search_fields = ("name",)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "task", "status", "priority", "run_at", "attempts")
+    list_filter = ("status", "task")
+    readonly_fields = ("locked_by", "locked_at", "created_at", "finished_at")
+
 
-admin.site.register(Reservation)
-admin.site.register(TheatreHall)
 admin.site.register(Genre)
 admin.site.register(Actor)
-admin.site.register(Play)
-admin.site.register(Performance)
-admin.site.register(Ticket)
@@ -0,0 +1,299 @@
+"""
+Sales analytics rollups.
+
+Three small tables are kept up to date incrementally, so staff reports
+never scan tickets:
+
+- `PerformanceSales`: tickets sold and capacity per performance, for
+  occupancy per play, hall or show day,
+- `DailyPlaySales`: tickets of each play booked per day,
+- `HourlyBookings`: tickets booked per weekday and hour, from
+  `Reservation.created_at`.
+
+A new reservation enqueues an `apply_sales` job in its transaction, with
+`[performance_id, play_id, booked_at, tickets]` deltas; the set-based
+deletions enqueue the negative deltas from `tickets_bulk_deleted`.
+Archiving is not a cancellation and is ignored. The job updates rows
+with `tickets = tickets + n` in a fixed key order, so concurrent jobs do
+not deadlock, and reservations never wait on the hot rows.
+
+`manage.py rebuild_sales_rollups` recomputes everything from the ticket
+and archive tables.
+"""
+
+from collections import Counter
+from datetime import datetime
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, TruncHour
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from theatre_api import reference_cache
+from theatre_api.deletion import tickets_bulk_deleted
+from theatre_api.jobs import enqueue
+from theatre_api.models import (
+    ArchivedReservation,
+    ArchivedTicket,
+    DailyPlaySales,
+    HourlyBookings,
+    Performance,
+    PerformanceSales,
+    Reservation,
+    TheatreHall,
+    Ticket,
+)
+
+
+def _enqueue_deltas(tickets_per_booking, sign):
+    """Enqueue {(performance_id, booked_at): tickets} as deltas"""
+    deltas = []
+    for (performance_id, booked_at), tickets in tickets_per_booking.items():
+        performance = reference_cache.get_performance(performance_id)
+        if performance is None:
+            continue
+        deltas.append(
+            [
+                performance_id,
+                performance.play_id,
+                booked_at.isoformat(),
+                sign * tickets,
+            ]
+        )
+    if deltas:
+        enqueue("apply_sales", {"deltas": deltas}, priority=-10)
+
+
+def record_reservation(reservation, tickets):
+    """Count the tickets of a new reservation, in its transaction"""
+    _enqueue_deltas(
+        Counter(
+            (ticket.performance_id, reservation.created_at)
+            for ticket in tickets
+        ),
+        1,
+    )
+
+
+def _tickets_deleted(
+    sender, tickets_per_booking=None, archived=False, **kwargs
+):
+    if tickets_per_booking and not archived:
+        _enqueue_deltas(tickets_per_booking, -1)
+
+
+_PERFORMANCE_FIELDS = (
+    "id",
+    "play_id",
+    "theatre_hall_id",
+    "show_time",
+    "theatre_hall__rows",
+    "theatre_hall__seats_in_row",
+)
+
+
+def _show_date(show_time):
+    show_time = Performance._meta.get_field("show_time").to_python(show_time)
+    if timezone.is_naive(show_time):
+        # Stored in the default timezone, as the model field does
+        show_time = timezone.make_aware(show_time)
+    return timezone.localdate(show_time)
+
+
+def _sales_fields(performance) -> dict:
+    """`PerformanceSales` fields of a `_PERFORMANCE_FIELDS` values row"""
+    return {
+        "play_id": performance["play_id"],
+        "theatre_hall_id": performance["theatre_hall_id"],
+        "show_date": _show_date(performance["show_time"]),
+        "capacity": performance["theatre_hall__rows"]
+        * performance["theatre_hall__seats_in_row"],
+    }
+
+
+def _add(model, keys, tickets, defaults=None):
+    rows = model.objects.filter(**keys)
+    if rows.update(tickets=F("tickets") + tickets):
+        return
+    if defaults is None:
+        defaults = {}
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, **defaults, tickets=tickets)
+    except IntegrityError:
+        # Created by a concurrent job meanwhile
+        rows.update(tickets=F("tickets") + tickets)
+
+
+def apply_sales(deltas):
+    performances = Counter()
+    days = Counter()
+    hours = Counter()
+    for performance_id, play_id, booked_at, tickets in deltas:
+        booked_at = timezone.localtime(datetime.fromisoformat(booked_at))
+        performances[performance_id] += tickets
+        days[play_id, booked_at.date()] += tickets
+        hours[booked_at.weekday(), booked_at.hour] += tickets
+
+    with transaction.atomic():
+        for performance_id, tickets in sorted(performances.items()):
+            if PerformanceSales.objects.filter(
+                performance_id=performance_id
+            ).update(tickets=F("tickets") + tickets):
+                continue
+            # Sold before the rollups existed, or cancelled meanwhile
+            performance = (
+                Performance.objects.filter(pk=performance_id)
+                .values(*_PERFORMANCE_FIELDS)
+                .first()
+            )
+            if performance is not None:
+                _add(
+                    PerformanceSales,
+                    {"performance_id": performance_id},
+                    tickets,
+                    _sales_fields(performance),
+                )
+        for (play_id, date), tickets in sorted(days.items()):
+            _add(DailyPlaySales, {"play_id": play_id, "date": date}, tickets)
+        for (weekday, hour), tickets in sorted(hours.items()):
+            _add(HourlyBookings, {"weekday": weekday, "hour": hour}, tickets)
+
+
+def _performance_saved(sender, instance, created, **kwargs):
+    hall = reference_cache.get_hall(instance.theatre_hall_id)
+    fields = {
+        "play_id": instance.play_id,
+        "theatre_hall_id": instance.theatre_hall_id,
+        "show_date": _show_date(instance.show_time),
+        "capacity": (hall or instance.theatre_hall).capacity,
+    }
+    if created:
+        PerformanceSales.objects.create(performance_id=instance.pk, **fields)
+    else:
+        # Rescheduled, or moved to another hall or play
+        PerformanceSales.objects.filter(performance_id=instance.pk).update(
+            **fields
+        )
+
+
+def _performance_deleted(sender, instance, **kwargs):
+    PerformanceSales.objects.filter(performance_id=instance.pk).delete()
+
+
+def _hall_saved(sender, instance, created, **kwargs):
+    if not created:
+        PerformanceSales.objects.filter(theatre_hall_id=instance.pk).update(
+            capacity=instance.capacity
+        )
+
+
+def connect_signals():
+    tickets_bulk_deleted.connect(
+        _tickets_deleted, sender=Ticket, dispatch_uid="analytics_tickets"
+    )
+    post_save.connect(
+        _performance_saved,
+        sender=Performance,
+        dispatch_uid="analytics_performance",
+    )
+    post_delete.connect(
+        _performance_deleted,
+        sender=Performance,
+        dispatch_uid="analytics_performance",
+    )
+    post_save.connect(
+        _hall_saved, sender=TheatreHall, dispatch_uid="analytics_hall"
+    )
+
+
+def _sold_tickets():
+    """(performance_id, booked hour, tickets) of live and archived tickets"""
+    live = (
+        Ticket.objects.annotate(booked_at=TruncHour("reservation__created_at"))
+        .order_by()
+        .values("performance_id", "booked_at")
+        .annotate(tickets=Count("pk"))
+        .values_list("performance_id", "booked_at", "tickets")
+    )
+    yield from live.iterator()
+
+    # The reservation of an archived ticket may itself be archived or not
+    created_at = Coalesce(
+        Subquery(
+            Reservation.objects.filter(pk=OuterRef("reservation_id")).values(
+                "created_at"
+            )
+        ),
+        Subquery(
+            ArchivedReservation.objects.filter(
+                pk=OuterRef("reservation_id")
+            ).values("created_at")
+        ),
+    )
+    archived = (
+        ArchivedTicket.objects.annotate(booked_at=TruncHour(created_at))
+        .filter(booked_at__isnull=False)
+        .order_by()
+        .values("performance_id", "booked_at")
+        .annotate(tickets=Count("pk"))
+        .values_list("performance_id", "booked_at", "tickets")
+    )
+    yield from archived.iterator()
+
+
+def rebuild_rollups() -> dict:
+    """
+    Recompute all rollups, return their row counts. Tickets archived to
+    files are not counted. `apply_sales` jobs queued before the rebuild
+    and run after it are counted twice: drain the queue first.
+    """
+    performances = {
+        performance["id"]: performance
+        for performance in Performance.objects.values(*_PERFORMANCE_FIELDS)
+    }
+    sold = Counter()
+    days = Counter()
+    hours = Counter()
+    for performance_id, booked_at, tickets in _sold_tickets():
+        performance = performances.get(performance_id)
+        if performance is None:
+            continue
+        booked_at = timezone.localtime(booked_at)
+        sold[performance_id] += tickets
+        days[performance["play_id"], booked_at.date()] += tickets
+        hours[booked_at.weekday(), booked_at.hour] += tickets
+
+    with transaction.atomic():
+        for model in (PerformanceSales, DailyPlaySales, HourlyBookings):
+            model.objects.all().delete()
+        PerformanceSales.objects.bulk_create(
+            [
+                PerformanceSales(
+                    performance_id=performance_id,
+                    tickets=sold[performance_id],
+                    **_sales_fields(performance),
+                )
+                for performance_id, performance in performances.items()
+            ],
+            batch_size=1000,
+        )
+        DailyPlaySales.objects.bulk_create(
+            [
+                DailyPlaySales(play_id=play_id, date=date, tickets=tickets)
+                for (play_id, date), tickets in days.items()
+            ],
+            batch_size=1000,
+        )
+        HourlyBookings.objects.bulk_create(
+            [
+                HourlyBookings(weekday=weekday, hour=hour, tickets=tickets)
+                for (weekday, hour), tickets in hours.items()
+            ]
+        )
+    return {
+        "performances": len(performances),
+        "days": len(days),
+        "hours": len(hours),
+    }
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class TheatreApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "theatre_api"
+
+    def ready(self):
+        from theatre_api import analytics, catalog, deletion, reference_cache
+        from theatre_api import checks  # noqa: F401
+
+        reference_cache.connect_signals()
+        analytics.connect_signals()
+        catalog.connect_signals()
+        deletion.connect_signals()
@@ -0,0 +1,249 @@
+"""
+Static snapshots of the public catalog.
+
+Plays with their genres and actors, theatre halls and upcoming
+performances with their availability are rendered to JSON files, each
+also gzip and brotli compressed, under
+`CATALOG_DIR/<version>/<name>.json[.gz|.br]`. The version is a hash of
+the content: unchanged catalogs keep their version, and a new one is
+written next to the old before `CATALOG_DIR/current.json` (and the
+`current` symlink, for a front proxy with `gzip_static`) switches to
+it, so readers never see a half-written snapshot.
+
+Poster URLs are absolute, built on `CATALOG_BASE_URL` since there is no
+request to build them on.
+
+Saving or deleting catalog rows schedules a `build_catalog` job
+`CATALOG_REBUILD_DELAY` seconds later, so a burst of admin edits builds
+once. Every build schedules the next one within `CATALOG_MAX_AGE`
+seconds, which bounds how stale the availability counts get; a new
+build job replaces the finished ones, so they do not pile up.
+`catalog_view` serves the files with strong ETags without touching the
+ORM; `manage.py build_catalog` builds on demand.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from datetime import timedelta
+from urllib.parse import urljoin
+
+import brotli
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Least
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from theatre_api.jobs import enqueue
+from theatre_api.models import (
+    Actor,
+    Genre,
+    Job,
+    Performance,
+    Play,
+    TheatreHall,
+)
+from theatre_api.serializers import (
+    PerformanceListSerializer,
+    PlayListSerializer,
+    TheatreHallSerializer,
+)
+
+CURRENT = "current.json"
+
+# Encodings in order of preference: Content-Encoding, file suffix
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+class _BaseUrlRequest:
+    """Stands for the request serializers build absolute URLs with"""
+
+    def build_absolute_uri(self, location):
+        return urljoin(settings.CATALOG_BASE_URL, location)
+
+
+def _context() -> dict:
+    return {"request": _BaseUrlRequest()}
+
+
+def _plays():
+    plays = Play.objects.prefetch_related("genres", "actors").order_by("pk")
+    return PlayListSerializer(plays, many=True, context=_context()).data
+
+
+def _theatre_halls():
+    halls = TheatreHall.objects.order_by("pk")
+    return TheatreHallSerializer(halls, many=True, context=_context()).data
+
+
+def _performances():
+    performances = (
+        Performance.objects.filter(show_time__gte=timezone.now())
+        .annotate(
+            tickets_available=(
+                F("theatre_hall__rows") * F("theatre_hall__seats_in_row")
+                - Count("tickets")
+            )
+        )
+        .order_by("show_time", "pk")
+    )
+    return PerformanceListSerializer(
+        performances, many=True, context=_context()
+    ).data
+
+
+SNAPSHOTS = {
+    "plays": _plays,
+    "theatre_halls": _theatre_halls,
+    "performances": _performances,
+}
+
+
+def _write(path, data):
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+def _replace_symlink(target, link):
+    tmp = f"{link}.{uuid.uuid4().hex}"
+    try:
+        os.symlink(target, tmp)
+    except OSError:
+        # No symlinks on this platform, current.json is enough
+        return
+    os.replace(tmp, link)
+
+
+def _prune(keep):
+    versions = sorted(
+        (
+            entry
+            for entry in os.scandir(settings.CATALOG_DIR)
+            if entry.is_dir(follow_symlinks=False)
+            and not entry.name.startswith(".")
+        ),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True,
+    )
+    for entry in versions[settings.CATALOG_KEEP_VERSIONS :]:
+        if entry.name != keep:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def build_catalog() -> dict:
+    """Render all snapshots, switch to them and return the new manifest"""
+    bodies = {
+        name: JSONRenderer().render(render())
+        for name, render in SNAPSHOTS.items()
+    }
+    etags = {
+        name: hashlib.sha256(body).hexdigest()[:32]
+        for name, body in bodies.items()
+    }
+    version = hashlib.sha256(
+        json.dumps(etags, sort_keys=True).encode()
+    ).hexdigest()[:16]
+
+    os.makedirs(settings.CATALOG_DIR, exist_ok=True)
+    directory = os.path.join(settings.CATALOG_DIR, version)
+    if not os.path.isdir(directory):
+        tmp = os.path.join(settings.CATALOG_DIR, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp)
+        for name, body in bodies.items():
+            _write(os.path.join(tmp, f"{name}.json"), body)
+            _write(
+                os.path.join(tmp, f"{name}.json.gz"),
+                gzip.compress(body, compresslevel=9, mtime=0),
+            )
+            _write(
+                os.path.join(tmp, f"{name}.json.br"),
+                brotli.compress(body, quality=11),
+            )
+        os.replace(tmp, directory)
+    # Kept by the pruning below even when an older version is reused
+    os.utime(directory)
+
+    manifest = {
+        "version": version,
+        "built_at": timezone.now().isoformat(),
+        "etags": etags,
+    }
+    current = os.path.join(settings.CATALOG_DIR, CURRENT)
+    tmp = f"{current}.{uuid.uuid4().hex}"
+    _write(tmp, json.dumps(manifest).encode())
+    os.replace(tmp, current)
+    _replace_symlink(version, os.path.join(settings.CATALOG_DIR, "current"))
+    _prune(keep=version)
+    return manifest
+
+
+_current = {"mtime": None, "manifest": None}
+
+
+def current_manifest() -> dict | None:
+    """Manifest of the served snapshot, re-read when the file changes"""
+    path = os.path.join(settings.CATALOG_DIR, CURRENT)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if mtime != _current["mtime"]:
+        with open(path) as file:
+            _current["manifest"] = json.load(file)
+        _current["mtime"] = mtime
+    return _current["manifest"]
+
+
+def snapshot_file(manifest, name, accept_encoding) -> tuple:
+    """(path, Content-Encoding or None, ETag) of the best encoding"""
+    base = os.path.join(
+        settings.CATALOG_DIR, manifest["version"], f"{name}.json"
+    )
+    etag = manifest["etags"][name]
+    accepted = {
+        coding.split(";")[0].strip() for coding in accept_encoding.split(",")
+    }
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted:
+            return base + suffix, encoding, f'"{etag}{suffix}"'
+    return base, None, f'"{etag}"'
+
+
+def schedule_build(delay):
+    """Have a `build_catalog` job run within `delay` seconds"""
+    run_at = timezone.now() + timedelta(seconds=delay)
+    builds = Job.objects.filter(task="build_catalog")
+    if not builds.filter(status=Job.QUEUED).update(
+        run_at=Least(F("run_at"), run_at)
+    ):
+        # Replaces the finished builds, every one schedules the next
+        builds.filter(status=Job.DONE).delete()
+        enqueue("build_catalog", run_at=run_at, priority=-5)
+
+
+def _catalog_changed(sender, **kwargs):
+    transaction.on_commit(
+        lambda: schedule_build(settings.CATALOG_REBUILD_DELAY)
+    )
+
+
+def connect_signals():
+    for model in (Play, Genre, Actor, TheatreHall, Performance):
+        for signal in (post_save, post_delete):
+            signal.connect(
+                _catalog_changed,
+                sender=model,
+                dispatch_uid=f"catalog_{model.__name__}",
+            )
+    for through in (Play.genres.through, Play.actors.through):
+        m2m_changed.connect(
+            _catalog_changed,
+            sender=through,
+            dispatch_uid=f"catalog_{through.__name__}",
+        )
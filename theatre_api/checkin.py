@@ -0,0 +1,173 @@
+"""
+Entrance check-in.
+
+Door staff post scanned QR tokens (see `etickets.ticket_token`) in
+batches. Tokens are verified by their signature alone. Each process
+keeps, per performance, the set of valid ticket ids and of scanned ones,
+loaded from the database once and refreshed every
+`CHECKIN_REFRESH_INTERVAL` seconds to pick up new sales, refunds and
+scans recorded by other processes; `cache.add` lets the first scan win
+between processes, which only holds with a cache shared by all of them
+(`CACHE_URL`, enforced by the `theatre_api.E001` deploy check). Admitted
+scans are written to `CheckIn` in bulk by the `record_check_ins`
+background job.
+"""
+
+import threading
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.http import Http404
+from django.utils import timezone
+
+from theatre_api.etickets import read_ticket_token
+from theatre_api.jobs import enqueue
+from theatre_api.models import CheckIn, Performance, Ticket
+
+ADMITTED = "admitted"
+ALREADY_SCANNED = "already_scanned"
+INVALID = "invalid"
+UNKNOWN_TICKET = "unknown_ticket"
+WRONG_PERFORMANCE = "wrong_performance"
+
+# Refresh at most this often when a batch has tickets we don't know yet
+_MISS_REFRESH_INTERVAL = 1.0
+
+
+class _Gate:
+    def __init__(self, performance_id):
+        self.performance_id = performance_id
+        self.valid = frozenset()
+        self.scanned = set()
+        self.loaded_at = None
+        self._lock = threading.Lock()
+
+    def age(self) -> float:
+        return time.monotonic() - self.loaded_at
+
+    def refresh(self):
+        valid = frozenset(
+            Ticket.objects.filter(
+                performance_id=self.performance_id
+            ).values_list("pk", flat=True)
+        )
+        scanned = CheckIn.objects.filter(
+            performance_id=self.performance_id
+        ).values_list("ticket_id", flat=True)
+        with self._lock:
+            self.valid = valid
+            # Keep local scans whose check-in job has not run yet
+            self.scanned.update(scanned)
+            self.loaded_at = time.monotonic()
+
+    def claim(self, ticket_id) -> bool:
+        with self._lock:
+            if ticket_id in self.scanned:
+                return False
+            self.scanned.add(ticket_id)
+        return cache.add(
+            f"checkin:{self.performance_id}:{ticket_id}",
+            1,
+            timeout=settings.CHECKIN_CACHE_TTL,
+        )
+
+
+_gates = {}
+_gates_lock = threading.Lock()
+
+
+def _get_gate(performance_id) -> _Gate:
+    gate = _gates.get(performance_id)
+    if gate is None:
+        # Loaded without the lock, not to hold up other performances;
+        # the first gate stored wins a race
+        if not Performance.objects.filter(pk=performance_id).exists():
+            raise Http404("No Performance matches the given query.")
+        gate = _Gate(performance_id)
+        gate.refresh()
+        with _gates_lock:
+            gate = _gates.setdefault(performance_id, gate)
+    if gate.age() > settings.CHECKIN_REFRESH_INTERVAL:
+        gate.refresh()
+    return gate
+
+
+def reset_gates():
+    with _gates_lock:
+        _gates.clear()
+
+
+def scan_tickets(performance_id, tokens, user, entrance="") -> list:
+    """
+    Check in a batch of ticket tokens for a performance, return
+    `{"ticket": id or None, "result": ...}` for each in order.
+    """
+    gate = _get_gate(performance_id)
+    scans = []
+    for token in tokens:
+        try:
+            scans.append(read_ticket_token(token))
+        except signing.BadSignature:
+            scans.append((None, None))
+
+    if (
+        any(
+            ticket_id not in gate.valid
+            for token_performance_id, ticket_id in scans
+            if token_performance_id == performance_id
+        )
+        and gate.age() > _MISS_REFRESH_INTERVAL
+    ):
+        gate.refresh()
+
+    results = []
+    admitted = []
+    for token_performance_id, ticket_id in scans:
+        if ticket_id is None:
+            result = INVALID
+        elif token_performance_id != performance_id:
+            result = WRONG_PERFORMANCE
+        elif ticket_id not in gate.valid:
+            result = UNKNOWN_TICKET
+        elif not gate.claim(ticket_id):
+            result = ALREADY_SCANNED
+        else:
+            result = ADMITTED
+            admitted.append(ticket_id)
+        results.append({"ticket": ticket_id, "result": result})
+
+    if admitted:
+        enqueue(
+            "record_check_ins",
+            {
+                "performance_id": performance_id,
+                "ticket_ids": admitted,
+                "scanned_at": timezone.now().isoformat(),
+                "scanned_by": user.pk,
+                "entrance": entrance,
+            },
+            priority=10,
+        )
+    return results
+
+
+def record_check_ins(
+    performance_id, ticket_ids, scanned_at, scanned_by, entrance
+):
+    scanned_at = datetime.fromisoformat(scanned_at)
+    CheckIn.objects.bulk_create(
+        [
+            CheckIn(
+                ticket_id=ticket_id,
+                performance_id=performance_id,
+                scanned_at=scanned_at,
+                scanned_by_id=scanned_by,
+                entrance=entrance,
+            )
+            for ticket_id in ticket_ids
+        ],
+        ignore_conflicts=True,
+    )
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Waiting rooms, check-in and the reference cache need a shared cache"""
+    if settings.CACHE_SHARED:
+        return []
+    return [
+        Error(
+            "CACHE_URL is a per-process cache.",
+            hint="Set CACHE_URL to a redis://, memcached:// or db:// cache "
+            "shared by all workers: waiting room admissions, check-in "
+            "deduplication and reference cache invalidation are lost "
+            "between processes otherwise.",
+            id="theatre_api.E001",
+        )
+    ]
@@ -0,0 +1,201 @@
+"""
+Set-based deletion of reservations and performances.
+
+Django's deletion Collector loads every related Ticket into memory as
+soon as anything listens to Ticket delete signals. These helpers delete
+tickets with plain `DELETE ... WHERE id IN (...)` statements in small
+committed chunks instead, then send `tickets_bulk_deleted` so counters
+and caches derived from tickets can be updated in bulk.
+
+Deletes that still go through the Collector (`instance.delete()` of a
+user, a play or a hall) reach tickets through cascades: `pre_delete`
+receivers of performances and users hand them to these helpers first,
+so the change log and sales rollups stay right.
+"""
+
+from collections import Counter
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models.signals import pre_delete
+from django.dispatch import Signal
+
+from theatre_api import reference_cache
+from theatre_api.models import (
+    Performance,
+    PerformanceSales,
+    Reservation,
+    Ticket,
+    TicketChange,
+)
+
+DELETE_CHUNK_SIZE = 1000
+
+# Sent with `tickets_per_performance`: {performance_id: deleted_tickets}
+# and `tickets_per_booking`: {(performance_id, reservation created_at):
+# deleted_tickets}, or `archived=True` by archive_past_performances.
+tickets_bulk_deleted = Signal()
+
+
+def raw_delete(queryset) -> int:
+    """Single DELETE statement, no Collector, signals or cascades"""
+    return queryset._raw_delete(router.db_for_write(queryset.model))
+
+
+def _delete_tickets(tickets, chunk_size) -> int:
+    deleted = Counter()
+    bookings = Counter()
+    while True:
+        chunk = list(
+            tickets.order_by("pk").values_list(
+                "pk",
+                "performance_id",
+                "row",
+                "seat",
+                "reservation__created_at",
+            )[:chunk_size]
+        )
+        if not chunk:
+            break
+        with transaction.atomic():
+            raw_delete(Ticket.objects.filter(pk__in=[row[0] for row in chunk]))
+            TicketChange.objects.bulk_create(
+                [
+                    TicketChange(
+                        ticket_id=pk,
+                        performance_id=performance_id,
+                        row=row,
+                        seat=seat,
+                        removed=True,
+                    )
+                    for pk, performance_id, row, seat, _ in chunk
+                ]
+            )
+        deleted.update(row[1] for row in chunk)
+        bookings.update((row[1], row[4]) for row in chunk)
+
+    if deleted:
+        tickets_bulk_deleted.send(
+            sender=Ticket,
+            tickets_per_performance=dict(deleted),
+            tickets_per_booking=dict(bookings),
+        )
+    return sum(deleted.values())
+
+
+def _delete_by_pk(queryset, chunk_size) -> int:
+    deleted = 0
+    while True:
+        ids = list(
+            queryset.order_by("pk").values_list("pk", flat=True)[:chunk_size]
+        )
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            deleted += raw_delete(queryset.model.objects.filter(pk__in=ids))
+
+
+def delete_tickets(tickets, chunk_size=DELETE_CHUNK_SIZE) -> dict:
+    """Delete tickets, keeping their reservations. Return deleted count"""
+    ticket_ids = list(tickets.values_list("pk", flat=True))
+    return {
+        "tickets": _delete_tickets(
+            Ticket.objects.filter(pk__in=ticket_ids), chunk_size
+        )
+    }
+
+
+def delete_reservations(reservations, chunk_size=DELETE_CHUNK_SIZE) -> dict:
+    """Delete reservations and their tickets, return deleted row counts"""
+    reservation_ids = list(reservations.values_list("pk", flat=True))
+    tickets = _delete_tickets(
+        Ticket.objects.filter(reservation_id__in=reservation_ids), chunk_size
+    )
+    return {
+        "tickets": tickets,
+        "reservations": _delete_by_pk(
+            Reservation.objects.filter(pk__in=reservation_ids), chunk_size
+        ),
+    }
+
+
+def _reservation_ids(tickets) -> set:
+    return set(
+        Reservation.objects.filter(tickets__in=tickets)
+        .values_list("pk", flat=True)
+        .distinct()
+    )
+
+
+def _delete_performance_data(performance_ids, reservation_ids, chunk_size):
+    """Delete reservations left empty and rows of deleted performances"""
+    reservations = _delete_by_pk(
+        Reservation.objects.filter(
+            pk__in=reservation_ids, tickets__isnull=True
+        ),
+        chunk_size,
+    )
+    # The change log and sales rollup only cover existing performances
+    for model in (TicketChange, PerformanceSales):
+        _delete_by_pk(
+            model.objects.filter(performance_id__in=performance_ids),
+            chunk_size,
+        )
+    return reservations
+
+
+def delete_performances(performances, chunk_size=DELETE_CHUNK_SIZE) -> dict:
+    """
+    Delete performances with their tickets, and the reservations that
+    are left without any ticket. Return deleted row counts.
+    """
+    performance_ids = list(performances.values_list("pk", flat=True))
+    tickets = Ticket.objects.filter(performance_id__in=performance_ids)
+    reservation_ids = _reservation_ids(tickets)
+    # Most tickets go in committed chunks, without blocking sales
+    deleted_tickets = _delete_tickets(tickets, chunk_size)
+    with transaction.atomic():
+        # Tickets sold meanwhile are deleted under the lock, new ones
+        # wait for it and then fail their foreign key check
+        list(
+            Performance.objects.filter(pk__in=performance_ids)
+            .select_for_update()
+            .values_list("pk", flat=True)
+        )
+        reservation_ids |= _reservation_ids(tickets)
+        deleted_tickets += _delete_tickets(tickets, chunk_size)
+        deleted_performances = raw_delete(
+            Performance.objects.filter(pk__in=performance_ids)
+        )
+    reference_cache.invalidate("performance")
+    return {
+        "tickets": deleted_tickets,
+        "reservations": _delete_performance_data(
+            performance_ids, reservation_ids, chunk_size
+        ),
+        "performances": deleted_performances,
+    }
+
+
+def _performance_pre_delete(sender, instance, **kwargs):
+    tickets = Ticket.objects.filter(performance_id=instance.pk)
+    reservation_ids = _reservation_ids(tickets)
+    _delete_tickets(tickets, DELETE_CHUNK_SIZE)
+    _delete_performance_data([instance.pk], reservation_ids, DELETE_CHUNK_SIZE)
+
+
+def _user_pre_delete(sender, instance, **kwargs):
+    delete_reservations(Reservation.objects.filter(user_id=instance.pk))
+
+
+def connect_signals():
+    pre_delete.connect(
+        _performance_pre_delete,
+        sender=Performance,
+        dispatch_uid="deletion_performance",
+    )
+    pre_delete.connect(
+        _user_pre_delete,
+        sender=settings.AUTH_USER_MODEL,
+        dispatch_uid="deletion_user",
+    )
@@ -0,0 +1,240 @@
+"""
+Printable e-tickets with a signed QR code per ticket.
+
+A reservation renders to a PDF (one page per ticket) or a PNG (tickets
+stacked). The blank ticket template and each performance header are
+drawn once per process and pasted onto every ticket. Files are cached
+in `ETICKET_DIR` under a hash of everything drawn on them, so changed
+tickets get a new file while unchanged ones are served from disk; the
+directory only holds derived data and can be emptied at any time.
+`prune_etickets` deletes files unused for `ETICKET_MAX_AGE` seconds.
+Whole performances are rendered ahead by the
+`render_performance_etickets` background job. Pillow and qrcode are
+only imported when something is drawn, not at startup.
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from theatre_api.models import Reservation, Ticket
+from theatre_api.reference_cache import get_hall_or_404, get_play_or_404
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+FORMATS = {"pdf": "application/pdf", "png": "image/png"}
+
+# Bump when the layout changes so cached files are rendered again
+RENDER_VERSION = 1
+
+_TOKEN_SALT = "theatre_api.ticket"
+_WIDTH, _HEIGHT = 800, 300
+_STUB_X = 560
+_QR_SIZE = 220
+
+
+def ticket_token(ticket) -> str:
+    """Signed `<performance id>.<ticket id>`, checked without the DB"""
+    return signing.Signer(salt=_TOKEN_SALT).sign(
+        f"{ticket.performance_id}.{ticket.pk}"
+    )
+
+
+def read_ticket_token(token) -> tuple:
+    """
+    (performance id, ticket id) of a ticket token,
+    raise `signing.BadSignature` if it is forged or malformed.
+    """
+    value = signing.Signer(salt=_TOKEN_SALT).unsign(token)
+    try:
+        performance_id, ticket_id = map(int, value.split("."))
+    except ValueError:
+        raise signing.BadSignature("Malformed ticket token")
+    return performance_id, ticket_id
+
+
+@lru_cache(maxsize=8)
+def _font(size):
+    from PIL import ImageFont
+
+    return ImageFont.load_default(size=size)
+
+
+@lru_cache(maxsize=1)
+def _template() -> "Image.Image":
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (_WIDTH, _HEIGHT), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((4, 4, _WIDTH - 5, _HEIGHT - 5), outline="black", width=3)
+    for y in range(10, _HEIGHT - 10, 12):
+        draw.line((_STUB_X, y, _STUB_X, y + 6), fill="gray", width=2)
+    draw.text(
+        (24, _HEIGHT - 40), "THEATRE TICKET", fill="gray", font=_font(18)
+    )
+    return image
+
+
+@lru_cache(maxsize=256)
+def _header(title, hall, show_time) -> "Image.Image":
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (_STUB_X - 30, 120), "white")
+    draw = ImageDraw.Draw(image)
+    draw.text((0, 0), title, fill="black", font=_font(32))
+    draw.text((0, 50), hall, fill="black", font=_font(22))
+    draw.text((0, 84), show_time, fill="black", font=_font(22))
+    return image
+
+
+def _header_args(performance) -> tuple:
+    show_time = timezone.localtime(performance.show_time)
+    return (
+        get_play_or_404(performance.play_id).title,
+        get_hall_or_404(performance.theatre_hall_id).name,
+        f"{show_time:%A, %d %B %Y, %H:%M}",
+    )
+
+
+def _render_ticket(ticket, token) -> "Image.Image":
+    import qrcode
+    from PIL import Image, ImageDraw
+
+    image = _template().copy()
+    image.paste(_header(*_header_args(ticket.performance)), (24, 24))
+
+    draw = ImageDraw.Draw(image)
+    draw.text(
+        (24, 160),
+        f"Row {ticket.row}   Seat {ticket.seat}",
+        fill="black",
+        font=_font(30),
+    )
+    draw.text(
+        (24, 205),
+        f"Reservation #{ticket.reservation_id}   Ticket #{ticket.pk}",
+        fill="gray",
+        font=_font(18),
+    )
+
+    code = qrcode.QRCode(
+        error_correction=qrcode.constants.ERROR_CORRECT_M, border=1
+    )
+    code.add_data(token)
+    qr_image = code.make_image().get_image().convert("RGB")
+    image.paste(
+        qr_image.resize((_QR_SIZE, _QR_SIZE), Image.NEAREST),
+        (_STUB_X + 10, (_HEIGHT - _QR_SIZE) // 2),
+    )
+    return image
+
+
+def _file_name(reservation, tickets, tokens, file_format) -> str:
+    content = [RENDER_VERSION, file_format, reservation.pk]
+    for ticket, token in zip(tickets, tokens):
+        content.append(
+            [token, ticket.row, ticket.seat, _header_args(ticket.performance)]
+        )
+    digest = hashlib.sha256(json.dumps(content).encode()).hexdigest()
+    return f"{digest[:40]}.{file_format}"
+
+
+def _save(images, path, file_format):
+    from PIL import Image
+
+    # Unique temporary name, several workers may render the same file
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    if file_format == "pdf":
+        images[0].save(
+            tmp_path,
+            "PDF",
+            save_all=True,
+            append_images=images[1:],
+            resolution=150,
+        )
+    else:
+        sheet = Image.new("RGB", (_WIDTH, _HEIGHT * len(images)), "white")
+        for index, image in enumerate(images):
+            sheet.paste(image, (0, index * _HEIGHT))
+        sheet.save(tmp_path, "PNG", optimize=True)
+    os.replace(tmp_path, path)
+
+
+def render_reservation(reservation, file_format="pdf"):
+    """
+    Path of the e-ticket file of a reservation, rendered if not cached.
+    Expects tickets prefetched with their performance.
+    """
+    tickets = sorted(
+        reservation.tickets.all(),
+        key=lambda ticket: (ticket.performance_id, ticket.row, ticket.seat),
+    )
+    if not tickets:
+        return None
+
+    tokens = [ticket_token(ticket) for ticket in tickets]
+    path = os.path.join(
+        settings.ETICKET_DIR,
+        _file_name(reservation, tickets, tokens, file_format),
+    )
+    try:
+        # Mark as used, see prune_etickets
+        os.utime(path)
+    except FileNotFoundError:
+        os.makedirs(settings.ETICKET_DIR, exist_ok=True)
+        images = [
+            _render_ticket(ticket, token)
+            for ticket, token in zip(tickets, tokens)
+        ]
+        _save(images, path, file_format)
+    return path
+
+
+def render_performance_etickets(performance_id, formats=("pdf",)) -> int:
+    """Render every reservation with tickets for a performance"""
+    reservations = (
+        Reservation.objects.filter(tickets__performance_id=performance_id)
+        .distinct()
+        .order_by("pk")
+        .prefetch_related(
+            Prefetch(
+                "tickets",
+                queryset=Ticket.objects.select_related("performance"),
+            )
+        )
+    )
+    rendered = 0
+    for reservation in reservations.iterator(chunk_size=200):
+        for file_format in formats:
+            render_reservation(reservation, file_format)
+        rendered += 1
+    return rendered
+
+
+def prune_etickets() -> int:
+    """Delete files not rendered or served for `ETICKET_MAX_AGE` seconds"""
+    if not os.path.isdir(settings.ETICKET_DIR):
+        return 0
+    expired = time.time() - settings.ETICKET_MAX_AGE
+    deleted = 0
+    for entry in os.scandir(settings.ETICKET_DIR):
+        if (
+            entry.is_file(follow_symlinks=False)
+            and entry.stat().st_mtime < expired
+        ):
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:  # pruned by another process
+                continue
+            deleted += 1
+    return deleted
@@ -0,0 +1,158 @@
+"""
+Sparse fieldsets: `?fields=id,title` or `?exclude=description` on read
+endpoints.
+
+Dropped fields are removed from the serializer, and from the queryset
+as well: prefetch and select_related lookups only serve kept fields,
+and `.only()` limits the columns to those the kept fields read. A
+field's columns and relations come from its `source`; fields whose
+source is not a model field or an annotation (method fields,
+properties) declare theirs in the serializer's `Meta.field_sources`,
+otherwise the queryset is left untouched.
+"""
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework.exceptions import ValidationError
+from rest_framework.relations import RelatedField
+from rest_framework.serializers import ListSerializer
+
+FIELDS_PARAM = "fields"
+EXCLUDE_PARAM = "exclude"
+
+
+def _split(value) -> list:
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def _requirements(serializer, field_names, queryset):
+    """
+    Columns and relations the fields read, `None` if some field's
+    requirements are unknown.
+    """
+    model = queryset.model
+    field_sources = getattr(serializer.Meta, "field_sources", {})
+    columns = {model._meta.pk.attname}
+    relations = set()
+
+    for name in field_names:
+        field = serializer.fields[name]
+        for source in field_sources.get(name, [field.source]):
+            if source == "*":
+                return None
+            parts = source.split(".")
+            try:
+                model_field = model._meta.get_field(parts[0])
+            except FieldDoesNotExist:
+                if parts[0] in queryset.query.annotations:
+                    continue
+                return None
+
+            if not model_field.is_relation:
+                columns.add(model_field.attname)
+            elif model_field.many_to_many or model_field.one_to_many:
+                relations.add(model_field.name)
+            else:
+                columns.add(model_field.attname)
+                pk_only = (
+                    len(parts) == 1
+                    and isinstance(field, RelatedField)
+                    and field.use_pk_only_optimization()
+                )
+                if parts[0] != model_field.attname and not pk_only:
+                    relations.add(model_field.name)
+    return columns, relations
+
+
+def prune_queryset(queryset, serializer, field_names):
+    """Queryset loading only what `field_names` of `serializer` need"""
+    requirements = _requirements(serializer, field_names, queryset)
+    if requirements is None:
+        return queryset
+    columns, relations = requirements
+
+    lookups = [
+        lookup
+        for lookup in queryset._prefetch_related_lookups
+        if (
+            lookup.prefetch_through if isinstance(lookup, Prefetch) else lookup
+        ).split("__")[0]
+        in relations
+    ]
+    queryset = queryset.prefetch_related(None).prefetch_related(*lookups)
+
+    select_related = queryset.query.select_related
+    if select_related is True:
+        return queryset
+    if select_related:
+        kept = {
+            name: nested
+            for name, nested in select_related.items()
+            if name in relations
+        }
+        queryset = queryset.select_related(None)
+        queryset.query.select_related = kept or False
+        columns.update(kept)
+    return queryset.only(*columns)
+
+
+class SparseFieldsetMixin:
+    """
+    `?fields=` and `?exclude=` for the top-level fields of a viewset's
+    read actions, see the module docstring.
+    """
+
+    sparse_fieldset_actions = ("list", "retrieve")
+
+    def sparse_fields(self):
+        """Names of the fields to render, `None` to render them all"""
+        request = getattr(self, "request", None)
+        if (
+            request is None
+            or request.method != "GET"
+            or self.action not in self.sparse_fieldset_actions
+        ):
+            return None
+        fields = request.query_params.get(FIELDS_PARAM)
+        exclude = request.query_params.get(EXCLUDE_PARAM)
+        if not fields and not exclude:
+            return None
+
+        available = list(self.get_serializer_class()().fields)
+        selected = available
+        for param, value in ((FIELDS_PARAM, fields), (EXCLUDE_PARAM, exclude)):
+            if not value:
+                continue
+            names = _split(value)
+            unknown = [name for name in names if name not in available]
+            if unknown:
+                raise ValidationError(
+                    {param: f"Unknown field(s): {', '.join(unknown)}."}
+                )
+            if param == FIELDS_PARAM:
+                selected = [name for name in available if name in names]
+            else:
+                selected = [name for name in selected if name not in names]
+        return selected
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        field_names = self.sparse_fields()
+        if field_names is None:
+            return queryset
+        serializer = self.get_serializer_class()()
+        return prune_queryset(queryset, serializer, field_names)
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        field_names = self.sparse_fields()
+        if field_names is not None:
+            fields = (
+                serializer.child.fields
+                if isinstance(serializer, ListSerializer)
+                else serializer.fields
+            )
+            for name in list(fields):
+                if name not in field_names:
+                    fields.pop(name)
+        return serializer
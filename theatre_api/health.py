@@ -0,0 +1,127 @@
+"""
+Liveness and readiness checks for orchestrator probes.
+
+`/healthz` only tells the process is alive and answers requests: it
+does no I/O, so a slow database never gets healthy replicas restarted.
+`/readyz` runs the deep checks below (database connectivity of every
+alias, pending migrations, the cache backend and media storage) and
+answers 503 when one fails, taking the replica out of rotation.
+
+Each check reports its latency, and feeds the
+`theatre_readiness_check_duration_seconds` histogram, so slow
+dependencies show up before they cause outages. Results are kept per
+process for `READINESS_CACHE_SECONDS`, and concurrent probes wait for
+the running checks instead of starting their own, so frequent probes
+add no load.
+"""
+
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from theatre_api import metrics
+from theatre_core.startup import pending_migrations
+
+
+def _check_database():
+    for alias in connections:
+        with connections[alias].cursor() as cursor:
+            cursor.execute("SELECT 1")
+
+
+def _check_migrations():
+    pending = pending_migrations(connections[DEFAULT_DB_ALIAS])
+    if pending:
+        raise RuntimeError(
+            "Pending migrations: "
+            + ", ".join(f"{label}.{name}" for label, name in pending)
+        )
+
+
+def _check_cache():
+    key = f"readyz:{uuid.uuid4().hex}"
+    cache.set(key, 1, timeout=10)
+    try:
+        if cache.get(key) != 1:
+            raise RuntimeError("Cache did not return the value just set.")
+    finally:
+        cache.delete(key)
+
+
+def _check_storage():
+    name = default_storage.save(
+        f"readyz/{uuid.uuid4().hex}.txt", ContentFile(b"ok")
+    )
+    try:
+        with default_storage.open(name) as file:
+            if file.read() != b"ok":
+                raise RuntimeError("Storage did not return the file written.")
+    finally:
+        default_storage.delete(name)
+
+
+CHECKS = {
+    "database": _check_database,
+    "migrations": _check_migrations,
+    "cache": _check_cache,
+    "storage": _check_storage,
+}
+
+
+def _run(name, check) -> dict:
+    started = time.perf_counter()
+    try:
+        check()
+    except Exception as error:
+        result = {
+            "status": "fail",
+            "error": f"{type(error).__name__}: {error}",
+        }
+        metrics.inc("theatre_readiness_check_failures_total", {"check": name})
+    else:
+        result = {"status": "ok"}
+    duration = time.perf_counter() - started
+    metrics.observe(
+        "theatre_readiness_check_duration_seconds",
+        duration,
+        {"check": name},
+    )
+    result["latency_ms"] = round(duration * 1000, 2)
+    return result
+
+
+def run_checks() -> dict:
+    checks = {name: _run(name, check) for name, check in CHECKS.items()}
+    ready = all(check["status"] == "ok" for check in checks.values())
+    return {"status": "ok" if ready else "fail", "checks": checks}
+
+
+_lock = threading.Lock()
+_last = {"at": None, "report": None}
+
+
+def readiness() -> dict:
+    """Report of `run_checks`, at most `READINESS_CACHE_SECONDS` old"""
+    with _lock:
+        now = time.monotonic()
+        if (
+            _last["at"] is None
+            or now - _last["at"] >= settings.READINESS_CACHE_SECONDS
+        ):
+            _last["report"] = run_checks()
+            _last["at"] = time.monotonic()
+        return dict(
+            _last["report"],
+            age_seconds=round(time.monotonic() - _last["at"], 2),
+        )
+
+
+def reset_readiness():
+    with _lock:
+        _last["at"] = _last["report"] = None
@@ -0,0 +1,100 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from theatre_api.models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def _request_hash(data) -> str:
+    payload = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def prune_idempotency_keys(batch_size=1000) -> int:
+    """Delete keys older than `IDEMPOTENCY_KEY_TTL`, in batches"""
+    cutoff = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    deleted = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(created_at__lt=cutoff).values_list(
+                "id", flat=True
+            )[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
+
+
+class IdempotentCreateMixin:
+    """
+    Make `create` safe to retry with an `Idempotency-Key` header.
+
+    The key row is inserted in the same transaction as the created
+    objects, so a concurrent duplicate blocks on the unique index until
+    the first attempt commits (then replays its response) or rolls back
+    (then runs itself). Failed attempts are not stored.
+    """
+
+    def create(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return super().create(request, *args, **kwargs)
+
+        if not 1 <= len(key) <= 255:
+            raise ValidationError(
+                {IDEMPOTENCY_HEADER: "Must be 1 to 255 characters long."}
+            )
+
+        request_hash = _request_hash(request.data)
+        cutoff = timezone.now() - timedelta(
+            seconds=settings.IDEMPOTENCY_KEY_TTL
+        )
+        IdempotencyKey.objects.filter(
+            user=request.user, key=key, created_at__lt=cutoff
+        ).delete()
+
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(
+                        user=request.user,
+                        key=key,
+                        request_hash=request_hash,
+                        status_code=0,
+                        response_body={},
+                    )
+            except IntegrityError:
+                record = IdempotencyKey.objects.get(user=request.user, key=key)
+                return self._replay(record, request_hash)
+
+            response = super().create(request, *args, **kwargs)
+            record.status_code = response.status_code
+            record.response_body = response.data
+            record.save(update_fields=["status_code", "response_body"])
+            return response
+
+    @staticmethod
+    def _replay(record, request_hash):
+        if record.request_hash != request_hash:
+            return Response(
+                {
+                    "detail": f"{IDEMPOTENCY_HEADER} was already used "
+                    f"with a different request body."
+                },
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        return Response(
+            record.response_body,
+            status=record.status_code,
+            headers={REPLAYED_HEADER: "true"},
+        )
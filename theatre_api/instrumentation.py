@@ -0,0 +1,177 @@
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_current_timings = ContextVar("request_timings", default=None)
+
+_route_stats = {}
+_route_stats_lock = threading.Lock()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestTimings:
+    """SQL, serializer and total timings collected for one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.total_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        """`connection.execute_wrapper` hook counting every query."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.sql_count += 1
+
+    def finish(self):
+        self.total_time = time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        return ", ".join(
+            [
+                f"sql;dur={self.sql_time * 1000:.2f};"
+                f'desc="{self.sql_count} queries"',
+                f"serializer;dur={self.serializer_time * 1000:.2f}",
+                f"total;dur={self.total_time * 1000:.2f}",
+            ]
+        )
+
+
+def get_current_timings():
+    return _current_timings.get()
+
+
+@contextmanager
+def serializer_span():
+    timings = _current_timings.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings.serializer_time += time.perf_counter() - started
+
+
+def _timed(to_representation):
+    def wrapper(*args, **kwargs):
+        with serializer_span():
+            return to_representation(*args, **kwargs)
+
+    return wrapper
+
+
+class SerializerTimingMixin:
+    """
+    Time the top-level `to_representation` of every serializer
+    the view builds, nested serializers are included in that span.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if _current_timings.get() is not None:
+            serializer.to_representation = _timed(serializer.to_representation)
+        return serializer
+
+
+def _route_key(request) -> str:
+    match = getattr(request, "resolver_match", None)
+    route = match.view_name if match else request.path_info
+    return f"{request.method} {route}"
+
+
+def _record_route(key, timings):
+    with _route_stats_lock:
+        stats = _route_stats.setdefault(
+            key,
+            {
+                "requests": 0,
+                "sql_count": 0,
+                "max_sql_count": 0,
+                "sql_time": 0.0,
+                "serializer_time": 0.0,
+                "total_time": 0.0,
+                "max_total_time": 0.0,
+            },
+        )
+        stats["requests"] += 1
+        stats["sql_count"] += timings.sql_count
+        stats["max_sql_count"] = max(stats["max_sql_count"], timings.sql_count)
+        stats["sql_time"] += timings.sql_time
+        stats["serializer_time"] += timings.serializer_time
+        stats["total_time"] += timings.total_time
+        stats["max_total_time"] = max(
+            stats["max_total_time"], timings.total_time
+        )
+
+
+def get_route_stats() -> dict:
+    """Rolling per-route aggregates since process start (or last reset)."""
+    with _route_stats_lock:
+        return {key: dict(stats) for key, stats in _route_stats.items()}
+
+
+def reset_route_stats():
+    with _route_stats_lock:
+        _route_stats.clear()
+
+
+def _check_budget(request, timings):
+    key = _route_key(request)
+    budget = settings.QUERY_BUDGETS.get(key, settings.QUERY_BUDGET_DEFAULT)
+    if budget is None or timings.sql_count <= budget:
+        return
+
+    message = (
+        f"{request.method} {request.path} ran {timings.sql_count} "
+        f"queries, budget for {key} is {budget}"
+    )
+    if settings.QUERY_BUDGET_STRICT:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class QueryTimingMiddleware:
+    """
+    Count SQL queries and time SQL, serializers and the whole request.
+    Results go to the `Server-Timing` header and per-route aggregates,
+    and are checked against `QUERY_BUDGETS`.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.SERVER_TIMING_ENABLED:
+            return self.get_response(request)
+
+        timings = RequestTimings()
+        request.timings = timings
+        token = _current_timings.set(timings)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+                response = self.get_response(request)
+        finally:
+            _current_timings.reset(token)
+
+        timings.finish()
+        response["Server-Timing"] = timings.server_timing()
+        _record_route(_route_key(request), timings)
+        _check_budget(request, timings)
+        return response
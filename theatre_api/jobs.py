@@ -0,0 +1,280 @@
+"""
+Database-backed background jobs, no broker needed.
+
+Jobs are rows of `Job`, enqueued in the caller's transaction so a job
+only becomes visible if the work that scheduled it commits. Workers
+(`manage.py run_worker`) claim due jobs by priority with
+`SELECT ... FOR UPDATE SKIP LOCKED`, so any number of threads and
+processes share the table without waiting on each other. Failed jobs
+are retried with exponential backoff up to `max_attempts`, and jobs of
+a worker that died are claimed again after `JOB_LOCK_TIMEOUT`, or
+marked failed once their attempts are used up.
+Finished jobs are kept for `JOB_RETENTION` seconds, failed ones for
+`JOB_FAILED_RETENTION`, then deleted by `prune_jobs`.
+
+SQLite has no row locks: claims are then guarded by a conditional
+update instead, and a single worker thread is recommended.
+
+Tasks are functions taking the payload as keyword arguments, registered
+with `@task` in an app's `tasks.py`.
+"""
+
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import (
+    OperationalError,
+    close_old_connections,
+    connection,
+    transaction,
+)
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from theatre_api import metrics
+from theatre_api.models import Job
+
+logger = logging.getLogger(__name__)
+
+_tasks = {}
+
+
+def task(func=None, *, name=None):
+    """Register a function as a job task, under its name by default"""
+
+    def register(func):
+        func.task_name = name or func.__name__
+        _tasks[func.task_name] = func
+        return func
+
+    return register(func) if func is not None else register
+
+
+def load_tasks():
+    autodiscover_modules("tasks")
+
+
+def enqueue(
+    task, payload=None, *, priority=0, run_at=None, delay=0, max_attempts=None
+) -> Job:
+    """
+    Schedule `task` (a registered function or its name) to run with
+    `payload` after `run_at` or `delay` seconds, higher priority first.
+    """
+    return Job.objects.create(
+        task=getattr(task, "task_name", task),
+        payload=payload or {},
+        priority=priority,
+        run_at=run_at or timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def claim_jobs(worker_id, limit=1, tasks=None) -> list:
+    """Mark up to `limit` due jobs as running by `worker_id`"""
+    now = timezone.now()
+    stale = Q(
+        status=Job.RUNNING,
+        locked_at__lt=now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT),
+    )
+    # Jobs that keep killing their worker must not be retried forever
+    Job.objects.filter(stale, attempts__gte=F("max_attempts")).update(
+        status=Job.FAILED,
+        last_error="Worker lost, no attempts left",
+        locked_by="",
+        finished_at=now,
+    )
+    due = Job.objects.filter(
+        Q(status=Job.QUEUED, run_at__lte=now)
+        | stale & Q(attempts__lt=F("max_attempts"))
+    )
+    if tasks:
+        due = due.filter(task__in=tasks)
+    due = due.order_by("-priority", "run_at", "pk")
+
+    with transaction.atomic():
+        jobs = list(due.select_for_update(skip_locked=True)[:limit])
+        claim = {
+            "status": Job.RUNNING,
+            "locked_by": worker_id,
+            "locked_at": now,
+        }
+        if connection.features.has_select_for_update_skip_locked:
+            Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                attempts=F("attempts") + 1, **claim
+            )
+        else:
+            # Keep the jobs no other worker claimed since we read them
+            jobs = [
+                job
+                for job in jobs
+                if Job.objects.filter(pk=job.pk, attempts=job.attempts).update(
+                    attempts=job.attempts + 1, **claim
+                )
+            ]
+
+    for job in jobs:
+        job.attempts += 1
+        job.status = Job.RUNNING
+        job.locked_by = worker_id
+        job.locked_at = now
+    return jobs
+
+
+def retry_delay(attempts) -> float:
+    """Exponential backoff with 10% jitter"""
+    delay = min(
+        settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1),
+        settings.JOB_RETRY_BACKOFF_MAX,
+    )
+    return delay * random.uniform(1, 1.1)
+
+
+def run_job(job) -> str:
+    """Run a claimed job and record the outcome: done, retry or failed"""
+    started = time.perf_counter()
+    try:
+        func = _tasks.get(job.task)
+        if func is None:
+            raise LookupError(f"Unknown task {job.task!r}")
+        func(**job.payload)
+    except Exception:
+        logger.exception("Job %s (%s) failed", job.pk, job.task)
+        outcome = "retry" if job.attempts < job.max_attempts else "failed"
+        changes = {"last_error": traceback.format_exc(), "locked_by": ""}
+        if outcome == "retry":
+            changes.update(
+                status=Job.QUEUED,
+                run_at=timezone.now()
+                + timedelta(seconds=retry_delay(job.attempts)),
+            )
+        else:
+            changes.update(status=Job.FAILED, finished_at=timezone.now())
+    else:
+        outcome = "done"
+        changes = {"status": Job.DONE, "finished_at": timezone.now()}
+
+    # Unless the job was reclaimed as stale by another worker meanwhile
+    Job.objects.filter(
+        pk=job.pk, locked_by=job.locked_by, attempts=job.attempts
+    ).update(**changes)
+    metrics.inc("theatre_jobs_total", {"task": job.task, "outcome": outcome})
+    metrics.observe(
+        "theatre_job_duration_seconds",
+        time.perf_counter() - started,
+        {"task": job.task},
+    )
+    return outcome
+
+
+def prune_jobs(batch_size=1000) -> int:
+    """Delete jobs finished longer than their retention ago, in batches"""
+    now = timezone.now()
+    expired = Q(
+        status=Job.DONE,
+        finished_at__lt=now - timedelta(seconds=settings.JOB_RETENTION),
+    ) | Q(
+        status=Job.FAILED,
+        finished_at__lt=now - timedelta(seconds=settings.JOB_FAILED_RETENTION),
+    )
+    deleted = 0
+    while True:
+        ids = list(
+            Job.objects.filter(expired).values_list("id", flat=True)[
+                :batch_size
+            ]
+        )
+        if not ids:
+            return deleted
+        deleted += Job.objects.filter(id__in=ids).delete()[0]
+
+
+class Worker:
+    """Run jobs in `threads` threads until stopped or the queue is empty"""
+
+    def __init__(
+        self,
+        threads=1,
+        batch_size=1,
+        poll_interval=None,
+        tasks=None,
+        name=None,
+    ):
+        self.threads = threads
+        self.batch_size = batch_size
+        self.poll_interval = (
+            settings.JOB_POLL_INTERVAL
+            if poll_interval is None
+            else poll_interval
+        )
+        self.tasks = tasks
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.processed = 0
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        load_tasks()
+
+    def stop(self):
+        self._stopping.set()
+
+    def work(self, worker_id=None, until_empty=False, own_connection=False):
+        """
+        Claim and run jobs in the current thread. With `own_connection`
+        the thread also closes broken or expired database connections,
+        which must not happen inside a caller's transaction.
+        """
+        worker_id = worker_id or self.name
+        while not self._stopping.is_set():
+            if own_connection:
+                close_old_connections()
+            try:
+                jobs = claim_jobs(worker_id, self.batch_size, self.tasks)
+            except OperationalError:
+                logger.exception("Worker %s could not claim jobs", worker_id)
+                self._stopping.wait(self.poll_interval)
+                continue
+            if not jobs:
+                if until_empty:
+                    return
+                self._stopping.wait(self.poll_interval)
+                continue
+            for job in jobs:
+                run_job(job)
+            with self._lock:
+                self.processed += len(jobs)
+
+    def _work_in_thread(self, index, until_empty):
+        try:
+            self.work(f"{self.name}:{index}", until_empty, own_connection=True)
+        finally:
+            connection.close()
+
+    def run(self, until_empty=False):
+        threads = [
+            threading.Thread(
+                target=self._work_in_thread,
+                args=(index, until_empty),
+                name=f"job-worker-{index}",
+                daemon=True,
+            )
+            for index in range(self.threads)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            # Join in short steps so signals reach the main thread
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(0.5)
+        finally:
+            self.stop()
+            for thread in threads:
+                thread.join()
@@ -0,0 +1,164 @@
+import gzip
+import json
+import os
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from theatre_api.deletion import raw_delete, tickets_bulk_deleted
+from theatre_api.models import (
+    ArchivedReservation,
+    ArchivedTicket,
+    Reservation,
+    Ticket,
+    TicketChange,
+)
+
+TICKET_FIELDS = ("id", "performance_id", "reservation_id", "row", "seat")
+RESERVATION_FIELDS = ("id", "user_id", "created_at")
+
+
+class Command(BaseCommand):
+    """
+    Django command to move tickets of past performances, and reservations
+    left without tickets, into archive tables or gzipped NDJSON files.
+
+    Works in small batches, each committed on its own (copy and delete
+    in one transaction), so it can be stopped and re-run at any time.
+    """
+
+    help = "Archive tickets and reservations of past performances"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=90,
+            help="Archive performances that ended more than N days ago",
+        )
+        parser.add_argument(
+            "--to",
+            choices=("table", "file"),
+            default="table",
+            help="Archive tables or gzipped NDJSON files in --output-dir",
+        )
+        parser.add_argument(
+            "--output-dir",
+            default=str(settings.ARCHIVE_DIR),
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.1,
+            help="Seconds to pause between batches to limit DB load",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        self.to_file = options["to"] == "file"
+        self.output_dir = options["output_dir"]
+        self.batch_size = options["batch_size"]
+        self.sleep = options["sleep"]
+        if self.to_file:
+            os.makedirs(self.output_dir, exist_ok=True)
+
+        tickets = self._archive_tickets(cutoff)
+        reservations = self._archive_reservations(cutoff)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Archived {tickets} tickets and {reservations} reservations "
+                f"of performances before {cutoff:%Y-%m-%d %H:%M}"
+            )
+        )
+
+    def _write_file(self, prefix, rows):
+        """Write rows atomically, re-running a batch overwrites its file"""
+        name = f"{prefix}-{rows[0]['id']:012d}-{rows[-1]['id']:012d}"
+        path = os.path.join(self.output_dir, f"{name}.ndjson.gz")
+        with gzip.open(f"{path}.tmp", "wt") as file:
+            for row in rows:
+                file.write(json.dumps(row, cls=DjangoJSONEncoder) + "\n")
+        os.replace(f"{path}.tmp", path)
+
+    def _batches(self, queryset, fields):
+        last_id = 0
+        while True:
+            rows = list(
+                queryset.filter(pk__gt=last_id)
+                .order_by("pk")
+                .values(*fields)[: self.batch_size]
+            )
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1]["id"]
+            if self.sleep:
+                time.sleep(self.sleep)
+
+    def _archive_tickets(self, cutoff) -> int:
+        archived = 0
+        tickets = Ticket.objects.filter(performance__show_time__lt=cutoff)
+        for rows in self._batches(tickets, TICKET_FIELDS):
+            with transaction.atomic():
+                if self.to_file:
+                    self._write_file("tickets", rows)
+                else:
+                    ArchivedTicket.objects.bulk_create(
+                        [ArchivedTicket(**row) for row in rows],
+                        ignore_conflicts=True,
+                    )
+                raw_delete(
+                    Ticket.objects.filter(pk__in=[row["id"] for row in rows])
+                )
+                # Like deletion.py, for the check-in manifest delta sync
+                TicketChange.objects.bulk_create(
+                    [
+                        TicketChange(
+                            ticket_id=row["id"],
+                            performance_id=row["performance_id"],
+                            row=row["row"],
+                            seat=row["seat"],
+                            removed=True,
+                        )
+                        for row in rows
+                    ]
+                )
+            tickets_bulk_deleted.send(
+                sender=Ticket,
+                tickets_per_performance=dict(
+                    Counter(row["performance_id"] for row in rows)
+                ),
+                archived=True,
+            )
+            archived += len(rows)
+            self.stdout.write(f"Archived {archived} tickets...")
+        return archived
+
+    def _archive_reservations(self, cutoff) -> int:
+        archived = 0
+        reservations = Reservation.objects.filter(
+            created_at__lt=cutoff, tickets__isnull=True
+        )
+        for rows in self._batches(reservations, RESERVATION_FIELDS):
+            with transaction.atomic():
+                if self.to_file:
+                    self._write_file("reservations", rows)
+                else:
+                    ArchivedReservation.objects.bulk_create(
+                        [ArchivedReservation(**row) for row in rows],
+                        ignore_conflicts=True,
+                    )
+                raw_delete(
+                    Reservation.objects.filter(
+                        pk__in=[row["id"] for row in rows]
+                    )
+                )
+            archived += len(rows)
+        return archived
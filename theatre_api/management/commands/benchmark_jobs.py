@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from theatre_api.jobs import Worker
+from theatre_api.models import Job
+from theatre_api.tasks import noop
+
+
+class Command(BaseCommand):
+    """
+    Django command to measure job queue throughput: enqueues no-op jobs,
+    drains them with each number of threads and reports jobs per second.
+    Only the benchmark's own jobs are claimed and they are deleted
+    afterwards, so it is safe to run next to real workers.
+    """
+
+    help = "Measure background job throughput"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--jobs", type=int, default=1000)
+        parser.add_argument(
+            "--threads",
+            type=int,
+            nargs="+",
+            default=[1, 2, 4, 8],
+            help="Thread counts to compare",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, nargs="+", default=[1, 10]
+        )
+
+    def handle(self, *args, **options):
+        count = options["jobs"]
+        for batch_size in options["batch_size"]:
+            for threads in options["threads"]:
+                started = time.perf_counter()
+                now = timezone.now()
+                Job.objects.bulk_create(
+                    [
+                        Job(task=noop.task_name, run_at=now)
+                        for _ in range(count)
+                    ],
+                    batch_size=1000,
+                )
+                enqueued = time.perf_counter()
+
+                worker = Worker(
+                    threads=threads,
+                    batch_size=batch_size,
+                    tasks=[noop.task_name],
+                    name="benchmark",
+                )
+                worker.run(until_empty=True)
+                finished = time.perf_counter()
+
+                Job.objects.filter(
+                    task=noop.task_name, locked_by__startswith="benchmark:"
+                ).delete()
+                self.stdout.write(
+                    f"threads={threads:<3} batch={batch_size:<4} "
+                    f"enqueue {count / (enqueued - started):>9.0f} jobs/s  "
+                    f"run {worker.processed / (finished - enqueued):>8.0f} "
+                    f"jobs/s"
+                )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from theatre_api.catalog import build_catalog
+
+
+class Command(BaseCommand):
+    """Django command to build the static catalog snapshots now"""
+
+    help = "Render the public catalog snapshots and switch to them"
+
+    def handle(self, *args, **options):
+        manifest = build_catalog()
+        self.stdout.write(
+            self.style.SUCCESS(f"Catalog version {manifest['version']}")
+        )
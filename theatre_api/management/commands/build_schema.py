@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from theatre_core.schema import build_schema
+
+
+class Command(BaseCommand):
+    """
+    Django command to generate the OpenAPI schema files served at
+    /api/schema/, run it on every deploy.
+    """
+
+    help = "Generate the OpenAPI schema into SCHEMA_DIR"
+
+    def handle(self, *args, **options):
+        manifest = build_schema()
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Wrote " + ", ".join(manifest["files"].values())
+            )
+        )
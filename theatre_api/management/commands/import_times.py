@@ -0,0 +1,80 @@
+import subprocess
+import sys
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def parse_importtime(output) -> list:
+    """(module, self µs, cumulative µs) rows of `python -X importtime`"""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:") :].split("|")
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except (IndexError, ValueError):
+            # The header line
+            continue
+        rows.append((fields[2].strip(), self_us, cumulative_us))
+    return rows
+
+
+class Command(BaseCommand):
+    """
+    Django command to profile the imports of a cold start: imports the
+    module in a fresh interpreter with `-X importtime` and reports the
+    total, the packages taking the most time on their own and the
+    modules taking the most with everything they import.
+    """
+
+    help = "Report import times of a fresh process importing the app"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--module",
+            default="theatre_core.wsgi",
+            help="Module to import, defaults to theatre_core.wsgi",
+        )
+        parser.add_argument("--limit", type=int, default=15)
+
+    def handle(self, *args, **options):
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-X",
+                "importtime",
+                "-c",
+                f"import {options['module']}",
+            ],
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode:
+            raise CommandError(
+                f"Importing {options['module']} failed:\n"
+                + result.stderr[-2000:]
+            )
+        rows = parse_importtime(result.stderr)
+
+        packages = Counter()
+        for module, self_us, _ in rows:
+            packages[module.split(".")[0]] += self_us
+        total = sum(packages.values())
+        self.stdout.write(
+            f"Importing {options['module']}: {total / 1000:.1f} ms, "
+            f"{len(rows)} modules"
+        )
+
+        self.stdout.write("\nPackages by self time:")
+        for package, self_us in packages.most_common(options["limit"]):
+            self.stdout.write(
+                f"  {self_us / 1000:8.1f} ms {100 * self_us / total:5.1f}%"
+                f"  {package}"
+            )
+
+        self.stdout.write("\nModules by cumulative time:")
+        by_cumulative = sorted(rows, key=lambda row: row[2], reverse=True)
+        for module, _, cumulative_us in by_cumulative[: options["limit"]]:
+            self.stdout.write(f"  {cumulative_us / 1000:8.1f} ms  {module}")
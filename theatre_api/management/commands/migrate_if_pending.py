@@ -0,0 +1,39 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from theatre_core.startup import pending_migrations
+
+
+class Command(BaseCommand):
+    """
+    Django command to run `migrate` only when some migration is not
+    applied yet, which keeps restarts of an up-to-date database fast.
+    """
+
+    help = "Apply database migrations if any is pending"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Database to migrate, defaults to the 'default' database",
+        )
+
+    def handle(self, *args, **options):
+        database = options["database"]
+        pending = pending_migrations(connections[database])
+        if not pending:
+            self.stdout.write("No migrations to apply.")
+            return
+        self.stdout.write(
+            f"{len(pending)} pending migration(s): "
+            + ", ".join(f"{label}.{name}" for label, name in pending)
+        )
+        call_command(
+            "migrate",
+            database=database,
+            interactive=False,
+            verbosity=options["verbosity"],
+            stdout=self.stdout,
+        )
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from theatre_api.etickets import prune_etickets
+
+
+class Command(BaseCommand):
+    """Django command to delete e-ticket files unused for ETICKET_MAX_AGE"""
+
+    def handle(self, *args, **options):
+        deleted = prune_etickets()
+        self.stdout.write(
+            self.style.SUCCESS(f"Deleted {deleted} e-ticket files")
+        )
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from theatre_api.idempotency import prune_idempotency_keys
+
+
+class Command(BaseCommand):
+    """Django command to delete expired reservation idempotency keys"""
+
+    def handle(self, *args, **options):
+        deleted = prune_idempotency_keys()
+        self.stdout.write(
+            self.style.SUCCESS(f"Deleted {deleted} expired idempotency keys")
+        )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from theatre_api.jobs import prune_jobs
+
+
+class Command(BaseCommand):
+    """Django command to delete done and failed jobs past their retention"""
+
+    def handle(self, *args, **options):
+        deleted = prune_jobs()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} old jobs"))
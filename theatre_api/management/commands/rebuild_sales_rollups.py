@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from theatre_api.analytics import rebuild_rollups
+
+
+class Command(BaseCommand):
+    """
+    Django command to recompute the sales analytics rollups from the
+    ticket and archive tables. Stop the workers or let the queued
+    apply_sales jobs finish first, they would be counted twice.
+    """
+
+    help = "Recompute the sales analytics rollup tables"
+
+    def handle(self, *args, **options):
+        rows = rebuild_rollups()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt sales rollups: {rows['performances']} "
+                f"performances, {rows['days']} play days, "
+                f"{rows['hours']} booking hours"
+            )
+        )
@@ -0,0 +1,64 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from theatre_api.jobs import Worker
+
+
+class Command(BaseCommand):
+    """
+    Django command to run background jobs. Stops after the running jobs
+    on SIGINT/SIGTERM; start several processes to scale out.
+    """
+
+    help = "Run background jobs from the database queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threads", type=int, default=settings.JOB_WORKER_THREADS
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1,
+            help="Jobs claimed per query by each thread",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.JOB_POLL_INTERVAL,
+            help="Seconds to wait when no job is due",
+        )
+        parser.add_argument(
+            "--task",
+            action="append",
+            dest="tasks",
+            help="Only run these tasks (repeatable)",
+        )
+        parser.add_argument(
+            "--until-empty",
+            action="store_true",
+            help="Exit once no job is due instead of polling",
+        )
+
+    def handle(self, *args, **options):
+        worker = Worker(
+            threads=options["threads"],
+            batch_size=options["batch_size"],
+            poll_interval=options["poll_interval"],
+            tasks=options["tasks"],
+        )
+        signal.signal(signal.SIGTERM, lambda *args: worker.stop())
+        self.stdout.write(
+            f"Worker {worker.name} running with {worker.threads} threads"
+        )
+        try:
+            worker.run(until_empty=options["until_empty"])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Worker {worker.name} stopped after {worker.processed} jobs"
+            )
+        )
@@ -0,0 +1,152 @@
+import statistics
+import time
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+
+from theatre_api.models import Performance, Reservation, Ticket
+from theatre_api.partitioning import (
+    convert_ticket_table,
+    create_future_partitions,
+    detach_partitions_before,
+    partition_stats,
+)
+
+
+def _month(value):
+    try:
+        return datetime.strptime(value, "%Y-%m").date()
+    except ValueError:
+        raise CommandError(f"Invalid month {value!r}, expected YYYY-MM.")
+
+
+class Command(BaseCommand):
+    """
+    Django command to manage monthly ticket partitions on PostgreSQL:
+    convert the ticket table once, then create upcoming partitions and
+    detach past ones periodically (e.g. from cron). `benchmark` compares
+    insert latency and index sizes before and after converting.
+    """
+
+    help = "Manage monthly partitions of the ticket table (PostgreSQL)"
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest="action", required=True)
+
+        convert = subparsers.add_parser(
+            "convert", help="Rebuild the ticket table as a partitioned one"
+        )
+        convert.add_argument("--months-ahead", type=int, default=3)
+
+        create = subparsers.add_parser(
+            "create", help="Create partitions for the coming months"
+        )
+        create.add_argument("--months-ahead", type=int, default=3)
+
+        detach = subparsers.add_parser(
+            "detach", help="Detach partitions of months before --before"
+        )
+        detach.add_argument("--before", type=_month, required=True)
+        detach.add_argument(
+            "--drop",
+            action="store_true",
+            help="Drop detached partitions instead of keeping them",
+        )
+
+        subparsers.add_parser(
+            "stats", help="Show row counts and sizes of partitions"
+        )
+
+        benchmark = subparsers.add_parser(
+            "benchmark",
+            help="Time ticket inserts and show index sizes, then roll back",
+        )
+        benchmark.add_argument("--performance", type=int, required=True)
+        benchmark.add_argument("--tickets", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        action = options["action"]
+        if action == "convert":
+            copied = convert_ticket_table(options["months_ahead"])
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Partitioned tickets, copied {copied} rows"
+                )
+            )
+        elif action == "create":
+            created = create_future_partitions(options["months_ahead"])
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Created {len(created)} partitions: "
+                    f"{', '.join(created) or '-'}"
+                )
+            )
+        elif action == "detach":
+            detached = detach_partitions_before(
+                options["before"], drop=options["drop"]
+            )
+            verb = "Dropped" if options["drop"] else "Detached"
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{verb} {len(detached)} partitions: "
+                    f"{', '.join(detached) or '-'}"
+                )
+            )
+        elif action == "benchmark":
+            self._benchmark(options["performance"], options["tickets"])
+        else:
+            self._write_stats()
+
+    def _write_stats(self):
+        for partition in partition_stats():
+            self.stdout.write(
+                f"{partition['name']:<36} {partition['rows']:>10} rows "
+                f"{partition['table_bytes'] // 1024:>10} KiB table "
+                f"{partition['index_bytes'] // 1024:>10} KiB indexes"
+            )
+
+    def _benchmark(self, performance_id, count):
+        """
+        Insert `count` tickets into an unused seat range of a performance
+        one statement at a time, so the timings match the API's, and
+        report latency percentiles before rolling everything back.
+        Run it before and after `convert` to compare both layouts.
+        """
+        performance = Performance.objects.get(pk=performance_id)
+        timings = []
+        with transaction.atomic():
+            user = get_user_model().objects.order_by("pk").first()
+            reservation = Reservation.objects.create(user=user)
+            start_row = (
+                Ticket.objects.filter(performance=performance).aggregate(
+                    last=Max("row")
+                )["last"]
+                or 0
+            ) + 1
+            for index in range(count):
+                ticket = Ticket(
+                    performance=performance,
+                    reservation=reservation,
+                    row=start_row + index // 1000,
+                    seat=index % 1000 + 1,
+                    show_month=performance.show_month,
+                )
+                started = time.perf_counter()
+                # Model.save() would validate seats against the hall
+                Ticket.objects.bulk_create([ticket])
+                timings.append(time.perf_counter() - started)
+            self._write_stats()
+            transaction.set_rollback(True)
+
+        timings.sort()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Inserted {count} tickets: "
+                f"p50 {timings[len(timings) // 2] * 1000:.3f} ms, "
+                f"p99 {timings[int(len(timings) * 0.99)] * 1000:.3f} ms, "
+                f"mean {statistics.mean(timings) * 1000:.3f} ms (rolled back)"
+            )
+        )
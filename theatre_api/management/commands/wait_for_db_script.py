@@ -1,29 +1,49 @@
 import time
-from django.core.management.base import BaseCommand
+
+from django.core.management.base import BaseCommand, CommandError
 from django.db import connections, OperationalError
 
 
 class Command(BaseCommand):
-    """Django command to pause execution until database is available"""
+    """
+    Django command to pause execution until database is available.
+    Retries with exponential backoff: quick while the database is
+    starting, without hammering it when it takes longer.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=60,
+            help="Give up after this many seconds",
+        )
+        parser.add_argument("--initial-delay", type=float, default=0.1)
+        parser.add_argument("--max-delay", type=float, default=5)
 
     def handle(self, *args, **options):
         self.stdout.write("Waiting for database...")
-        db_conn = None
-        attempts = 0
-        max_attempts = 20
+        deadline = time.monotonic() + options["timeout"]
+        delay = options["initial_delay"]
 
-        while attempts < max_attempts:
+        while True:
             try:
                 db_conn = connections["default"]
-                c = db_conn.cursor()
-                c.execute("SELECT 1;")
+                with db_conn.cursor() as cursor:
+                    cursor.execute("SELECT 1;")
                 self.stdout.write(self.style.SUCCESS("Database available!"))
                 return
             except OperationalError:
-                attempts += 1
+                db_conn.close()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CommandError(
+                        "Database unavailable after waiting for "
+                        f"{options['timeout']:g} seconds"
+                    )
+                delay = min(delay, remaining)
                 self.stdout.write(
-                    f"Database unavailable, waiting {attempts} second(s)..."
+                    f"Database unavailable, waiting {delay:.1f} second(s)..."
                 )
-                time.sleep(1)
-
-        raise Exception("Database unavailable after waiting for 20 seconds")
+                time.sleep(delay)
+                delay = min(delay * 2, options["max_delay"])
@@ -0,0 +1,154 @@
+"""
+Offline check-in manifests for scanner devices.
+
+A full manifest lists every valid ticket of a performance; a delta
+lists the tickets sold or cancelled since a sequence number, taken from
+the `TicketChange` log. Both are binary and zlib compressed:
+
+    b"TKM1" | kind (b"F" full, b"D" delta) | performance id | sequence
+    | ticket count of the performance | entries
+
+Full entries are `id, row, seat` and delta entries
+`id, row, seat, removed`, sorted by ticket id with each id stored as
+the difference to the previous one. Every integer is an unsigned LEB128
+varint. Devices store the sequence and ask for `?since=<sequence>`
+next time, apply deltas idempotently, and fall back to a full download
+when their ticket count differs from the manifest's. The body is signed
+with HMAC-SHA256 in the `X-Manifest-Signature` header.
+
+Changes are only published once `MANIFEST_SETTLE_SECONDS` old, so a
+reservation transaction still in flight cannot commit a change with a
+sequence number a device already synced past.
+"""
+
+import hashlib
+import hmac
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from theatre_api.models import Ticket, TicketChange
+
+MAGIC = b"TKM1"
+FULL = b"F"
+DELTA = b"D"
+SIGNATURE_HEADER = "X-Manifest-Signature"
+SEQUENCE_HEADER = "X-Manifest-Sequence"
+
+
+def _encode_varint(value, out):
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _decode_varint(data, position):
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def _encode(kind, performance_id, sequence, count, entries) -> bytes:
+    out = bytearray(MAGIC + kind)
+    for value in (performance_id, sequence, count):
+        _encode_varint(value, out)
+    previous_id = 0
+    for ticket_id, *fields in entries:
+        _encode_varint(ticket_id - previous_id, out)
+        previous_id = ticket_id
+        for value in fields:
+            _encode_varint(int(value), out)
+    return zlib.compress(bytes(out), 9)
+
+
+def decode(body) -> dict:
+    """Reference decoder, as implemented by the scanner devices"""
+    data = zlib.decompress(body)
+    if data[:4] != MAGIC:
+        raise ValueError("Not a ticket manifest")
+    kind = data[4:5]
+    width = 3 if kind == FULL else 4
+    header = []
+    position = 5
+    for _ in range(3):
+        value, position = _decode_varint(data, position)
+        header.append(value)
+
+    entries = []
+    ticket_id = 0
+    while position < len(data):
+        fields = []
+        for _ in range(width):
+            value, position = _decode_varint(data, position)
+            fields.append(value)
+        ticket_id += fields[0]
+        entries.append((ticket_id, *fields[1:]))
+    return {
+        "kind": "full" if kind == FULL else "delta",
+        "performance_id": header[0],
+        "sequence": header[1],
+        "count": header[2],
+        "entries": entries,
+    }
+
+
+def sign(body) -> str:
+    return hmac.new(
+        settings.MANIFEST_SIGNING_KEY.encode(), body, hashlib.sha256
+    ).hexdigest()
+
+
+def _settled_changes(performance_id):
+    cutoff = timezone.now() - timedelta(
+        seconds=settings.MANIFEST_SETTLE_SECONDS
+    )
+    return TicketChange.objects.filter(
+        performance_id=performance_id, changed_at__lte=cutoff
+    )
+
+
+def build_manifest(performance_id, since=None) -> tuple:
+    """Body and sequence of the full manifest, or the delta `since`"""
+    changes = _settled_changes(performance_id)
+    tickets = Ticket.objects.filter(performance_id=performance_id)
+
+    if since is None:
+        # Read the sequence first: changes committed meanwhile are both
+        # in this snapshot and in the next delta, which is harmless.
+        sequence = (
+            changes.order_by("-pk").values_list("pk", flat=True).first() or 0
+        )
+        entries = list(tickets.order_by("pk").values_list("pk", "row", "seat"))
+        body = _encode(FULL, performance_id, sequence, len(entries), entries)
+        return body, sequence
+
+    latest = {}
+    sequence = since
+    for pk, ticket_id, row, seat, removed in (
+        changes.filter(pk__gt=since)
+        .order_by("pk")
+        .values_list("pk", "ticket_id", "row", "seat", "removed")
+    ):
+        latest[ticket_id] = (ticket_id, row, seat, removed)
+        sequence = pk
+    entries = [latest[ticket_id] for ticket_id in sorted(latest)]
+
+    # Ticket count as of `sequence`, for the device's consistency check
+    newer = TicketChange.objects.filter(
+        performance_id=performance_id, pk__gt=sequence
+    ).aggregate(
+        added=Count("pk", filter=Q(removed=False)),
+        removed=Count("pk", filter=Q(removed=True)),
+    )
+    count = tickets.count() - newer["added"] + newer["removed"]
+    body = _encode(DELTA, performance_id, sequence, count, entries)
+    return body, sequence
@@ -0,0 +1,381 @@
+"""
+Prometheus-format metrics without an external client library.
+
+Every process keeps its own counters and histograms in memory behind a
+single lock. When `METRICS_DIR` is set, each process also snapshots its
+values to `<METRICS_DIR>/metrics-<pid>.json` (at most once per
+`METRICS_FLUSH_INTERVAL` seconds, atomically), and the `/metrics`
+endpoint merges the snapshots of all worker processes. Snapshots of
+processes that exited are deleted when found, so their counters drop
+out like those of a restarted process.
+
+`/metrics` only answers `METRICS_ALLOWED_IPS` and requests bearing
+`METRICS_TOKEN`.
+"""
+
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils.crypto import constant_time_compare
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+COUNTER = "counter"
+HISTOGRAM = "histogram"
+
+METRICS = {
+    "theatre_http_requests_total": (
+        COUNTER,
+        "HTTP requests by view, action, method and status code.",
+    ),
+    "theatre_http_errors_total": (
+        COUNTER,
+        "HTTP requests that raised or returned a 5xx response.",
+    ),
+    "theatre_http_request_duration_seconds": (
+        HISTOGRAM,
+        "Request latency by view and action.",
+    ),
+    "theatre_db_queries_total": (
+        COUNTER,
+        "SQL queries executed while serving requests, by view.",
+    ),
+    "theatre_db_query_duration_seconds_total": (
+        COUNTER,
+        "Time spent in SQL while serving requests, by view.",
+    ),
+    "theatre_db_connections_opened_total": (
+        COUNTER,
+        "New database connections opened, by alias.",
+    ),
+    "theatre_db_pool_wait_seconds": (
+        HISTOGRAM,
+        "Time spent waiting for a pooled database connection, by alias.",
+    ),
+    "theatre_db_pool_timeouts_total": (
+        COUNTER,
+        "Pooled connection requests that timed out, by alias.",
+    ),
+    "theatre_throttle_rejections_total": (
+        COUNTER,
+        "Requests rejected by a throttle, by scope.",
+    ),
+    "theatre_reservations_total": (
+        COUNTER,
+        "Reservation attempts by outcome "
+        "(success, seat_conflict, validation_error).",
+    ),
+    "theatre_jobs_total": (
+        COUNTER,
+        "Background jobs run, by task and outcome (done, retry, failed).",
+    ),
+    "theatre_job_duration_seconds": (
+        HISTOGRAM,
+        "Background job run time, by task.",
+    ),
+    "theatre_readiness_check_duration_seconds": (
+        HISTOGRAM,
+        "Readiness check latency, by check.",
+    ),
+    "theatre_readiness_check_failures_total": (
+        COUNTER,
+        "Failed readiness checks, by check.",
+    ),
+}
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._last_flush = 0.0
+
+    def inc(self, name, labels=None, value=1):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        self._maybe_flush()
+
+    def observe(self, name, value, labels=None, buckets=LATENCY_BUCKETS):
+        key = (name, _labels_key(labels))
+        index = bisect.bisect_left(buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {
+                    "buckets": list(buckets),
+                    "counts": [0] * (len(buckets) + 1),
+                    "sum": 0.0,
+                }
+            histogram["counts"][index] += 1
+            histogram["sum"] += value
+        self._maybe_flush()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": [
+                    [name, list(labels), value]
+                    for (name, labels), value in self._counters.items()
+                ],
+                "histograms": [
+                    [name, list(labels), dict(h, counts=list(h["counts"]))]
+                    for (name, labels), h in self._histograms.items()
+                ],
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def _maybe_flush(self):
+        if not settings.METRICS_DIR:
+            return
+        now = time.monotonic()
+        if now - self._last_flush >= settings.METRICS_FLUSH_INTERVAL:
+            self._last_flush = now
+            self.flush()
+
+    def flush(self):
+        """Atomically write this process' snapshot to `METRICS_DIR`."""
+        if not settings.METRICS_DIR:
+            return
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        path = _snapshot_path(os.getpid())
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self.snapshot(), file)
+        os.replace(tmp_path, path)
+
+
+def _labels_key(labels) -> tuple:
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def _snapshot_path(pid):
+    return os.path.join(settings.METRICS_DIR, f"metrics-{pid}.json")
+
+
+def _process_exited(filename) -> bool:
+    try:
+        pid = int(filename.removeprefix("metrics-").removesuffix(".json"))
+    except ValueError:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:  # alive, owned by another user
+        pass
+    return False
+
+
+registry = Registry()
+inc = registry.inc
+observe = registry.observe
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        registry.flush()
+    except Exception:  # settings may be unconfigured at interpreter exit
+        pass
+
+
+@receiver(connection_created)
+def _count_connection(sender, connection, **kwargs):
+    inc("theatre_db_connections_opened_total", {"alias": connection.alias})
+
+
+def _collect_snapshots() -> list:
+    """This process' live values plus snapshots of all other processes."""
+    snapshots = [registry.snapshot()]
+    if not settings.METRICS_DIR or not os.path.isdir(settings.METRICS_DIR):
+        return snapshots
+
+    own_path = _snapshot_path(os.getpid())
+    for filename in os.listdir(settings.METRICS_DIR):
+        path = os.path.join(settings.METRICS_DIR, filename)
+        if not filename.endswith(".json") or path == own_path:
+            continue
+        if _process_exited(filename):
+            try:
+                os.remove(path)
+            except FileNotFoundError:  # pruned by another process
+                pass
+            continue
+        try:
+            with open(path) as file:
+                snapshots.append(json.load(file))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def scrape_allowed(request) -> bool:
+    """Whether `request` may read /metrics"""
+    if settings.METRICS_TOKEN and constant_time_compare(
+        request.headers.get("Authorization", ""),
+        f"Bearer {settings.METRICS_TOKEN}",
+    ):
+        return True
+    return request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            key,
+            str(value)
+            .replace("\\", "\\\\")
+            .replace('"', '\\"')
+            .replace("\n", "\\n"),
+        )
+        for key, value in labels
+    )
+    return f"{{{pairs}}}"
+
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_metrics() -> str:
+    """All metrics of all processes in Prometheus text format."""
+    counters = {}
+    histograms = {}
+    for snapshot in _collect_snapshots():
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(tuple(label) for label in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, data in snapshot["histograms"]:
+            key = (name, tuple(tuple(label) for label in labels))
+            merged = histograms.setdefault(
+                key,
+                {
+                    "buckets": data["buckets"],
+                    "counts": [0] * len(data["counts"]),
+                    "sum": 0.0,
+                },
+            )
+            merged["counts"] = [
+                a + b for a, b in zip(merged["counts"], data["counts"])
+            ]
+            merged["sum"] += data["sum"]
+
+    lines = []
+    for name, (metric_type, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        if metric_type == COUNTER:
+            for (key_name, labels), value in sorted(counters.items()):
+                if key_name == name:
+                    lines.append(
+                        f"{name}{_format_labels(labels)} "
+                        f"{_format_value(value)}"
+                    )
+            continue
+
+        for (key_name, labels), data in sorted(histograms.items()):
+            if key_name != name:
+                continue
+            cumulative = 0
+            bounds = [*data["buckets"], "+Inf"]
+            for bound, count in zip(bounds, data["counts"]):
+                cumulative += count
+                bucket_labels = (*labels, ("le", str(bound)))
+                lines.append(
+                    f"{name}_bucket{_format_labels(bucket_labels)} "
+                    f"{cumulative}"
+                )
+            lines.append(
+                f"{name}_sum{_format_labels(labels)} "
+                f"{_format_value(data['sum'])}"
+            )
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Record request counts, errors, latency and SQL stats per view."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, "cls", None)
+        actions = getattr(view_func, "actions", None) or {}
+        request.metrics_view = (
+            view_class.__name__ if view_class else view_func.__name__
+        )
+        request.metrics_action = actions.get(
+            request.method.lower(), request.method.lower()
+        )
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        except Exception:
+            self._record(request, 500, time.perf_counter() - started)
+            raise
+        self._record(
+            request, response.status_code, time.perf_counter() - started
+        )
+        return response
+
+    @staticmethod
+    def _record(request, status_code, duration):
+        view = getattr(request, "metrics_view", "unresolved")
+        action = getattr(request, "metrics_action", "")
+        inc(
+            "theatre_http_requests_total",
+            {
+                "view": view,
+                "action": action,
+                "method": request.method,
+                "status": status_code,
+            },
+        )
+        if status_code >= 500:
+            inc("theatre_http_errors_total", {"view": view, "action": action})
+        observe(
+            "theatre_http_request_duration_seconds",
+            duration,
+            {"view": view, "action": action},
+        )
+
+        timings = getattr(request, "timings", None)
+        if timings is not None and timings.sql_count:
+            inc("theatre_db_queries_total", {"view": view}, timings.sql_count)
+            inc(
+                "theatre_db_query_duration_seconds_total",
+                {"view": view},
+                timings.sql_time,
+            )
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-19 03:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("theatre_api", "0002_play_description_play_poster"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="performance",
+            name="show_time",
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
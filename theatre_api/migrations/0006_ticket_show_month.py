@@ -0,0 +1,38 @@
+# Generated by Django 5.0.6 on 2026-10-19 03:25
+
+from django.db import migrations, models
+from django.db.models import DateField, OuterRef, Subquery
+from django.db.models.functions import TruncMonth
+
+
+def fill_show_month(apps, schema_editor):
+    Performance = apps.get_model("theatre_api", "Performance")
+    Ticket = apps.get_model("theatre_api", "Ticket")
+    Ticket.objects.update(
+        show_month=Subquery(
+            Performance.objects.filter(pk=OuterRef("performance_id")).values(
+                month=TruncMonth("show_time", output_field=DateField())
+            )
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("theatre_api", "0005_archived_tickets_reservations"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ticket",
+            name="show_month",
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_show_month, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="ticket",
+            name="show_month",
+            field=models.DateField(editable=False),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.6 on 2026-10-19 03:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("theatre_api", "0008_checkin"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TicketChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("performance_id", models.BigIntegerField()),
+                ("ticket_id", models.BigIntegerField()),
+                ("row", models.PositiveIntegerField()),
+                ("seat", models.PositiveIntegerField()),
+                ("removed", models.BooleanField(default=False)),
+                ("changed_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["performance_id", "id"],
+                        name="theatre_api_ticketchange_seq",
+                    )
+                ],
+            },
+        ),
+    ]
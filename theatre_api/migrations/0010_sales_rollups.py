@@ -0,0 +1,73 @@
+# Generated by Django 5.0.6 on 2026-10-19 03:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("theatre_api", "0009_ticketchange"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PerformanceSales",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("performance_id", models.BigIntegerField(unique=True)),
+                ("play_id", models.BigIntegerField(db_index=True)),
+                ("theatre_hall_id", models.BigIntegerField(db_index=True)),
+                ("show_date", models.DateField(db_index=True)),
+                ("capacity", models.PositiveIntegerField()),
+                ("tickets", models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="DailyPlaySales",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("play_id", models.BigIntegerField()),
+                ("date", models.DateField(db_index=True)),
+                ("tickets", models.IntegerField(default=0)),
+            ],
+            options={
+                "unique_together": {("play_id", "date")},
+            },
+        ),
+        migrations.CreateModel(
+            name="HourlyBookings",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("weekday", models.PositiveSmallIntegerField()),
+                ("hour", models.PositiveSmallIntegerField()),
+                ("tickets", models.IntegerField(default=0)),
+            ],
+            options={
+                "unique_together": {("weekday", "hour")},
+            },
+        ),
+    ]
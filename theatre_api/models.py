@@ -6,6 +6,8 @@ from django.db import models
 from django.utils.text import slugify
 from rest_framework.exceptions import ValidationError
 
+from theatre_api.reference_cache import get_hall
+
 
 class Reservation(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
@@ -73,6 +75,42 @@ class Play(models.Model):
         return self.title
 
 
+class PerformanceSeries(models.Model):
+    """Recurring performances of a play in a hall, see series.py"""
+
+    DAILY = "daily"
+    WEEKLY = "weekly"
+    FREQUENCY_CHOICES = [
+        (DAILY, "Daily"),
+        (WEEKLY, "Weekly"),
+    ]
+
+    play = models.ForeignKey(
+        Play, on_delete=models.CASCADE, related_name="series"
+    )
+    theatre_hall = models.ForeignKey(
+        TheatreHall, on_delete=models.CASCADE, related_name="series"
+    )
+    frequency = models.CharField(
+        max_length=16, choices=FREQUENCY_CHOICES, default=WEEKLY
+    )
+    # Every `interval` days or weeks
+    interval = models.PositiveSmallIntegerField(default=1)
+    # Days of the week of weekly series, 0 is Monday
+    weekdays = models.JSONField(default=list, blank=True)
+    # Time of day in TIME_ZONE
+    show_time = models.TimeField()
+    start_date = models.DateField()
+    end_date = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return (
+            f"{self.play} - {self.theatre_hall} "
+            f"({self.start_date} - {self.end_date})"
+        )
+
+
 class Performance(models.Model):
     play = models.ForeignKey(
         Play, on_delete=models.CASCADE, related_name="performances"
@@ -80,7 +118,29 @@ class Performance(models.Model):
     theatre_hall = models.ForeignKey(
         TheatreHall, on_delete=models.CASCADE, related_name="performances"
     )
-    show_time = models.DateTimeField()
+    show_time = models.DateTimeField(db_index=True)
+    series = models.ForeignKey(
+        PerformanceSeries,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="performances",
+    )
+
+    @property
+    def show_month(self):
+        """First day of the show's month, the partition key of its tickets"""
+        show_time = self._meta.get_field("show_time").to_python(self.show_time)
+        return show_time.date().replace(day=1)
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if not adding:
+            # Rescheduled to another month: move the tickets along.
+            self.tickets.exclude(show_month=self.show_month).update(
+                show_month=self.show_month
+            )
 
     def __str__(self):
         return f"{self.theatre_hall} - {self.show_time}"
@@ -95,9 +155,16 @@ class Ticket(models.Model):
     )
     row = models.PositiveIntegerField()
     seat = models.PositiveIntegerField()
+    # Denormalized from performance.show_time, tickets can be partitioned
+    # by it on Postgres (see theatre_api/partitioning.py)
+    show_month = models.DateField(editable=False)
 
     @staticmethod
     def validate_ticket(row, seat, theatre_hall, error_to_raise):
+        if theatre_hall is None:
+            raise error_to_raise(
+                {"performance": "The performance hall does not exist."}
+            )
         for ticket_attr_value, ticket_attr_name, theatre_hall_attr_name in [
             (row, "row", "rows"),
             (seat, "seat", "seats_in_row"),
@@ -115,7 +182,7 @@ class Ticket(models.Model):
         Ticket.validate_ticket(
             self.row,
             self.seat,
-            self.performance.theatre_hall,
+            get_hall(self.performance.theatre_hall_id),
             ValidationError,
         )
 
@@ -126,10 +193,20 @@ class Ticket(models.Model):
         using=None,
         update_fields=None,
     ):
+        self.show_month = self.performance.show_month
         self.full_clean()
-        return super(Ticket, self).save(
+        adding = self._state.adding
+        result = super(Ticket, self).save(
             force_insert, force_update, using, update_fields
         )
+        if adding:
+            TicketChange.objects.create(
+                performance_id=self.performance_id,
+                ticket_id=self.pk,
+                row=self.row,
+                seat=self.seat,
+            )
+        return result
 
     def __str__(self):
         return f"{str(self.performance)} (row: {self.row}, seat: {self.seat})"
@@ -137,3 +214,176 @@ class Ticket(models.Model):
     class Meta:
         unique_together = ("performance", "row", "seat")
         ordering = ["row", "seat"]
+
+
+class IdempotencyKey(models.Model):
+    """Stored first response of a request sent with an `Idempotency-Key`."""
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE
+    )
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField()
+    response_body = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.user} - {self.key}"
+
+    class Meta:
+        unique_together = ("user", "key")
+
+
+class ArchivedReservation(models.Model):
+    """Reservation moved out of the hot tables by archive_past_performances"""
+
+    id = models.BigIntegerField(primary_key=True)
+    user_id = models.BigIntegerField(db_index=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user_id} - {self.created_at}"
+
+
+class ArchivedTicket(models.Model):
+    """Ticket moved out of the hot tables by archive_past_performances"""
+
+    id = models.BigIntegerField(primary_key=True)
+    performance_id = models.BigIntegerField(db_index=True)
+    reservation_id = models.BigIntegerField(db_index=True)
+    row = models.PositiveIntegerField()
+    seat = models.PositiveIntegerField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.performance_id} (row: {self.row}, seat: {self.seat})"
+
+
+class Job(models.Model):
+    """Background job run by `manage.py run_worker`, see jobs.py"""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    task = models.CharField(max_length=255)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(
+        max_length=16, choices=STATUS_CHOICES, default=QUEUED
+    )
+    priority = models.SmallIntegerField(default=0)
+    run_at = models.DateTimeField()
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    last_error = models.TextField(blank=True)
+    locked_by = models.CharField(max_length=255, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["status", "-priority", "run_at"],
+                name="theatre_api_job_claim_idx",
+            ),
+        ]
+
+
+class CheckIn(models.Model):
+    """Admission of a ticket at the entrance, written in bulk by a job"""
+
+    # No foreign key to Ticket: tickets may be partitioned or archived
+    ticket_id = models.BigIntegerField(unique=True)
+    performance_id = models.BigIntegerField(db_index=True)
+    scanned_at = models.DateTimeField()
+    scanned_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, on_delete=models.SET_NULL
+    )
+    entrance = models.CharField(max_length=64, blank=True)
+
+    def __str__(self):
+        return f"{self.ticket_id} - {self.scanned_at}"
+
+
+class TicketChange(models.Model):
+    """
+    Ticket sold or cancelled. The ids are the sequence numbers of the
+    check-in manifest delta sync, see manifest.py.
+    """
+
+    performance_id = models.BigIntegerField()
+    ticket_id = models.BigIntegerField()
+    row = models.PositiveIntegerField()
+    seat = models.PositiveIntegerField()
+    removed = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        action = "removed" if self.removed else "added"
+        return f"{self.ticket_id} {action} - {self.changed_at}"
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["performance_id", "id"],
+                name="theatre_api_ticketchange_seq",
+            ),
+        ]
+
+
+class PerformanceSales(models.Model):
+    """Tickets sold per performance, rollup maintained by analytics.py"""
+
+    performance_id = models.BigIntegerField(unique=True)
+    play_id = models.BigIntegerField(db_index=True)
+    theatre_hall_id = models.BigIntegerField(db_index=True)
+    show_date = models.DateField(db_index=True)
+    capacity = models.PositiveIntegerField()
+    tickets = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.performance_id}: {self.tickets}/{self.capacity}"
+
+
+class DailyPlaySales(models.Model):
+    """Tickets of a play booked per day, rollup maintained by analytics.py"""
+
+    play_id = models.BigIntegerField()
+    date = models.DateField(db_index=True)
+    tickets = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.play_id} - {self.date}: {self.tickets}"
+
+    class Meta:
+        unique_together = ("play_id", "date")
+
+
+class HourlyBookings(models.Model):
+    """
+    Tickets booked per weekday (0 is Monday) and hour of the day in
+    TIME_ZONE, rollup maintained by analytics.py
+    """
+
+    weekday = models.PositiveSmallIntegerField()
+    hour = models.PositiveSmallIntegerField()
+    tickets = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.weekday} {self.hour:02d}h: {self.tickets}"
+
+    class Meta:
+        unique_together = ("weekday", "hour")
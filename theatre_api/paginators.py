@@ -1,3 +1,7 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
 from rest_framework.pagination import PageNumberPagination
 
 
@@ -5,3 +9,35 @@ class LargeResultsSetPagination(PageNumberPagination):
     page_size = 250
     page_size_query_param = "page_size"
     max_page_size = 5000
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Admin paginator that takes the row count of unfiltered querysets from
+    the Postgres planner statistics instead of a full `COUNT(*)`. Small
+    tables and filtered querysets are still counted exactly.
+    """
+
+    exact_count_limit = 100_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if (
+            isinstance(queryset, QuerySet)
+            and not queryset.query.where
+            and connections[queryset.db].vendor == "postgresql"
+        ):
+            with connections[queryset.db].cursor() as cursor:
+                # Summed over partitions too, see partitioning.py
+                cursor.execute(
+                    "SELECT SUM(GREATEST(reltuples, 0))::bigint FROM pg_class "
+                    "WHERE oid = to_regclass(%s) OR oid IN ("
+                    "SELECT inhrelid FROM pg_inherits "
+                    "WHERE inhparent = to_regclass(%s))",
+                    [queryset.model._meta.db_table] * 2,
+                )
+                estimate = cursor.fetchone()[0]
+            if estimate and estimate > self.exact_count_limit:
+                return estimate
+        return super().count
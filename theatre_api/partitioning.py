@@ -0,0 +1,230 @@
+"""
+Optional Postgres declarative partitioning of tickets by show month.
+
+`convert_ticket_table` rebuilds `theatre_api_ticket` as a table
+partitioned by RANGE (show_month) with one partition per month plus a
+default one. Postgres requires the partition key in every unique
+constraint, so the primary key becomes (id, show_month) and the seat
+constraint (performance_id, row, seat, show_month); since show_month is
+derived from the performance this is the same rule, and the Django
+model and queries stay unchanged.
+
+Tickets of a month without a partition land in the default one, and
+Postgres refuses to create a partition for rows the default holds:
+`create_partition` detaches the default, creates the month, moves its
+rows over and re-attaches the default, all in the caller's transaction.
+"""
+
+from datetime import date
+
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+
+TABLE = "theatre_api_ticket"
+DEFAULT_PARTITION = f"{TABLE}_default"
+COLUMNS = (
+    '"id", "row", "seat", "show_month", "performance_id", "reservation_id"'
+)
+ID_SEQUENCE = f"{TABLE}_partitioned_id_seq"
+
+
+def _require_postgres():
+    if connection.vendor != "postgresql":
+        raise CommandError(
+            "Ticket partitioning is only available on PostgreSQL."
+        )
+
+
+def _add_months(month, months) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month) -> str:
+    return f"{TABLE}_y{month:%Y}m{month:%m}"
+
+
+def is_partitioned() -> bool:
+    _require_postgres()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p "
+            "JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s",
+            [TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def create_partition(cursor, month) -> bool:
+    """
+    Create the partition of a month, return False if it exists. Must run
+    in a transaction: tickets of the month already in the default
+    partition are moved to the new one.
+    """
+    name = partition_name(month)
+    cursor.execute("SELECT to_regclass(%s)", [name])
+    if cursor.fetchone()[0] is not None:
+        return False
+    bounds = [month, _add_months(month, 1)]
+
+    cursor.execute("SELECT to_regclass(%s)", [DEFAULT_PARTITION])
+    has_default = cursor.fetchone()[0] is not None
+    if has_default:
+        # No insert may reach the default partition until it is attached
+        cursor.execute(
+            f'LOCK TABLE "{DEFAULT_PARTITION}" IN ACCESS EXCLUSIVE MODE'
+        )
+        cursor.execute(
+            f'SELECT EXISTS (SELECT 1 FROM "{DEFAULT_PARTITION}" '
+            f'WHERE "show_month" >= %s AND "show_month" < %s)',
+            bounds,
+        )
+        has_default = cursor.fetchone()[0]
+    if has_default:
+        cursor.execute(
+            f'ALTER TABLE "{TABLE}" DETACH PARTITION "{DEFAULT_PARTITION}"'
+        )
+    cursor.execute(
+        f'CREATE TABLE "{name}" PARTITION OF "{TABLE}" '
+        f"FOR VALUES FROM (%s) TO (%s)",
+        bounds,
+    )
+    if has_default:
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM "{DEFAULT_PARTITION}" '
+            f'WHERE "show_month" >= %s AND "show_month" < %s '
+            f"RETURNING {COLUMNS}) "
+            f'INSERT INTO "{name}" ({COLUMNS}) SELECT {COLUMNS} FROM moved',
+            bounds,
+        )
+        cursor.execute(
+            f'ALTER TABLE "{TABLE}" ATTACH PARTITION "{DEFAULT_PARTITION}" '
+            "DEFAULT"
+        )
+    return True
+
+
+def create_future_partitions(months_ahead, today=None) -> list:
+    """Make sure partitions exist from this month to `months_ahead`"""
+    _require_postgres()
+    if not is_partitioned():
+        raise CommandError("Tickets are not partitioned, run convert first.")
+
+    this_month = (today or date.today()).replace(day=1)
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for offset in range(months_ahead + 1):
+            month = _add_months(this_month, offset)
+            if create_partition(cursor, month):
+                created.append(partition_name(month))
+    return created
+
+
+def detach_partitions_before(month, drop=False) -> list:
+    """Detach (and optionally drop) partitions of months before `month`"""
+    _require_postgres()
+    detached = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = %s ORDER BY c.relname",
+            [TABLE],
+        )
+        for (name,) in cursor.fetchall():
+            if name == DEFAULT_PARTITION or name >= partition_name(month):
+                continue
+            cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{name}"')
+            if drop:
+                cursor.execute(f'DROP TABLE "{name}"')
+            detached.append(name)
+    return detached
+
+
+def convert_ticket_table(months_ahead=3) -> int:
+    """Rebuild the ticket table as a partitioned one, return copied rows"""
+    _require_postgres()
+    if is_partitioned():
+        raise CommandError("Tickets are already partitioned.")
+
+    old_table = f"{TABLE}_unpartitioned"
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE "{TABLE}" IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(f'ALTER TABLE "{TABLE}" RENAME TO "{old_table}"')
+        cursor.execute(f'CREATE SEQUENCE "{ID_SEQUENCE}"')
+        cursor.execute(f"""
+            CREATE TABLE "{TABLE}" (
+                "id" bigint NOT NULL DEFAULT nextval('{ID_SEQUENCE}'),
+                "row" integer NOT NULL CHECK ("row" >= 0),
+                "seat" integer NOT NULL CHECK ("seat" >= 0),
+                "show_month" date NOT NULL,
+                "performance_id" bigint NOT NULL
+                    REFERENCES "theatre_api_performance" ("id")
+                    DEFERRABLE INITIALLY DEFERRED,
+                "reservation_id" bigint NOT NULL
+                    REFERENCES "theatre_api_reservation" ("id")
+                    DEFERRABLE INITIALLY DEFERRED,
+                PRIMARY KEY ("id", "show_month"),
+                UNIQUE ("performance_id", "row", "seat", "show_month")
+            ) PARTITION BY RANGE ("show_month")
+            """)
+        cursor.execute(
+            f'ALTER SEQUENCE "{ID_SEQUENCE}" OWNED BY "{TABLE}"."id"'
+        )
+        cursor.execute(
+            f'CREATE INDEX "{TABLE}_reservation_id_part" '
+            f'ON "{TABLE}" ("reservation_id")'
+        )
+        cursor.execute(
+            f'CREATE TABLE "{DEFAULT_PARTITION}" PARTITION OF "{TABLE}" '
+            "DEFAULT"
+        )
+
+        cursor.execute(
+            f'SELECT MIN("show_month"), MAX("show_month") FROM "{old_table}"'
+        )
+        first_month, last_month = cursor.fetchone()
+        this_month = date.today().replace(day=1)
+        month = min(first_month or this_month, this_month)
+        last_month = max(
+            last_month or this_month, _add_months(this_month, months_ahead)
+        )
+        while month <= last_month:
+            create_partition(cursor, month)
+            month = _add_months(month, 1)
+
+        cursor.execute(
+            f'INSERT INTO "{TABLE}" ({COLUMNS}) '
+            f'SELECT {COLUMNS} FROM "{old_table}"'
+        )
+        copied = cursor.rowcount
+        cursor.execute(
+            f"SELECT setval('{ID_SEQUENCE}', "
+            f'COALESCE((SELECT MAX("id") FROM "{old_table}"), 0) + 1, false)'
+        )
+        cursor.execute(f'DROP TABLE "{old_table}"')
+    return copied
+
+
+def partition_stats() -> list:
+    """Rows, table size and index size of every ticket partition"""
+    _require_postgres()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, c.reltuples::bigint, "
+            "pg_table_size(c.oid), pg_indexes_size(c.oid) "
+            "FROM pg_class c LEFT JOIN pg_inherits i ON i.inhrelid = c.oid "
+            "LEFT JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE c.relname = %s OR p.relname = %s ORDER BY c.relname",
+            [TABLE, TABLE],
+        )
+        return [
+            {
+                "name": name,
+                "rows": rows,
+                "table_bytes": table_bytes,
+                "index_bytes": index_bytes,
+            }
+            for name, rows, table_bytes, index_bytes in cursor.fetchall()
+        ]
@@ -0,0 +1,231 @@
+import cProfile
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core import signing
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_QUERY_PARAM = "_profile"
+_TOKEN_SALT = "theatre_api.profiling"
+_PROFILE_ID_RE = re.compile(r"^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$")
+
+
+def make_profile_token(user) -> str:
+    """Signed token that makes requests carrying it run profiled."""
+    return signing.TimestampSigner(salt=_TOKEN_SALT).sign(str(user.pk))
+
+
+def _is_valid_token(token) -> bool:
+    try:
+        signing.TimestampSigner(salt=_TOKEN_SALT).unsign(
+            token, max_age=settings.PROFILING_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:
+        return False
+    return True
+
+
+class CProfileProfiler:
+    mode = "cprofile"
+    extension = "prof"
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def dump(self, path):
+        self.profile.dump_stats(path)
+
+
+class StackSampler:
+    """
+    Low-overhead sampler: a background thread snapshots the request
+    thread's stack every `interval` seconds. Output is in collapsed
+    stack format, which flamegraph tools read directly.
+    """
+
+    mode = "sampler"
+    extension = "collapsed"
+
+    def __init__(self, interval=None):
+        self.interval = interval or settings.PROFILING_SAMPLER_INTERVAL
+        self.stacks = Counter()
+        self._target_thread_id = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._target_thread_id = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._target_thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{frame.f_globals.get('__name__', '?')}:{code.co_name}"
+                )
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def dump(self, path):
+        with open(path, "w") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+PROFILERS = {
+    CProfileProfiler.mode: CProfileProfiler,
+    StackSampler.mode: StackSampler,
+}
+
+
+def _profiles_dir():
+    path = settings.PROFILING_DIR
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def list_profiles() -> list:
+    """Metadata of stored profiles, newest first."""
+    if not os.path.isdir(settings.PROFILING_DIR):
+        return []
+
+    profiles = []
+    for filename in os.listdir(settings.PROFILING_DIR):
+        if filename.endswith(".json"):
+            path = os.path.join(settings.PROFILING_DIR, filename)
+            with open(path) as file:
+                profiles.append(json.load(file))
+    return sorted(profiles, key=lambda item: item["id"], reverse=True)
+
+
+def get_profile_path(profile_id):
+    """Path of the stored profile data file, `None` if there is none."""
+    if not _PROFILE_ID_RE.match(profile_id):
+        return None
+
+    for profiler_class in PROFILERS.values():
+        path = os.path.join(
+            settings.PROFILING_DIR,
+            f"{profile_id}.{profiler_class.extension}",
+        )
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _prune_profiles(directory):
+    """Delete the oldest profiles beyond `PROFILING_MAX_PROFILES`."""
+    # Ids start with the UTC time, so they sort by age
+    profile_ids = sorted(
+        filename[: -len(".json")]
+        for filename in os.listdir(directory)
+        if filename.endswith(".json")
+    )
+    excess = len(profile_ids) - settings.PROFILING_MAX_PROFILES
+    extensions = ["json"] + [
+        profiler_class.extension for profiler_class in PROFILERS.values()
+    ]
+    for profile_id in profile_ids[: max(excess, 0)]:
+        for extension in extensions:
+            try:
+                os.remove(os.path.join(directory, f"{profile_id}.{extension}"))
+            except FileNotFoundError:
+                pass
+
+
+def _save_profile(profiler, request, response, trigger, duration):
+    now = datetime.now(timezone.utc)
+    profile_id = f"{now:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    directory = _profiles_dir()
+    filename = f"{profile_id}.{profiler.extension}"
+    profiler.dump(os.path.join(directory, filename))
+
+    match = getattr(request, "resolver_match", None)
+    metadata = {
+        "id": profile_id,
+        "file": filename,
+        "mode": profiler.mode,
+        "trigger": trigger,
+        "method": request.method,
+        "path": request.path,
+        "route": match.route if match else None,
+        "view_name": match.view_name if match else None,
+        "status_code": response.status_code,
+        "duration_ms": round(duration * 1000, 2),
+        "created_at": now.isoformat(),
+    }
+    with open(os.path.join(directory, f"{profile_id}.json"), "w") as file:
+        json.dump(metadata, file)
+    _prune_profiles(directory)
+
+
+class SamplingProfilerMiddleware:
+    """
+    Profile requests that carry a signed `X-Profile` header or `_profile`
+    query flag, plus a random `PROFILING_SAMPLE_RATE` share of traffic.
+    Unsampled requests only pay for a header lookup and a random().
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    @staticmethod
+    def _trigger(request):
+        token = request.headers.get(PROFILE_HEADER)
+        if token is None and PROFILE_QUERY_PARAM in request.META.get(
+            "QUERY_STRING", ""
+        ):
+            token = request.GET.get(PROFILE_QUERY_PARAM)
+        if token is not None and _is_valid_token(token):
+            return "token"
+
+        sample_rate = settings.PROFILING_SAMPLE_RATE
+        if sample_rate and random.random() < sample_rate:
+            return "sample"
+        return None
+
+    def __call__(self, request):
+        if not settings.PROFILING_ENABLED:
+            return self.get_response(request)
+
+        trigger = self._trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+
+        profiler = PROFILERS[settings.PROFILING_MODE]()
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+
+        _save_profile(
+            profiler, request, response, trigger, time.perf_counter() - started
+        )
+        return response
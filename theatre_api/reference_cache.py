@@ -0,0 +1,276 @@
+"""
+Process-local, read-through cache of theatre halls, plays and
+performances: the few fields validation and list serializers need.
+
+Every kind has a version number in the shared Django cache. Saving or
+deleting a row clears the local copy at once and bumps the version when
+the transaction commits; other processes compare versions at most every
+`REFERENCE_CACHE_CHECK_INTERVAL` seconds and reload on change. Writes
+that bypass model signals (`QuerySet.update`, raw deletes) must call
+`invalidate`, as `deletion.delete_performances` does.
+
+Versions only reach other processes through a shared cache backend
+(`CACHE_URL`), so rows are only kept across requests when
+`REFERENCE_CACHE_ENABLED`, which defaults to whether the backend is
+shared. Otherwise `ReferenceCacheMiddleware` (or the `scope()` context
+manager, outside requests) keeps them for one request. Either way
+`prefetch` loads the rows of a whole page in one query, so lists cost a
+fixed number of queries. A row missing from a read replica is looked up
+on the primary before reporting it as missing.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import NamedTuple
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+from django.db.models.signals import post_delete, post_save
+from django.http import Http404
+
+
+class HallInfo(NamedTuple):
+    id: int
+    name: str
+    rows: int
+    seats_in_row: int
+
+    @property
+    def capacity(self) -> int:
+        return self.rows * self.seats_in_row
+
+
+class PlayInfo(NamedTuple):
+    id: int
+    title: str
+    poster: str
+
+
+class PerformanceInfo(NamedTuple):
+    id: int
+    play_id: int
+    theatre_hall_id: int
+    show_time: object
+
+
+def _objects(model_name, primary):
+    model = apps.get_model("theatre_api", model_name)
+    if primary:
+        return model.objects.db_manager(router.db_for_write(model))
+    return model.objects
+
+
+def _load_halls(ids, primary=False):
+    # A few dozen rows: always load them all
+    return {
+        row[0]: HallInfo(*row)
+        for row in _objects("TheatreHall", primary).values_list(
+            "id", "name", "rows", "seats_in_row"
+        )
+    }
+
+
+def _load_plays(ids, primary=False):
+    plays = _objects("Play", primary).filter(pk__in=ids)
+    return {
+        pk: PlayInfo(pk, title, poster or "")
+        for pk, title, poster in plays.values_list("id", "title", "poster")
+    }
+
+
+def _load_performances(ids, primary=False):
+    performances = _objects("Performance", primary).filter(pk__in=ids)
+    return {
+        row[0]: PerformanceInfo(*row)
+        for row in performances.values_list(
+            "id", "play_id", "theatre_hall_id", "show_time"
+        )
+    }
+
+
+# {kind: {pk: info}} of the current request, when rows are not kept
+# across requests
+_scope = ContextVar("reference_cache_scope", default=None)
+
+
+class _Store:
+    def __init__(self, kind, loader):
+        self.kind = kind
+        self.loader = loader
+        self.items = {}
+        self.version = None
+        self.checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    @property
+    def version_key(self) -> str:
+        return f"reference_cache:{self.kind}:version"
+
+    def _load(self, ids) -> dict:
+        loaded = self.loader(ids)
+        missing = [pk for pk in ids if pk not in loaded]
+        if missing:
+            # Not replicated yet, or deleted
+            loaded.update(self.loader(missing, primary=True))
+        return loaded
+
+    def _kept(self):
+        """Rows kept now: of the process, of the request or none"""
+        if not settings.REFERENCE_CACHE_ENABLED:
+            scope = _scope.get()
+            return None if scope is None else scope.setdefault(self.kind, {})
+
+        now = time.monotonic()
+        if now - self.checked_at > settings.REFERENCE_CACHE_CHECK_INTERVAL:
+            version = cache.get(self.version_key, 0)
+            with self._lock:
+                if version != self.version:
+                    self.items = {}
+                    self.version = version
+                self.checked_at = now
+        return self.items
+
+    def _keep(self, items, loaded):
+        if items is not self.items:
+            items.update(loaded)
+            return
+        with self._lock:
+            if len(self.items) >= settings.REFERENCE_CACHE_MAX_ITEMS:
+                self.items = {}
+            self.items.update(loaded)
+
+    def get(self, pk):
+        items = self._kept()
+        item = None if items is None else items.get(pk)
+        if item is None:
+            loaded = self._load([pk])
+            if items is not None:
+                self._keep(items, loaded)
+            item = loaded.get(pk)
+        return item
+
+    def prefetch(self, ids):
+        items = self._kept()
+        if items is None:
+            return
+        missing = list({pk for pk in ids if pk not in items})
+        if missing:
+            self._keep(items, self._load(missing))
+
+    def clear(self):
+        scope = _scope.get()
+        if scope is not None:
+            scope.pop(self.kind, None)
+        with self._lock:
+            self.items = {}
+
+    def bump(self):
+        cache.add(self.version_key, 0, timeout=None)
+        cache.incr(self.version_key)
+        self.clear()
+
+
+_stores = {
+    "hall": _Store("hall", _load_halls),
+    "play": _Store("play", _load_plays),
+    "performance": _Store("performance", _load_performances),
+}
+
+
+def get_hall(pk):
+    """`HallInfo` of a theatre hall, `None` if it does not exist"""
+    return _stores["hall"].get(pk)
+
+
+def get_play(pk):
+    return _stores["play"].get(pk)
+
+
+def get_performance(pk):
+    return _stores["performance"].get(pk)
+
+
+def prefetch(kind, ids):
+    """Load the `kind` rows of `ids` not kept yet, in one query"""
+    _stores[kind].prefetch(ids)
+
+
+@contextmanager
+def scope():
+    """Keep rows loaded in the block until its end"""
+    token = _scope.set({})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+class ReferenceCacheMiddleware:
+    """Keep rows for the request when they are not kept across requests"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with scope():
+            return self.get_response(request)
+
+
+def _get_or_404(kind, pk):
+    item = _stores[kind].get(pk)
+    if item is None:
+        raise Http404(f"No {kind} {pk}.")
+    return item
+
+
+def get_hall_or_404(pk):
+    """Like `get_hall`, for callers that cannot go on without the hall"""
+    return _get_or_404("hall", pk)
+
+
+def get_play_or_404(pk):
+    return _get_or_404("play", pk)
+
+
+def performance_instance(info):
+    """Unsaved-looking `Performance` built from cached data, no query"""
+    Performance = apps.get_model("theatre_api", "Performance")
+    performance = Performance(
+        id=info.id,
+        play_id=info.play_id,
+        theatre_hall_id=info.theatre_hall_id,
+        show_time=info.show_time,
+    )
+    performance._state.adding = False
+    performance._state.db = router.db_for_read(Performance)
+    return performance
+
+
+def invalidate(kind):
+    """Drop cached `kind` rows here now, everywhere once committed"""
+    store = _stores[kind]
+    store.clear()
+    transaction.on_commit(store.bump)
+
+
+def connect_signals():
+    for model_name, kind in (
+        ("TheatreHall", "hall"),
+        ("Play", "play"),
+        ("Performance", "performance"),
+    ):
+        model = apps.get_model("theatre_api", model_name)
+
+        def receiver(sender, kind=kind, **kwargs):
+            invalidate(kind)
+
+        post_save.connect(
+            receiver, sender=model, weak=False, dispatch_uid=f"ref_{kind}"
+        )
+        post_delete.connect(
+            receiver, sender=model, weak=False, dispatch_uid=f"ref_{kind}"
+        )
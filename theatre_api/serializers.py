@@ -1,13 +1,33 @@
-from django.db import transaction
+from django.conf import settings
+from django.db import IntegrityError, router, transaction
+from django.db import models
+from django.db.models import Count
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
+from theatre_api import analytics
+from theatre_api.checkin import (
+    ADMITTED,
+    ALREADY_SCANNED,
+    INVALID,
+    UNKNOWN_TICKET,
+    WRONG_PERFORMANCE,
+)
+from theatre_api.reference_cache import (
+    get_hall,
+    get_hall_or_404,
+    get_performance,
+    get_play_or_404,
+    performance_instance,
+    prefetch,
+)
 from theatre_api.models import (
     Genre,
     Actor,
     TheatreHall,
     Play,
     Performance,
+    PerformanceSeries,
     Ticket,
     Reservation,
 )
@@ -24,6 +44,7 @@ class ActorSerializer(serializers.ModelSerializer):
         model = Actor
         fields = ("id", "first_name", "last_name", "full_name")
         read_only_fields = ("full_name",)
+        field_sources = {"full_name": ["first_name", "last_name"]}
 
 
 class TheatreHallSerializer(serializers.ModelSerializer):
@@ -31,6 +52,7 @@ class TheatreHallSerializer(serializers.ModelSerializer):
         model = TheatreHall
         fields = ("id", "name", "rows", "seats_in_row", "capacity")
         read_only_fields = ("capacity",)
+        field_sources = {"capacity": ["rows", "seats_in_row"]}
 
 
 class PlaySerializer(serializers.ModelSerializer):
@@ -86,15 +108,124 @@ class PerformanceSerializer(serializers.ModelSerializer):
         fields = ("id", "show_time", "play", "theatre_hall")
 
 
-class PerformanceListSerializer(PerformanceSerializer):
-    play_title = serializers.CharField(source="play.title", read_only=True)
-    play_poster = serializers.ImageField(source="play.poster", read_only=True)
-    theatre_hall_name = serializers.CharField(
-        source="theatre_hall.name", read_only=True
+class PerformanceSeriesSerializer(serializers.ModelSerializer):
+    performances = serializers.IntegerField(
+        source="performance_count", read_only=True
     )
-    theatre_hall_capacity = serializers.IntegerField(
-        source="theatre_hall.capacity", read_only=True
+
+    class Meta:
+        model = PerformanceSeries
+        fields = (
+            "id",
+            "play",
+            "theatre_hall",
+            "frequency",
+            "interval",
+            "weekdays",
+            "show_time",
+            "start_date",
+            "end_date",
+            "performances",
+        )
+        extra_kwargs = {"interval": {"min_value": 1}}
+
+    def validate_weekdays(self, value):
+        if not isinstance(value, list) or any(
+            not isinstance(day, int) or not 0 <= day <= 6 for day in value
+        ):
+            raise ValidationError(
+                "Must be a list of weekdays from 0 (Monday) to 6 (Sunday)."
+            )
+        return sorted(set(value))
+
+    def validate(self, attrs):
+        if attrs["end_date"] < attrs["start_date"]:
+            raise ValidationError(
+                {"end_date": "Must not be before the start date."}
+            )
+        # Checked before anything walks the days of the range
+        max_days = (
+            settings.SERIES_MAX_PERFORMANCES * 7 * attrs.get("interval", 1)
+        )
+        if (attrs["end_date"] - attrs["start_date"]).days > max_days:
+            raise ValidationError(
+                {
+                    "end_date": f"A series with this interval spans at "
+                    f"most {max_days} days."
+                }
+            )
+        if attrs.get("frequency", PerformanceSeries.WEEKLY) == (
+            PerformanceSeries.DAILY
+        ):
+            attrs["weekdays"] = []
+        elif not attrs.get("weekdays"):
+            attrs["weekdays"] = [attrs["start_date"].weekday()]
+        return attrs
+
+
+class PerformanceSeriesRescheduleSerializer(serializers.Serializer):
+    show_time = serializers.TimeField(
+        required=False, help_text="New time of day"
+    )
+    theatre_hall = serializers.PrimaryKeyRelatedField(
+        queryset=TheatreHall.objects.all(), required=False
+    )
+    from_date = serializers.DateField(
+        required=False,
+        help_text="Move the performances from this day on, today by default",
+    )
+
+    def validate(self, attrs):
+        if "show_time" not in attrs and "theatre_hall" not in attrs:
+            raise ValidationError("Give a new show_time or theatre_hall.")
+        return attrs
+
+
+class PerformanceSeriesCancelSerializer(serializers.Serializer):
+    from_date = serializers.DateField(
+        required=False,
+        help_text="Cancel the performances from this day on, today by "
+        "default",
     )
+
+
+def _prefetch_references(performances, plays=True, halls=True):
+    """Load the plays and halls of `performances` in one query each"""
+    if plays:
+        prefetch("play", [performance.play_id for performance in performances])
+    if halls:
+        prefetch(
+            "hall",
+            [performance.theatre_hall_id for performance in performances],
+        )
+
+
+class PerformancePageSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        if isinstance(data, models.manager.BaseManager):
+            data = data.all()
+        performances = list(data)
+        # Columns left out with ?fields= are deferred, do not load them
+        sources = {
+            column
+            for name in self.child.fields
+            for column in self.child.Meta.field_sources.get(name, ())
+        }
+        _prefetch_references(
+            performances,
+            plays="play_id" in sources,
+            halls="theatre_hall_id" in sources,
+        )
+        return super().to_representation(performances)
+
+
+class PerformanceListSerializer(PerformanceSerializer):
+    """Play and hall fields come from the reference cache, not joins"""
+
+    play_title = serializers.SerializerMethodField()
+    play_poster = serializers.SerializerMethodField()
+    theatre_hall_name = serializers.SerializerMethodField()
+    theatre_hall_capacity = serializers.SerializerMethodField()
     tickets_available = serializers.IntegerField(read_only=True)
 
     class Meta:
@@ -108,15 +239,113 @@ class PerformanceListSerializer(PerformanceSerializer):
             "theatre_hall_capacity",
             "tickets_available",
         )
+        list_serializer_class = PerformancePageSerializer
+        # Columns the method fields read, see theatre_api/fieldsets.py
+        field_sources = {
+            "play_title": ["play_id"],
+            "play_poster": ["play_id"],
+            "theatre_hall_name": ["theatre_hall_id"],
+            "theatre_hall_capacity": ["theatre_hall_id"],
+        }
+
+    def get_play_title(self, performance) -> str:
+        return get_play_or_404(performance.play_id).title
+
+    def get_play_poster(self, performance) -> str | None:
+        poster = get_play_or_404(performance.play_id).poster
+        if not poster:
+            return None
+        url = Play._meta.get_field("poster").storage.url(poster)
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
+
+    def get_theatre_hall_name(self, performance) -> str:
+        return get_hall_or_404(performance.theatre_hall_id).name
+
+    def get_theatre_hall_capacity(self, performance) -> int:
+        return get_hall_or_404(performance.theatre_hall_id).capacity
+
+
+class PerformanceCalendarDaySerializer(serializers.Serializer):
+    date = serializers.DateField()
+    performances = serializers.IntegerField()
+    seats_available = serializers.IntegerField()
+
+
+class OccupancySerializer(serializers.Serializer):
+    key = serializers.CharField(help_text="Play id, hall id or show date")
+    name = serializers.CharField()
+    performances = serializers.IntegerField()
+    capacity = serializers.IntegerField()
+    tickets_sold = serializers.IntegerField()
+    occupancy = serializers.FloatField(help_text="Percent of seats sold")
+
+
+class PlaySalesDaySerializer(serializers.Serializer):
+    date = serializers.DateField()
+    play = serializers.IntegerField()
+    title = serializers.CharField()
+    tickets = serializers.IntegerField()
+
+
+class BookingHourSerializer(serializers.Serializer):
+    weekday = serializers.IntegerField(help_text="0 is Monday")
+    hour = serializers.IntegerField()
+    tickets = serializers.IntegerField()
+
+
+class WaitingRoomSerializer(serializers.Serializer):
+    capacity = serializers.IntegerField(min_value=1)
+
+
+class CheckInBatchSerializer(serializers.Serializer):
+    entrance = serializers.CharField(
+        max_length=64, required=False, allow_blank=True, default=""
+    )
+    scans = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        allow_empty=False,
+        max_length=settings.CHECKIN_MAX_BATCH,
+    )
+
+
+class CheckInResultSerializer(serializers.Serializer):
+    ticket = serializers.IntegerField(allow_null=True)
+    result = serializers.ChoiceField(
+        choices=[
+            ADMITTED,
+            ALREADY_SCANNED,
+            INVALID,
+            UNKNOWN_TICKET,
+            WRONG_PERFORMANCE,
+        ]
+    )
+
+
+class CachedPerformanceField(serializers.PrimaryKeyRelatedField):
+    """Look performances up in the reference cache instead of the DB"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            info = get_performance(int(data))
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if info is None:
+            self.fail("does_not_exist", pk_value=data)
+        return performance_instance(info)
 
 
 class TicketSerializer(serializers.ModelSerializer):
+    performance = CachedPerformanceField(queryset=Performance.objects.all())
+
     def validate(self, attrs):
         data = super(TicketSerializer, self).validate(attrs=attrs)
         Ticket.validate_ticket(
             attrs["row"],
             attrs["seat"],
-            attrs["performance"].theatre_hall,
+            get_hall(attrs["performance"].theatre_hall_id),
             ValidationError,
         )
         return data
@@ -155,19 +384,140 @@ class ReservationSerializer(serializers.ModelSerializer):
         model = Reservation
         fields = ("id", "tickets", "created_at")
 
+    @staticmethod
+    def _check_performances_exist(tickets_data):
+        """
+        Performances come from the reference cache, which may still hold
+        one deleted meanwhile: look them up on the primary.
+        """
+        ids = {ticket["performance"].pk for ticket in tickets_data}
+        existing = set(
+            Performance.objects.db_manager(router.db_for_write(Performance))
+            .filter(pk__in=ids)
+            .values_list("pk", flat=True)
+        )
+        if ids - existing:
+            raise ValidationError(
+                {
+                    "tickets": [
+                        f"Performance {pk} does not exist."
+                        for pk in sorted(ids - existing)
+                    ]
+                }
+            )
+
     def create(self, validated_data):
         """Creates tickets for an exactly one reservation"""
-        with transaction.atomic():
-            tickets_data = validated_data.pop("tickets")
-            reservation = Reservation.objects.create(**validated_data)
-            for ticket_data in tickets_data:
-                Ticket.objects.create(reservation=reservation, **ticket_data)
-            return reservation
+        tickets_data = validated_data.pop("tickets")
+        try:
+            with transaction.atomic():
+                self._check_performances_exist(tickets_data)
+                reservation = Reservation.objects.create(**validated_data)
+                tickets = [
+                    Ticket.objects.create(
+                        reservation=reservation, **ticket_data
+                    )
+                    for ticket_data in tickets_data
+                ]
+                analytics.record_reservation(reservation, tickets)
+        except IntegrityError:
+            # A performance deleted after the check, or a seat taken
+            self._check_performances_exist(tickets_data)
+            raise
+        return reservation
+
+
+class ReservationPageSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        reservations = list(data)
+        if "tickets" in self.child.fields:
+            _prefetch_references(
+                [
+                    ticket.performance
+                    for reservation in reservations
+                    for ticket in reservation.tickets.all()
+                ]
+            )
+        return super().to_representation(reservations)
 
 
 class ReservationListSerializer(ReservationSerializer):
     tickets = TicketListSerializer(many=True, read_only=True)
 
+    class Meta(ReservationSerializer.Meta):
+        list_serializer_class = ReservationPageSerializer
+
 
 class ReservationDetailSerializer(ReservationSerializer):
     tickets = TicketListSerializer(many=True, read_only=True)
+
+
+class ReservationHistoryListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        """
+        Count sold tickets of all listed performances in one query, load
+        their plays and halls in one query each.
+        """
+        reservations = list(data)
+        if "performances" not in self.child.fields:
+            # Left out with ?fields=, tickets were not prefetched
+            return super().to_representation(reservations)
+        performances = {
+            ticket.performance_id: ticket.performance
+            for reservation in reservations
+            for ticket in reservation.tickets.all()
+        }
+        _prefetch_references(list(performances.values()))
+        performance_ids = set(performances)
+        self.context["tickets_sold"] = dict(
+            Ticket.objects.filter(performance_id__in=performance_ids)
+            .order_by()
+            .values("performance")
+            .annotate(count=Count("id"))
+            .values_list("performance", "count")
+        )
+        self.context["performances"] = {}
+        return super().to_representation(reservations)
+
+
+class ReservationHistorySerializer(serializers.ModelSerializer):
+    """
+    Reservation with its tickets grouped by performance: every performance
+    is serialized once, with its seats as a compact [row, seat] list.
+    """
+
+    performances = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Reservation
+        fields = ("id", "created_at", "performances")
+        list_serializer_class = ReservationHistoryListSerializer
+        field_sources = {"performances": ["tickets"]}
+
+    def _serialize_performance(self, performance) -> dict:
+        performances = self.context.setdefault("performances", {})
+        if performance.id not in performances:
+            tickets_sold = self.context.get("tickets_sold")
+            if tickets_sold is None:
+                tickets_sold = {performance.id: performance.tickets.count()}
+            performance.tickets_available = get_hall_or_404(
+                performance.theatre_hall_id
+            ).capacity - tickets_sold.get(performance.id, 0)
+            performances[performance.id] = PerformanceListSerializer(
+                performance, context=self.context
+            ).data
+        return performances[performance.id]
+
+    def get_performances(self, reservation) -> list:
+        groups = {}
+        for ticket in reservation.tickets.all():
+            group = groups.get(ticket.performance_id)
+            if group is None:
+                group = groups[ticket.performance_id] = {
+                    "performance": self._serialize_performance(
+                        ticket.performance
+                    ),
+                    "seats": [],
+                }
+            group["seats"].append([ticket.row, ticket.seat])
+        return list(groups.values())
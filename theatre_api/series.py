@@ -0,0 +1,269 @@
+"""
+Recurring performance series.
+
+A `PerformanceSeries` is a play in a hall at a time of day, daily or on
+some weekdays, every `interval` days or weeks between two dates. All
+its performances are created with one `bulk_create`, after a single
+range query on the hall's shows: two performances in a hall must start
+at least `PERFORMANCE_MIN_GAP_MINUTES` apart. The hall row stays locked
+meanwhile, so concurrent series in a hall cannot both pass the check.
+
+Rescheduling (another time of day or hall) and cancelling apply to the
+performances from a date on, with set-based statements: one UPDATE per
+distinct time shift (a shift in UTC differs across DST changes only),
+and the partition month of tickets and the sales rollup follow along.
+Cancelling goes through `delete_performances`. Bulk statements send no
+model signals, so the reference cache and the catalog are refreshed
+here.
+"""
+
+import bisect
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Q
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from theatre_api import catalog, reference_cache
+from theatre_api.deletion import delete_performances
+from theatre_api.models import (
+    Performance,
+    PerformanceSales,
+    PerformanceSeries,
+    TheatreHall,
+    Ticket,
+)
+
+
+def _day_start(date_):
+    return timezone.make_aware(datetime.combine(date_, time.min))
+
+
+def _local_show_time(date_, time_of_day):
+    return timezone.make_aware(datetime.combine(date_, time_of_day))
+
+
+def occurrences(series) -> list:
+    """Show times of `series` as aware datetimes, in order"""
+    show_times = []
+    weekdays = set(series.weekdays)
+    day = series.start_date
+    while day <= series.end_date:
+        elapsed = (day - series.start_date).days
+        if series.frequency == PerformanceSeries.DAILY:
+            matches = elapsed % series.interval == 0
+        else:
+            # Weeks start on Monday, counted from the start date's week
+            week = (elapsed + series.start_date.weekday()) // 7
+            matches = day.weekday() in weekdays and week % series.interval == 0
+        if matches:
+            show_times.append(_local_show_time(day, series.show_time))
+        day += timedelta(days=1)
+    return show_times
+
+
+def find_conflicts(theatre_hall_id, show_times, exclude=None) -> list:
+    """
+    Show times less than `PERFORMANCE_MIN_GAP_MINUTES` away from a show
+    in the hall, other than the `exclude` ones (a Q), in one query.
+    """
+    if not show_times:
+        return []
+    gap = timedelta(minutes=settings.PERFORMANCE_MIN_GAP_MINUTES)
+    existing = Performance.objects.filter(
+        theatre_hall_id=theatre_hall_id,
+        show_time__gt=min(show_times) - gap,
+        show_time__lt=max(show_times) + gap,
+    )
+    if exclude is not None:
+        existing = existing.exclude(exclude)
+    taken = sorted(
+        existing.order_by().values_list("show_time", flat=True).iterator()
+    )
+
+    conflicts = []
+    for show_time in show_times:
+        index = bisect.bisect_left(taken, show_time - gap)
+        if index < len(taken) and taken[index] < show_time + gap:
+            conflicts.append(show_time)
+    return conflicts
+
+
+def _raise_conflicts(conflicts):
+    raise ValidationError(
+        {
+            "conflicts": [
+                "The hall has another performance near "
+                f"{timezone.localtime(show_time).isoformat()}."
+                for show_time in conflicts
+            ]
+        }
+    )
+
+
+def _performances_changed():
+    reference_cache.invalidate("performance")
+    transaction.on_commit(
+        lambda: catalog.schedule_build(settings.CATALOG_REBUILD_DELAY)
+    )
+
+
+def _lock_hall(pk):
+    """
+    Lock a hall row until the transaction ends, so concurrent series
+    writes in the hall check conflicts one after the other.
+    """
+    return TheatreHall.objects.select_for_update().get(pk=pk)
+
+
+def create_series(series) -> list:
+    """Save an unsaved `series` and create its performances"""
+    show_times = occurrences(series)
+    if not show_times:
+        raise ValidationError(
+            {"end_date": "The rule gives no performance in this range."}
+        )
+    if len(show_times) > settings.SERIES_MAX_PERFORMANCES:
+        raise ValidationError(
+            {
+                "end_date": "A series has at most "
+                f"{settings.SERIES_MAX_PERFORMANCES} performances, this "
+                f"one would have {len(show_times)}."
+            }
+        )
+
+    with transaction.atomic():
+        hall = _lock_hall(series.theatre_hall_id)
+        conflicts = find_conflicts(hall.pk, show_times)
+        if conflicts:
+            _raise_conflicts(conflicts)
+        series.save()
+        performances = Performance.objects.bulk_create(
+            [
+                Performance(
+                    play_id=series.play_id,
+                    theatre_hall_id=series.theatre_hall_id,
+                    show_time=show_time,
+                    series=series,
+                )
+                for show_time in show_times
+            ]
+        )
+        capacity = hall.capacity
+        PerformanceSales.objects.bulk_create(
+            [
+                PerformanceSales(
+                    performance_id=performance.pk,
+                    play_id=series.play_id,
+                    theatre_hall_id=series.theatre_hall_id,
+                    show_date=timezone.localdate(performance.show_time),
+                    capacity=capacity,
+                )
+                for performance in performances
+            ]
+        )
+        _performances_changed()
+    return performances
+
+
+def _upcoming(series, from_date):
+    return Performance.objects.filter(
+        series=series,
+        show_time__gte=_day_start(from_date or timezone.localdate()),
+    )
+
+
+def reschedule_series(
+    series, show_time=None, theatre_hall=None, from_date=None
+) -> int:
+    """
+    Move the performances of `series` from `from_date` (today by
+    default) to another time of day and/or hall, return their number.
+    """
+    new_time = show_time or series.show_time
+    hall = theatre_hall or series.theatre_hall
+    performances = _upcoming(series, from_date)
+
+    with transaction.atomic():
+        _lock_hall(hall.pk)
+        moved = {
+            pk: (
+                old,
+                _local_show_time(timezone.localdate(old), new_time),
+            )
+            for pk, old in performances.select_for_update().values_list(
+                "pk", "show_time"
+            )
+        }
+        conflicts = find_conflicts(
+            hall.pk,
+            [new for _, new in moved.values()],
+            exclude=Q(pk__in=performances.values("pk")),
+        )
+        if conflicts:
+            _raise_conflicts(conflicts)
+
+        hall_changed = hall.pk != series.theatre_hall_id
+        if hall_changed:
+            seats = Ticket.objects.filter(
+                performance_id__in=list(moved)
+            ).aggregate(row=Max("row"), seat=Max("seat"))
+            if (seats["row"] or 0) > hall.rows or (
+                seats["seat"] or 0
+            ) > hall.seats_in_row:
+                raise ValidationError(
+                    {
+                        "theatre_hall": "Sold seats up to row "
+                        f"{seats['row']}, seat {seats['seat']} do not "
+                        "exist in this hall."
+                    }
+                )
+
+        by_shift = defaultdict(list)
+        by_month = defaultdict(list)
+        by_date = defaultdict(list)
+        for pk, (old, new) in moved.items():
+            by_shift[new - old].append(pk)
+            month = Performance(show_time=new).show_month
+            if month != Performance(show_time=old).show_month:
+                by_month[month].append(pk)
+            date_ = timezone.localdate(new)
+            if date_ != timezone.localdate(old):
+                by_date[date_].append(pk)
+
+        for shift, ids in by_shift.items():
+            if shift or hall_changed:
+                Performance.objects.filter(pk__in=ids).update(
+                    show_time=F("show_time") + shift, theatre_hall=hall
+                )
+        for month, ids in by_month.items():
+            Ticket.objects.filter(performance_id__in=ids).update(
+                show_month=month
+            )
+        for date_, ids in by_date.items():
+            PerformanceSales.objects.filter(performance_id__in=ids).update(
+                show_date=date_
+            )
+        if hall_changed:
+            PerformanceSales.objects.filter(
+                performance_id__in=list(moved)
+            ).update(theatre_hall_id=hall.pk, capacity=hall.capacity)
+
+        series.show_time = new_time
+        series.theatre_hall = hall
+        series.save(update_fields=["show_time", "theatre_hall"])
+        _performances_changed()
+    return len(moved)
+
+
+def cancel_series(series, from_date=None) -> dict:
+    """
+    Delete the performances of `series` from `from_date` (today by
+    default) with their tickets, return deleted row counts.
+    """
+    deleted = delete_performances(_upcoming(series, from_date))
+    _performances_changed()
+    return deleted
@@ -0,0 +1,48 @@
+from django.conf import settings
+
+from theatre_api import analytics, catalog, checkin, etickets
+from theatre_api.idempotency import prune_idempotency_keys as _prune_keys
+from theatre_api.jobs import prune_jobs as _prune_jobs
+from theatre_api.jobs import task
+
+
+@task
+def noop(**payload):
+    """Does nothing, used by benchmark_jobs to measure queue overhead"""
+
+
+@task
+def prune_idempotency_keys():
+    _prune_keys()
+
+
+@task
+def prune_jobs():
+    _prune_jobs()
+
+
+@task
+def prune_etickets():
+    etickets.prune_etickets()
+
+
+@task
+def render_performance_etickets(performance_id, formats=("pdf",)):
+    etickets.render_performance_etickets(performance_id, formats)
+
+
+@task
+def record_check_ins(**scans):
+    checkin.record_check_ins(**scans)
+
+
+@task
+def apply_sales(deltas):
+    analytics.apply_sales(deltas)
+
+
+@task
+def build_catalog():
+    catalog.build_catalog()
+    # Refresh the availability counts even when nothing else changes
+    catalog.schedule_build(settings.CATALOG_MAX_AGE)
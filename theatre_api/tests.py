@@ -1,17 +1,93 @@
 import datetime
+import gzip
+import importlib.util
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
 
+import brotli
+import dj_database_url
+from django.conf import settings
+from django.contrib import admin
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core import signing
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.http import Http404, HttpResponse
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APIClient
 
+from theatre_api import catalog, manifest, metrics
+from theatre_api.admin import PerformanceAdmin
+from theatre_api.checkin import reset_gates
+from theatre_api.checks import check_shared_cache
+from theatre_api.deletion import delete_reservations, tickets_bulk_deleted
+from theatre_api.etickets import (
+    read_ticket_token,
+    render_performance_etickets,
+    ticket_token,
+)
+from theatre_api.health import reset_readiness
+from theatre_api.idempotency import prune_idempotency_keys
+from theatre_api.jobs import Worker, claim_jobs, enqueue, prune_jobs, task
+from theatre_api.management.commands.import_times import parse_importtime
+from theatre_api.instrumentation import (
+    QueryBudgetExceeded,
+    get_route_stats,
+    reset_route_stats,
+)
 from theatre_api.models import (
     Actor,
     Genre,
     Play,
     TheatreHall,
     Performance,
+    Reservation,
+    IdempotencyKey,
+    Ticket,
+    ArchivedTicket,
+    ArchivedReservation,
+    Job,
+    CheckIn,
+    PerformanceSales,
+    PerformanceSeries,
+    TicketChange,
+    DailyPlaySales,
+    HourlyBookings,
+)
+from theatre_api.partitioning import (
+    DEFAULT_PARTITION,
+    convert_ticket_table,
+    create_future_partitions,
+    partition_name,
 )
+from theatre_api.reference_cache import (
+    get_hall,
+    get_hall_or_404,
+    get_performance,
+)
+from theatre_api.views import PlayViewSet
+from theatre_api.waiting_room import WaitingRoom
+from theatre_core.db_routing import (
+    PIN_COOKIE,
+    ReplicaRouter,
+    ReplicaRoutingMiddleware,
+)
+from theatre_core.postgresql_pool import base as pool_base
+from theatre_core.startup import pending_migrations
 
 User = get_user_model()
 
@@ -261,3 +337,2360 @@ class StaffTheatreApiDeleteTests(TestCase):
                 response = self.client.get(detail_endpoint)
                 self.assertEqual(response.status_code, 200)
                 self.assertEqual(response.data["id"], created_id)
+
+
+class QueryTimingMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.token = get_user_token()
+        (
+            self.client,
+            self.actor,
+            self.genre,
+            self.theatre_hall,
+            self.play,
+            self.performance,
+            self.reservation_data,
+        ) = setup_common_data(self.token)
+        reset_route_stats()
+
+    def test_server_timing_header_and_route_stats(self):
+        response = self.client.get(reverse("theatre_api:play-list"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("sql;dur=", response["Server-Timing"])
+        self.assertIn("serializer;dur=", response["Server-Timing"])
+        stats = get_route_stats()["GET theatre_api:play-list"]
+        self.assertEqual(stats["requests"], 1)
+        self.assertGreater(stats["sql_count"], 0)
+
+    @override_settings(
+        QUERY_BUDGET_STRICT=True,
+        QUERY_BUDGETS={"GET theatre_api:play-list": 0},
+    )
+    def test_strict_query_budget_raises(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse("theatre_api:play-list"))
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_reservation_list_within_budget(self):
+        for seat in range(2, 6):
+            self.reservation_data["tickets"].append(
+                {"row": 1, "seat": seat, "performance": self.performance.id}
+            )
+        self.client.post(
+            reverse("theatre_api:reservation-list"),
+            self.reservation_data,
+            format="json",
+        )
+
+        response = self.client.get(reverse("theatre_api:reservation-list"))
+
+        self.assertEqual(response.status_code, 200)
+
+    def _create_performances(self, count):
+        halls = [
+            TheatreHall.objects.create(
+                name=f"Hall {i}", rows=10, seats_in_row=10
+            )
+            for i in range(3)
+        ]
+        return [
+            Performance.objects.create(
+                play=Play.objects.create(title=f"Play {i}", description=""),
+                theatre_hall=halls[i % len(halls)],
+                show_time=timezone.now() + datetime.timedelta(days=1),
+            )
+            for i in range(count)
+        ]
+
+    @override_settings(QUERY_BUDGET_STRICT=True, REFERENCE_CACHE_ENABLED=False)
+    def test_performance_list_within_budget_without_reference_cache(self):
+        self._create_performances(30)
+
+        response = self.client.get(reverse("theatre_api:performance-list"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 31)
+
+    @override_settings(QUERY_BUDGET_STRICT=True, REFERENCE_CACHE_ENABLED=False)
+    def test_reservation_list_within_budget_without_reference_cache(self):
+        for performance in self._create_performances(10):
+            for seat in range(1, 4):
+                Ticket.objects.create(
+                    row=1,
+                    seat=seat,
+                    performance=performance,
+                    reservation=Reservation.objects.create(user=self.user),
+                )
+
+        response = self.client.get(reverse("theatre_api:reservation-list"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 30)
+
+
+class SamplingProfilerTests(TestCase):
+
+    def setUp(self):
+        self.user = create_admin_user()
+        self.token = get_admin_token()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.token)
+        self.profiles_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profiles_dir)
+
+    def test_signed_header_request_is_profiled_and_downloadable(self):
+        with override_settings(
+            PROFILING_ENABLED=True, PROFILING_DIR=self.profiles_dir
+        ):
+            response = self.client.post(reverse("theatre_api:profiles-token"))
+            profile_token = response.data["token"]
+            self.assertEqual(
+                self.client.get(reverse("theatre_api:profiles-list")).data,
+                [],
+            )
+
+            self.client.get(
+                reverse("theatre_api:genre-list"),
+                HTTP_X_PROFILE=profile_token,
+            )
+            self.client.get(
+                reverse("theatre_api:genre-list"), HTTP_X_PROFILE="forged"
+            )
+
+            profiles = self.client.get(
+                reverse("theatre_api:profiles-list")
+            ).data
+            self.assertEqual(len(profiles), 1)
+            self.assertEqual(
+                profiles[0]["view_name"], "theatre_api:genre-list"
+            )
+            response = self.client.get(
+                reverse(
+                    "theatre_api:profiles-detail", args=[profiles[0]["id"]]
+                )
+            )
+            self.assertEqual(response.status_code, 200)
+
+    def test_oldest_profiles_are_pruned(self):
+        with override_settings(
+            PROFILING_ENABLED=True,
+            PROFILING_SAMPLE_RATE=1.0,
+            PROFILING_DIR=self.profiles_dir,
+            PROFILING_MAX_PROFILES=2,
+        ):
+            for _ in range(4):
+                self.client.get(reverse("theatre_api:genre-list"))
+            profiles = self.client.get(
+                reverse("theatre_api:profiles-list")
+            ).data
+
+        # The listing itself was sampled too
+        self.assertEqual(len(profiles), 2)
+        self.assertEqual(len(os.listdir(self.profiles_dir)), 4)
+
+    def test_profiles_are_staff_only(self):
+        create_user()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Bearer " + get_user_token())
+
+        response = client.get(reverse("theatre_api:profiles-list"))
+
+        self.assertEqual(response.status_code, 403)
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.token = get_user_token()
+        (
+            self.client,
+            self.actor,
+            self.genre,
+            self.theatre_hall,
+            self.play,
+            self.performance,
+            self.reservation_data,
+        ) = setup_common_data(self.token)
+        metrics.registry.reset()
+
+    def test_request_and_reservation_metrics(self):
+        reservation_url = reverse("theatre_api:reservation-list")
+        self.client.post(reservation_url, self.reservation_data, format="json")
+        self.client.post(reservation_url, self.reservation_data, format="json")
+        self.client.post(
+            reservation_url,
+            {
+                "tickets": [
+                    {"row": 100, "seat": 1, "performance": self.performance.id}
+                ]
+            },
+            format="json",
+        )
+
+        response = self.client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('theatre_reservations_total{outcome="success"} 1', body)
+        self.assertIn(
+            'theatre_reservations_total{outcome="seat_conflict"} 1', body
+        )
+        self.assertIn(
+            'theatre_reservations_total{outcome="validation_error"} 1', body
+        )
+        self.assertIn(
+            'theatre_http_requests_total{action="create",method="POST",'
+            'status="201",view="ReservationViewSet"} 1',
+            body,
+        )
+        self.assertIn(
+            "theatre_http_request_duration_seconds_count"
+            '{action="create",view="ReservationViewSet"} 3',
+            body,
+        )
+
+    def test_snapshots_of_other_processes_are_merged(self):
+        metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, metrics_dir)
+        other_process = {
+            "counters": [
+                ["theatre_throttle_rejections_total", [["scope", "user"]], 2]
+            ],
+            "histograms": [],
+        }
+        with open(f"{metrics_dir}/metrics-1.json", "w") as file:
+            json.dump(other_process, file)
+
+        with override_settings(METRICS_DIR=metrics_dir):
+            metrics.inc("theatre_throttle_rejections_total", {"scope": "user"})
+            body = metrics.render_metrics()
+
+        self.assertIn(
+            'theatre_throttle_rejections_total{scope="user"} 3', body
+        )
+
+    def test_snapshots_of_exited_processes_are_deleted(self):
+        metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, metrics_dir)
+        snapshot = {
+            "counters": [
+                ["theatre_throttle_rejections_total", [["scope", "user"]], 2]
+            ],
+            "histograms": [],
+        }
+        exited = f"{metrics_dir}/metrics-{2**22 + 1}.json"  # > pid_max
+        with open(exited, "w") as file:
+            json.dump(snapshot, file)
+
+        with override_settings(METRICS_DIR=metrics_dir):
+            body = metrics.render_metrics()
+
+        self.assertNotIn(
+            'theatre_throttle_rejections_total{scope="user"}', body
+        )
+        self.assertFalse(os.path.exists(exited))
+
+    @override_settings(
+        METRICS_ALLOWED_IPS=["10.0.0.1"], METRICS_TOKEN="s3cret"
+    )
+    def test_scrape_needs_allowed_ip_or_token(self):
+        client = APIClient()
+
+        self.assertEqual(client.get("/metrics").status_code, 403)
+        self.assertEqual(
+            client.get(
+                "/metrics", HTTP_AUTHORIZATION="Bearer wrong"
+            ).status_code,
+            403,
+        )
+        self.assertEqual(
+            client.get(
+                "/metrics", HTTP_AUTHORIZATION="Bearer s3cret"
+            ).status_code,
+            200,
+        )
+        self.assertEqual(
+            client.get("/metrics", REMOTE_ADDR="10.0.0.1").status_code, 200
+        )
+
+
+class PerformanceDateFilterTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.token = get_user_token()
+        (
+            self.client,
+            self.actor,
+            self.genre,
+            self.theatre_hall,
+            self.play,
+            self.performance,
+            self.reservation_data,
+        ) = setup_common_data(self.token)
+        Performance.objects.all().delete()
+        for show_time in (
+            "2024-06-09T00:00:00Z",
+            "2024-06-09T23:59:59Z",
+            "2024-06-10T00:00:00Z",
+            "2024-06-12T18:00:00Z",
+            "2024-07-01T18:00:00Z",
+        ):
+            Performance.objects.create(
+                play=self.play,
+                theatre_hall=self.theatre_hall,
+                show_time=show_time,
+            )
+
+    def test_filter_by_date_uses_half_open_day_range(self):
+        response = self.client.get(
+            reverse("theatre_api:performance-list"), {"date": "2024-06-09"}
+        )
+
+        self.assertEqual(response.data["count"], 2)
+
+    def test_filter_by_date_range(self):
+        response = self.client.get(
+            reverse("theatre_api:performance-list"),
+            {"date_from": "2024-06-10", "date_to": "2024-06-12"},
+        )
+
+        self.assertEqual(response.data["count"], 2)
+
+    def test_invalid_date_is_rejected(self):
+        response = self.client.get(
+            reverse("theatre_api:performance-list"), {"date": "09.06.2024"}
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_calendar_counts_performances_and_available_seats(self):
+        performance = Performance.objects.get(show_time="2024-06-12T18:00:00Z")
+        self.reservation_data["tickets"][0]["performance"] = performance.id
+        self.client.post(
+            reverse("theatre_api:reservation-list"),
+            self.reservation_data,
+            format="json",
+        )
+
+        with self.assertNumQueries(2):
+            # JWT user lookup + the aggregated calendar query
+            response = self.client.get(
+                reverse("theatre_api:performance-calendar"),
+                {"month": "2024-06"},
+            )
+
+        self.assertEqual(
+            response.data,
+            [
+                {
+                    "date": "2024-06-09",
+                    "performances": 2,
+                    "seats_available": 220,
+                },
+                {
+                    "date": "2024-06-10",
+                    "performances": 1,
+                    "seats_available": 110,
+                },
+                {
+                    "date": "2024-06-12",
+                    "performances": 1,
+                    "seats_available": 109,
+                },
+            ],
+        )
+
+
+@override_settings(DATABASE_REPLICAS=["replica_0"], REPLICA_LAG_SECONDS=5)
+class ReplicaRoutingTests(SimpleTestCase):
+    # Writes run an UPDATE matching no row
+    databases = {"default"}
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+        self.seen = []
+
+    def _run(self, request, write=False):
+        def view(request):
+            self.seen.append(self.router.db_for_read(Play))
+            # Routing a lookup to the primary is not a write
+            self.router.db_for_write(Play)
+            if write:
+                Play.objects.filter(pk=0).update(title="")
+            self.seen.append(self.router.db_for_read(Play))
+            return HttpResponse()
+
+        view.cls = PlayViewSet
+        middleware = ReplicaRoutingMiddleware(
+            lambda request: middleware.process_view(request, view, (), {})
+            or view(request)
+        )
+        return middleware(request)
+
+    def test_safe_requests_read_from_replica(self):
+        response = self._run(self.factory.get("/api/theatre/plays/"))
+
+        self.assertEqual(self.seen, ["replica_0", "replica_0"])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertIsNone(self.router.db_for_read(Play))
+
+    def test_reads_after_write_stay_on_primary(self):
+        response = self._run(self.factory.get("/"), write=True)
+
+        self.assertEqual(self.seen, ["replica_0", None])
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_unsafe_requests_and_overrides_use_primary(self):
+        requests = [
+            self.factory.post("/api/theatre/plays/"),
+            self.factory.get("/", HTTP_X_READ_CONSISTENCY="primary"),
+        ]
+        pinned = self.factory.get("/")
+        pinned.COOKIES[PIN_COOKIE] = "1"
+        requests.append(pinned)
+
+        for request in requests:
+            self._run(request)
+
+        self.assertEqual(self.seen, [None] * 6)
+
+
+@override_settings(DATABASE_REPLICAS=["replica_0"], REPLICA_LAG_SECONDS=5)
+class ReplicaDatabaseTests(TestCase):
+    """
+    A real `replica_0` alias on the default test database, as
+    DATABASE_REPLICA_URLS gives with a `TEST: {"MIRROR": "default"}`.
+    It is added after the test databases are set up, which the runner
+    would otherwise try to set up too.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        connections.settings["replica_0"] = {
+            **connections["default"].settings_dict,
+            "TEST": {
+                **connections["default"].settings_dict["TEST"],
+                "MIRROR": "default",
+            },
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        connections["replica_0"].close()
+        del connections["replica_0"]
+        del connections.settings["replica_0"]
+        super().tearDownClass()
+
+    def _genre_queries(self, **extra):
+        primary = CaptureQueriesContext(connections["default"])
+        replica = CaptureQueriesContext(connections["replica_0"])
+        with primary, replica:
+            response = self.client.get(
+                reverse("theatre_api:genre-list"), **extra
+            )
+        self.assertEqual(response.status_code, 200)
+        return [
+            alias
+            for alias, queries in (
+                ("default", primary),
+                ("replica_0", replica),
+            )
+            for query in queries.captured_queries
+            if 'FROM "theatre_api_genre"' in query["sql"]
+        ]
+
+    def test_reads_go_to_the_replica(self):
+        self.assertEqual(self._genre_queries(), ["replica_0"])
+
+    def test_pin_cookie_and_consistency_header_read_the_primary(self):
+        self.client.cookies[PIN_COOKIE] = "1"
+        self.assertEqual(self._genre_queries(), ["default"])
+
+        del self.client.cookies[PIN_COOKIE]
+        self.assertEqual(
+            self._genre_queries(HTTP_X_READ_CONSISTENCY="primary"),
+            ["default"],
+        )
+
+
+class PostgresPoolTests(SimpleTestCase):
+    """`ConnectionPool` is replaced, no PostgreSQL server is needed"""
+
+    url = "postgres://u:p@db:5432/theatre?pool=true&pool_max_size=4"
+
+    def setUp(self):
+        self.pool_class = mock.create_autospec(pool_base.ConnectionPool)
+        patcher = mock.patch.object(
+            pool_base, "ConnectionPool", self.pool_class
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(pool_base.close_pools)
+
+    def _wrapper(self, url=url):
+        settings_dict = {
+            **connection.settings_dict,
+            **dj_database_url.parse(url),
+            "ENGINE": "theatre_core.postgresql_pool",
+        }
+        return pool_base.DatabaseWrapper(settings_dict, alias="pool_test")
+
+    def test_pool_options_are_not_connection_params(self):
+        wrapper = self._wrapper(
+            self.url + "&pool_timeout=2.5&pool_check=false"
+        )
+
+        self.assertEqual(
+            wrapper.pool_options,
+            {
+                "pool": True,
+                "pool_max_size": 4,
+                "pool_timeout": 2.5,
+                "pool_check": False,
+            },
+        )
+        params = wrapper.get_connection_params()
+        self.assertEqual(params["dbname"], "theatre")
+        self.assertFalse(set(params) & set(pool_base.POOL_OPTIONS))
+
+    def test_pool_sizing(self):
+        pool = pool_base._get_pool(
+            "pool_test",
+            {"dbname": "theatre"},
+            {"pool_min_size": 6, "pool_max_size": 4, "pool_check": False},
+        )
+
+        kwargs = self.pool_class.call_args.kwargs
+        self.assertEqual(kwargs["min_size"], 6)
+        self.assertEqual(kwargs["max_size"], 6)
+        self.assertEqual(kwargs["timeout"], 30.0)
+        self.assertIsNone(kwargs["check"])
+        self.assertIs(pool_base._get_pool("pool_test", {}, {}), pool)
+        self.assertEqual(self.pool_class.call_count, 1)
+
+    def test_connection_goes_back_to_the_pool_on_close(self):
+        wrapper = self._wrapper()
+        pool = self.pool_class.return_value
+        pool.getconn.return_value = raw = mock.Mock(
+            closed=False, autocommit=False
+        )
+
+        wrapper.connection = wrapper.get_new_connection(
+            wrapper.get_connection_params()
+        )
+        wrapper._close()
+
+        self.assertIs(wrapper.connection, raw)
+        raw.rollback.assert_called_once_with()
+        pool.putconn.assert_called_once_with(raw)
+        raw.close.assert_not_called()
+
+    def test_pool_timeout_is_an_operational_error(self):
+        wrapper = self._wrapper()
+        self.pool_class.return_value.getconn.side_effect = (
+            pool_base.PoolTimeout("no connection")
+        )
+
+        with self.assertRaises(OperationalError):
+            wrapper.get_new_connection(wrapper.get_connection_params())
+
+    def test_pool_url_switches_the_engine(self):
+        def load_settings(url):
+            spec = importlib.util.find_spec("theatre_core.settings")
+            module = importlib.util.module_from_spec(spec)
+            with mock.patch.dict(os.environ, {"DATABASE_URL": url}):
+                spec.loader.exec_module(module)
+            return module.DATABASES["default"]
+
+        pooled = load_settings(self.url)
+        plain = load_settings(self.url.replace("pool=true", "pool=false"))
+
+        self.assertEqual(pooled["ENGINE"], "theatre_core.postgresql_pool")
+        self.assertEqual(pooled["CONN_MAX_AGE"], 0)
+        self.assertEqual(plain["ENGINE"], "django.db.backends.postgresql")
+
+
+class PostgresPoolConnectionTests(TestCase):
+
+    def test_queries_run_on_pooled_connections(self):
+        if connection.vendor != "postgresql":
+            self.skipTest("Needs PostgreSQL")
+        settings_dict = {
+            **connection.settings_dict,
+            "ENGINE": "theatre_core.postgresql_pool",
+            "OPTIONS": {"pool": True, "pool_max_size": 1},
+        }
+        wrapper = pool_base.DatabaseWrapper(settings_dict, alias="pool_test")
+        self.addCleanup(pool_base.close_pools)
+
+        for _ in range(2):
+            with wrapper.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                self.assertEqual(cursor.fetchone(), (1,))
+            wrapper.close()
+
+        self.assertEqual(wrapper.pool.get_stats()["pool_size"], 1)
+
+
+class ReservationIdempotencyTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.token = get_user_token()
+        (
+            self.client,
+            self.actor,
+            self.genre,
+            self.theatre_hall,
+            self.play,
+            self.performance,
+            self.reservation_data,
+        ) = setup_common_data(self.token)
+        self.url = reverse("theatre_api:reservation-list")
+
+    def test_retry_with_same_key_replays_first_response(self):
+        first = self.client.post(
+            self.url,
+            self.reservation_data,
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="retry-1",
+        )
+        retry = self.client.post(
+            self.url,
+            self.reservation_data,
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="retry-1",
+        )
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    def test_same_key_with_different_body_is_rejected(self):
+        self.client.post(
+            self.url,
+            self.reservation_data,
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="retry-1",
+        )
+        self.reservation_data["tickets"][0]["seat"] = 2
+
+        response = self.client.post(
+            self.url,
+            self.reservation_data,
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="retry-1",
+        )
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    def test_failed_attempt_is_not_stored(self):
+        self.reservation_data["tickets"][0]["row"] = 100
+        response = self.client.post(
+            self.url,
+            self.reservation_data,
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="retry-1",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    @override_settings(IDEMPOTENCY_KEY_TTL=0)
+    def test_expired_keys_are_pruned(self):
+        self.client.post(
+            self.url,
+            self.reservation_data,
+            format="json",
+            HTTP_IDEMPOTENCY_KEY="retry-1",
+        )
+
+        self.assertEqual(prune_idempotency_keys(), 1)
+
+
+class WaitingRoomTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.token = get_user_token()
+        (
+            self.client,
+            self.actor,
+            self.genre,
+            self.theatre_hall,
+            self.play,
+            self.performance,
+            self.reservation_data,
+        ) = setup_common_data(self.token)
+        self.room = WaitingRoom(self.performance.id)
+        self.room.enable(capacity=1)
+        self.addCleanup(self.room.disable)
+        self.addCleanup(cache.clear)
+
+    def _join(self):
+        response = self.client.post(
+            reverse(
+                "theatre_api:performance-join-queue",
+                args=[self.performance.id],
+            )
+        )
+        return response.data["queue_token"]
+
+    def _status(self, queue_token):
+        with self.assertNumQueries(0):
+            return APIClient().get(
+                reverse(
+                    "theatre_api:performance-queue-status",
+                    args=[self.performance.id],
+                ),
+                {"token": queue_token},
+            )
+
+    def test_reservation_requires_admission_token(self):
+        response = self.client.post(
+            reverse("theatre_api:reservation-list"),
+            self.reservation_data,
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_unknown_performance_is_a_404(self):
+        join = self.client.post(
+            reverse("theatre_api:performance-join-queue", args=["abc"])
+        )
+        missing = self.client.post(
+            reverse(
+                "theatre_api:performance-join-queue",
+                args=[self.performance.id + 100],
+            )
+        )
+        status_ = APIClient().get(
+            reverse("theatre_api:performance-queue-status", args=["abc"]),
+            {"token": self._join()},
+        )
+
+        self.assertEqual(join.status_code, 404)
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(status_.status_code, 404)
+
+    def test_only_capacity_buyers_are_admitted_at_a_time(self):
+        first, second = self._join(), self._join()
+
+        admitted = self._status(first).data
+        waiting = self._status(second).data
+
+        self.assertTrue(admitted["admitted"])
+        self.assertEqual(
+            waiting, {"admitted": False, "position": 2, "ahead": 0}
+        )
+
+        response = self.client.post(
+            reverse("theatre_api:reservation-list"),
+            self.reservation_data,
+            format="json",
+            HTTP_X_ADMISSION_TOKEN=admitted["admission_token"],
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(self._status(second).data["admitted"])
+
+    def test_status_rejects_forged_queue_token(self):
+        response = self._status("forged")
+
+        self.assertEqual(response.status_code, 403)
+
+
+class ReservationHistoryTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.token = get_user_token()
+        (
+            self.client,
+            self.actor,
+            self.genre,
+            self.theatre_hall,
+            self.play,
+            self.performance,
+            self.reservation_data,
+        ) = setup_common_data(self.token)
+        self.url = reverse("theatre_api:reservation-history")
+
+    def _reserve(self, seats):
+        self.client.post(
+            reverse("theatre_api:reservation-list"),
+            {
+                "tickets": [
+                    {
+                        "row": 1,
+                        "seat": seat,
+                        "performance": self.performance.id,
+                    }
+                    for seat in seats
+                ]
+            },
+            format="json",
+        )
+
+    def test_tickets_are_grouped_by_performance(self):
+        self._reserve([1, 2, 3])
+
+        response = self.client.get(self.url)
+
+        [reservation] = response.data["results"]
+        [group] = reservation["performances"]
+        self.assertEqual(group["seats"], [[1, 1], [1, 2], [1, 3]])
+        self.assertEqual(group["performance"]["id"], self.performance.id)
+        self.assertEqual(group["performance"]["tickets_available"], 107)
+
+    def test_query_count_does_not_grow_with_history(self):
+        self._reserve([1])
+        with CaptureQueriesContext(connection) as short_history:
+            self.client.get(self.url)
+
+        for seat in range(2, 12):
+            self._reserve([seat])
+        with CaptureQueriesContext(connection) as long_history:
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.data["count"], 11)
+        self.assertEqual(len(long_history), len(short_history))
+
+    @override_settings(REFERENCE_CACHE_ENABLED=False)
+    def test_query_count_without_reference_cache(self):
+        halls = [
+            TheatreHall.objects.create(
+                name=f"Hall {i}", rows=10, seats_in_row=10
+            )
+            for i in range(3)
+        ]
+        performances = [
+            Performance.objects.create(
+                play=Play.objects.create(title=f"Play {i}", description=""),
+                theatre_hall=halls[i % len(halls)],
+                show_time=timezone.now(),
+            )
+            for i in range(10)
+        ]
+        for i in range(10):
+            reservation = Reservation.objects.create(user=self.user)
+            for performance in performances[i : i + 3]:
+                Ticket.objects.create(
+                    row=2,
+                    seat=i + 1,
+                    performance=performance,
+                    reservation=reservation,
+                )
+
+        with self.assertNumQueries(7):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.data["count"], 10)
+
+
+class BulkDeletionTests(TestCase):
+
+    def setUp(self):
+        self.user = create_admin_user()
+        self.token = get_admin_token()
+        (
+            self.client,
+            self.actor,
+            self.genre,
+            self.theatre_hall,
+            self.play,
+            self.performance,
+            self.reservation_data,
+        ) = setup_common_data(self.token)
+        self.other_performance = Performance.objects.create(
+            play=self.play,
+            theatre_hall=self.theatre_hall,
+            show_time="2024-06-09T18:00:00Z",
+        )
+        for row in range(1, 4):
+            self.client.post(
+                reverse("theatre_api:reservation-list"),
+                {
+                    "tickets": [
+                        {
+                            "row": row,
+                            "seat": seat,
+                            "performance": self.performance.id,
+                        }
+                        for seat in range(1, 6)
+                    ]
+                },
+                format="json",
+            )
+        self.mixed = self.client.post(
+            reverse("theatre_api:reservation-list"),
+            {
+                "tickets": [
+                    {"row": 9, "seat": 1, "performance": self.performance.id},
+                    {
+                        "row": 9,
+                        "seat": 1,
+                        "performance": self.other_performance.id,
+                    },
+                ]
+            },
+            format="json",
+        ).data["id"]
+
+    def test_cancel_performance_reports_deleted_rows(self):
+        received = []
+
+        def receiver(sender, tickets_per_performance, **kwargs):
+            received.append(tickets_per_performance)
+
+        tickets_bulk_deleted.connect(receiver)
+        self.addCleanup(tickets_bulk_deleted.disconnect, receiver)
+
+        response = self.client.post(
+            reverse(
+                "theatre_api:performance-cancel", args=[self.performance.id]
+            )
+        )
+
+        self.assertEqual(
+            response.data,
+            {"tickets": 16, "reservations": 3, "performances": 1},
+        )
+        self.assertEqual(received, [{self.performance.id: 16}])
+        self.assertTrue(Reservation.objects.filter(id=self.mixed).exists())
+
+    def test_delete_reservations_in_chunks(self):
+        deleted = delete_reservations(Reservation.objects.all(), chunk_size=2)
+
+        self.assertEqual(deleted, {"tickets": 17, "reservations": 4})
+        self.assertFalse(Ticket.objects.exists())
+
+    def test_destroy_reservation(self):
+        response = self.client.delete(
+            reverse("theatre_api:reservation-detail", args=[self.mixed])
+        )
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(Ticket.objects.count(), 15)
+
+    def _receive_bulk_deletes(self):
+        received = []
+
+        def receiver(sender, tickets_per_performance, **kwargs):
+            received.append(tickets_per_performance)
+
+        tickets_bulk_deleted.connect(receiver)
+        self.addCleanup(tickets_bulk_deleted.disconnect, receiver)
+        return received
+
+    def test_admin_delete_performance_is_set_based(self):
+        received = self._receive_bulk_deletes()
+
+        PerformanceAdmin(Performance, admin.site).delete_model(
+            None, self.performance
+        )
+
+        self.assertEqual(received, [{self.performance.id: 16}])
+        self.assertEqual(Ticket.objects.count(), 1)
+        self.assertEqual(Reservation.objects.count(), 1)
+        self.assertFalse(
+            TicketChange.objects.filter(
+                performance_id=self.performance.id
+            ).exists()
+        )
+
+    def test_cascading_play_delete_goes_through_set_based_deletion(self):
+        received = self._receive_bulk_deletes()
+
+        self.play.delete()
+
+        self.assertEqual(
+            sorted(received, key=len),
+            sorted(
+                [{self.performance.id: 16}, {self.other_performance.id: 1}],
+                key=len,
+            ),
+        )
+        self.assertFalse(Ticket.objects.exists())
+        self.assertFalse(Reservation.objects.exists())
+        self.assertFalse(PerformanceSales.objects.exists())
+        self.assertFalse(TicketChange.objects.exists())
+
+    def test_deleting_a_user_deletes_tickets_set_based(self):
+        received = self._receive_bulk_deletes()
+
+        self.user.delete()
+
+        self.assertEqual(
+            received,
+            [{self.performance.id: 16, self.other_performance.id: 1}],
+        )
+        self.assertFalse(Ticket.objects.exists())
+        self.assertEqual(TicketChange.objects.filter(removed=True).count(), 17)
+
+
+class ArchivePastPerformancesTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.token = get_user_token()
+        (
+            self.client,
+            self.actor,
+            self.genre,
+            self.theatre_hall,
+            self.play,
+            self.performance,
+            self.reservation_data,
+        ) = setup_common_data(self.token)
+        self.past_performance = Performance.objects.create(
+            play=self.play,
+            theatre_hall=self.theatre_hall,
+            show_time="2020-01-01T18:00:00Z",
+        )
+        for seat in range(1, 4):
+            self.client.post(
+                reverse("theatre_api:reservation-list"),
+                {
+                    "tickets": [
+                        {
+                            "row": 1,
+                            "seat": seat,
+                            "performance": self.past_performance.id,
+                        }
+                    ]
+                },
+                format="json",
+            )
+        self.client.post(
+            reverse("theatre_api:reservation-list"),
+            self.reservation_data,
+            format="json",
+        )
+        Reservation.objects.update(created_at="2019-12-01T00:00:00Z")
+
+    def test_archive_to_tables_in_batches(self):
+        call_command(
+            "archive_past_performances",
+            batch_size=2,
+            sleep=0,
+            stdout=io.StringIO(),
+        )
+
+        self.assertEqual(ArchivedTicket.objects.count(), 3)
+        self.assertEqual(ArchivedReservation.objects.count(), 3)
+        self.assertEqual(Ticket.objects.count(), 1)
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    def test_archived_tickets_are_logged_as_removed(self):
+        call_command(
+            "archive_past_performances", sleep=0, stdout=io.StringIO()
+        )
+
+        self.assertEqual(
+            sorted(
+                TicketChange.objects.filter(removed=True).values_list(
+                    "performance_id", "seat"
+                )
+            ),
+            [(self.past_performance.id, seat) for seat in range(1, 4)],
+        )
+
+    def test_archive_to_files(self):
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+
+        call_command(
+            "archive_past_performances",
+            to="file",
+            output_dir=output_dir,
+            sleep=0,
+            stdout=io.StringIO(),
+        )
+
+        ticket_files = [
+            name for name in os.listdir(output_dir) if name.startswith("tick")
+        ]
+        self.assertEqual(len(ticket_files), 1)
+        with gzip.open(os.path.join(output_dir, ticket_files[0]), "rt") as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([row["seat"] for row in rows], [1, 2, 3])
+        self.assertFalse(ArchivedTicket.objects.exists())
+        self.assertEqual(Ticket.objects.count(), 1)
+
+
+class TicketPartitioningTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.token = get_user_token()
+        (
+            self.client,
+            self.actor,
+            self.genre,
+            self.theatre_hall,
+            self.play,
+            self.performance,
+            self.reservation_data,
+        ) = setup_common_data(self.token)
+
+    def test_show_month_follows_performance(self):
+        self.performance.show_time = "2024-06-15T18:00:00Z"
+        self.performance.save()
+        self.client.post(
+            reverse("theatre_api:reservation-list"),
+            self.reservation_data,
+            format="json",
+        )
+        ticket = Ticket.objects.get()
+        self.assertEqual(ticket.show_month, datetime.date(2024, 6, 1))
+
+        self.performance.show_time = "2024-08-02T18:00:00Z"
+        self.performance.save()
+        ticket.refresh_from_db()
+        self.assertEqual(ticket.show_month, datetime.date(2024, 8, 1))
+
+    def test_commands_require_postgres(self):
+        if connection.vendor == "postgresql":
+            self.skipTest("Only relevant on other databases")
+        with self.assertRaises(CommandError):
+            call_command("ticket_partitions", "stats", stdout=io.StringIO())
+
+    def test_creating_a_month_moves_its_tickets_out_of_default(self):
+        if connection.vendor != "postgresql":
+            self.skipTest("Partitioning needs PostgreSQL")
+        convert_ticket_table(months_ahead=1)
+        today = datetime.date.today()
+        show_time = timezone.now() + datetime.timedelta(days=200)
+        self.performance.show_time = show_time
+        self.performance.save()
+        self.client.post(
+            reverse("theatre_api:reservation-list"),
+            self.reservation_data,
+            format="json",
+        )
+        month = Ticket.objects.get().show_month
+
+        def rows_in(table):
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT COUNT(*) FROM "{table}"')
+                return cursor.fetchone()[0]
+
+        self.assertEqual(rows_in(DEFAULT_PARTITION), 1)
+
+        created = create_future_partitions(months_ahead=8, today=today)
+
+        self.assertIn(partition_name(month), created)
+        self.assertEqual(rows_in(DEFAULT_PARTITION), 0)
+        self.assertEqual(rows_in(partition_name(month)), 1)
+        self.assertEqual(Ticket.objects.count(), 1)
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+        @task(name="test_record")
+        def record(value):
+            self.calls.append(value)
+
+        @task(name="test_fail")
+        def fail():
+            raise ValueError("boom")
+
+    def test_jobs_run_by_priority_and_schedule(self):
+        enqueue("test_record", {"value": "low"})
+        enqueue("test_record", {"value": "high"}, priority=10)
+        later = enqueue("test_record", {"value": "later"}, delay=60)
+
+        Worker(batch_size=10).work(until_empty=True)
+
+        self.assertEqual(self.calls, ["high", "low"])
+        later.refresh_from_db()
+        self.assertEqual(later.status, Job.QUEUED)
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 2)
+
+    def test_failed_job_is_retried_with_backoff(self):
+        job = enqueue("test_fail", max_attempts=2)
+
+        Worker().work(until_empty=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn("boom", job.last_error)
+        self.assertGreater(job.run_at, timezone.now())
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        Worker().work(until_empty=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    @override_settings(JOB_RETENTION=60, JOB_FAILED_RETENTION=3600)
+    def test_prune_jobs_keeps_recent_and_pending_ones(self):
+        now = timezone.now()
+        old = now - datetime.timedelta(minutes=10)
+        done = enqueue("test_record", {"value": "done"})
+        recent = enqueue("test_record", {"value": "recent"})
+        failed = enqueue("test_fail")
+        queued = enqueue("test_record", {"value": "queued"}, delay=60)
+        Job.objects.filter(pk=done.pk).update(status=Job.DONE, finished_at=old)
+        Job.objects.filter(pk=recent.pk).update(
+            status=Job.DONE, finished_at=now
+        )
+        Job.objects.filter(pk=failed.pk).update(
+            status=Job.FAILED, finished_at=old
+        )
+
+        self.assertEqual(prune_jobs(), 1)
+        self.assertEqual(
+            set(Job.objects.values_list("pk", flat=True)),
+            {recent.pk, failed.pk, queued.pk},
+        )
+
+    def test_stale_running_job_is_claimed_again(self):
+        job = enqueue("test_record", {"value": "again"})
+        self.assertEqual(claim_jobs("dead-worker"), [job])
+        self.assertEqual(claim_jobs("other-worker"), [])
+
+        Job.objects.filter(pk=job.pk).update(
+            locked_at=timezone.now() - datetime.timedelta(days=1)
+        )
+        Worker().work(until_empty=True)
+        self.assertEqual(self.calls, ["again"])
+
+    def test_stale_job_without_attempts_left_fails(self):
+        job = enqueue("test_record", {"value": "never"}, max_attempts=1)
+        self.assertEqual(claim_jobs("dead-worker"), [job])
+        Job.objects.filter(pk=job.pk).update(
+            locked_at=timezone.now() - datetime.timedelta(days=1)
+        )
+
+        self.assertEqual(claim_jobs("other-worker"), [])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(self.calls, [])
+
+
+class ETicketTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.token = get_user_token()
+        (
+            self.client,
+            self.actor,
+            self.genre,
+            self.theatre_hall,
+            self.play,
+            self.performance,
+            self.reservation_data,
+        ) = setup_common_data(self.token)
+        self.reservation_data["tickets"].append(
+            {"row": 1, "seat": 2, "performance": self.performance.id}
+        )
+        response = self.client.post(
+            reverse("theatre_api:reservation-list"),
+            self.reservation_data,
+            format="json",
+        )
+        self.reservation_id = response.data["id"]
+        self.eticket_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.eticket_dir)
+        settings_override = override_settings(ETICKET_DIR=self.eticket_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _download(self, file_type):
+        return self.client.get(
+            reverse(
+                "theatre_api:reservation-etickets", args=[self.reservation_id]
+            ),
+            {"type": file_type},
+        )
+
+    def test_download_pdf_and_png_from_cache(self):
+        response = self._download("pdf")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertTrue(
+            b"".join(response.streaming_content).startswith(b"%PDF")
+        )
+
+        response = self._download("png")
+        self.assertTrue(
+            b"".join(response.streaming_content).startswith(b"\x89PNG")
+        )
+        self.assertEqual(len(os.listdir(self.eticket_dir)), 2)
+
+        self._download("pdf").close()
+        self.assertEqual(len(os.listdir(self.eticket_dir)), 2)
+
+    def test_invalid_type(self):
+        self.assertEqual(self._download("gif").status_code, 400)
+
+    def test_ticket_token_round_trip(self):
+        ticket = Ticket.objects.first()
+        token = ticket_token(ticket)
+        self.assertEqual(
+            read_ticket_token(token), (ticket.performance_id, ticket.pk)
+        )
+        with self.assertRaises(signing.BadSignature):
+            read_ticket_token(token[:-1] + "x")
+
+    def test_render_performance_in_bulk(self):
+        self.assertEqual(
+            render_performance_etickets(self.performance.id, ["pdf", "png"]),
+            1,
+        )
+        self.assertEqual(len(os.listdir(self.eticket_dir)), 2)
+
+    @override_settings(ETICKET_MAX_AGE=60)
+    def test_prune_deletes_unused_files(self):
+        render_performance_etickets(self.performance.id, ["pdf", "png"])
+        old = datetime.datetime.now().timestamp() - 120
+        for filename in os.listdir(self.eticket_dir):
+            path = os.path.join(self.eticket_dir, filename)
+            os.utime(path, (old, old))
+        # Serving a file marks it as used
+        self._download("pdf").close()
+
+        call_command("prune_etickets", stdout=io.StringIO())
+
+        [kept] = os.listdir(self.eticket_dir)
+        self.assertTrue(kept.endswith(".pdf"))
+
+
+class CheckInTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        reset_gates()
+        self.admin = create_admin_user()
+        self.user = create_user()
+        (
+            self.client,
+            self.actor,
+            self.genre,
+            self.theatre_hall,
+            self.play,
+            self.performance,
+            self.reservation_data,
+        ) = setup_common_data(get_user_token())
+        self.client.post(
+            reverse("theatre_api:reservation-list"),
+            self.reservation_data,
+            format="json",
+        )
+        self.ticket = Ticket.objects.get()
+        self.other_performance = Performance.objects.create(
+            play=self.play,
+            theatre_hall=self.theatre_hall,
+            show_time="2030-01-01T18:00:00Z",
+        )
+        self.staff_client = APIClient()
+        self.staff_client.credentials(
+            HTTP_AUTHORIZATION="Bearer " + get_admin_token()
+        )
+
+    def _scan(self, performance, scans, client=None):
+        return (client or self.staff_client).post(
+            reverse("theatre_api:performance-check-in", args=[performance.id]),
+            {"entrance": "A", "scans": scans},
+            format="json",
+        )
+
+    def test_batch_scan(self):
+        token = ticket_token(self.ticket)
+        response = self._scan(
+            self.performance, [token, token, token[:-2] + "xx"]
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [scan["result"] for scan in response.data],
+            ["admitted", "already_scanned", "invalid"],
+        )
+        self.assertEqual(
+            self._scan(self.other_performance, [token]).data[0]["result"],
+            "wrong_performance",
+        )
+
+        Worker().work(until_empty=True)
+        check_in = CheckIn.objects.get()
+        self.assertEqual(check_in.ticket_id, self.ticket.id)
+        self.assertEqual(check_in.entrance, "A")
+
+        # A fresh process knows the ticket was scanned from the database
+        cache.clear()
+        reset_gates()
+        self.assertEqual(
+            self._scan(self.performance, [token]).data[0]["result"],
+            "already_scanned",
+        )
+
+    def test_scan_without_db_queries_once_loaded(self):
+        token = ticket_token(self.ticket)
+        self._scan(self.performance, [token])
+        with CaptureQueriesContext(connection) as queries:
+            response = self._scan(self.performance, [token])
+        self.assertEqual(response.data[0]["result"], "already_scanned")
+        self.assertFalse(
+            [
+                query
+                for query in queries.captured_queries
+                if "theatre_api_ticket" in query["sql"]
+            ]
+        )
+
+    def test_only_staff_can_scan(self):
+        response = self._scan(
+            self.performance, [ticket_token(self.ticket)], self.client
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(MANIFEST_SETTLE_SECONDS=0)
+class CheckInManifestTests(TestCase):
+
+    def setUp(self):
+        self.admin = create_admin_user()
+        self.user = create_user()
+        (
+            self.client,
+            self.actor,
+            self.genre,
+            self.theatre_hall,
+            self.play,
+            self.performance,
+            self.reservation_data,
+        ) = setup_common_data(get_user_token())
+        self._buy(1, 1)
+        self._buy(2, 5)
+        self.staff_client = APIClient()
+        self.staff_client.credentials(
+            HTTP_AUTHORIZATION="Bearer " + get_admin_token()
+        )
+
+    def _buy(self, row, seat):
+        response = self.client.post(
+            reverse("theatre_api:reservation-list"),
+            {
+                "tickets": [
+                    {
+                        "row": row,
+                        "seat": seat,
+                        "performance": self.performance.id,
+                    }
+                ]
+            },
+            format="json",
+        )
+        return response.data["id"]
+
+    def _manifest(self, **params):
+        response = self.staff_client.get(
+            reverse(
+                "theatre_api:performance-manifest", args=[self.performance.id]
+            ),
+            params,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response[manifest.SIGNATURE_HEADER],
+            manifest.sign(response.content),
+        )
+        return manifest.decode(response.content)
+
+    def test_full_manifest_then_delta(self):
+        full = self._manifest()
+        self.assertEqual(full["kind"], "full")
+        self.assertEqual(full["count"], 2)
+        self.assertEqual(
+            [(row, seat) for _, row, seat in full["entries"]], [(1, 1), (2, 5)]
+        )
+
+        first_ticket = full["entries"][0][0]
+        reservation = self._buy(3, 7)
+        delete_reservations(
+            Reservation.objects.filter(tickets__id=first_ticket)
+        )
+        delta = self._manifest(since=full["sequence"])
+
+        self.assertEqual(delta["kind"], "delta")
+        self.assertEqual(delta["count"], 2)
+        new_ticket = Ticket.objects.get(reservation_id=reservation).id
+        self.assertEqual(
+            delta["entries"],
+            [(first_ticket, 1, 1, 1), (new_ticket, 3, 7, 0)],
+        )
+        self.assertEqual(
+            self._manifest(since=delta["sequence"])["entries"], []
+        )
+
+    def test_staff_only(self):
+        response = self.client.get(
+            reverse(
+                "theatre_api:performance-manifest", args=[self.performance.id]
+            )
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+class TicketAdminTests(TestCase):
+
+    def setUp(self):
+        self.admin = create_admin_user()
+        self.user = create_user()
+        (
+            self.client,
+            self.actor,
+            self.genre,
+            self.theatre_hall,
+            self.play,
+            self.performance,
+            self.reservation_data,
+        ) = setup_common_data(get_user_token())
+        self.client.force_login(self.admin)
+
+    def _buy(self, seats):
+        for seat in seats:
+            reservation = Reservation.objects.create(user=self.user)
+            Ticket.objects.create(
+                performance=self.performance,
+                reservation=reservation,
+                row=1,
+                seat=seat,
+            )
+
+    def _changelist_queries(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse("admin:theatre_api_ticket_changelist"), params
+            )
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_query_count_is_constant(self):
+        self._buy([1])
+        few = self._changelist_queries()
+        self._buy(range(2, 12))
+        self.assertEqual(self._changelist_queries(), few)
+
+        month = self.performance.show_month.isoformat()
+        self.assertEqual(
+            self._changelist_queries(show_month=month),
+            self._changelist_queries(performance=self.performance.id),
+        )
+
+    def test_bulk_delete_action(self):
+        self._buy([1, 2])
+        response = self.client.post(
+            reverse("admin:theatre_api_ticket_changelist"),
+            {
+                "action": "bulk_delete_tickets",
+                "_selected_action": list(
+                    Ticket.objects.values_list("pk", flat=True)
+                ),
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Ticket.objects.exists())
+        self.assertEqual(Reservation.objects.count(), 2)
+
+
+@override_settings(REFERENCE_CACHE_ENABLED=True)
+class ReferenceCacheTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        (
+            self.client,
+            self.actor,
+            self.genre,
+            self.theatre_hall,
+            self.play,
+            self.performance,
+            self.reservation_data,
+        ) = setup_common_data(get_user_token())
+
+    def test_reservation_skips_hall_and_performance_queries(self):
+        self.client.post(
+            reverse("theatre_api:reservation-list"),
+            self.reservation_data,
+            format="json",
+        )
+        self.reservation_data["tickets"][0]["seat"] = 2
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse("theatre_api:reservation-list"),
+                self.reservation_data,
+                format="json",
+            )
+        self.assertEqual(response.status_code, 201)
+        # Only Ticket.full_clean's foreign key existence check remains
+        self.assertFalse(
+            [
+                query["sql"]
+                for query in queries.captured_queries
+                if 'FROM "theatre_api_theatrehall"' in query["sql"]
+                or '"theatre_api_performance"."show_time"' in query["sql"]
+            ]
+        )
+
+    def test_saving_a_hall_invalidates_it(self):
+        self.assertEqual(get_hall(self.theatre_hall.id).rows, 10)
+        self.theatre_hall.rows = 3
+        self.theatre_hall.save()
+        self.assertEqual(get_hall(self.theatre_hall.id).rows, 3)
+
+        self.reservation_data["tickets"][0]["row"] = 5
+        response = self.client.post(
+            reverse("theatre_api:reservation-list"),
+            self.reservation_data,
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_reservation_for_a_performance_deleted_meanwhile(self):
+        get_performance(self.performance.id)
+        # Raw delete: no signal clears the cached row
+        Performance.objects.filter(pk=self.performance.id)._raw_delete(
+            "default"
+        )
+        self.assertIsNotNone(get_performance(self.performance.id))
+
+        response = self.client.post(
+            reverse("theatre_api:reservation-list"),
+            self.reservation_data,
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("tickets", response.data)
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_missing_hall_is_a_404(self):
+        with self.assertRaises(Http404):
+            get_hall_or_404(self.theatre_hall.id + 100)
+
+    @override_settings(REFERENCE_CACHE_ENABLED=False)
+    def test_disabled_cache_reads_the_database(self):
+        self.assertEqual(get_hall(self.theatre_hall.id).rows, 10)
+        TheatreHall.objects.filter(pk=self.theatre_hall.id).update(rows=3)
+        self.assertEqual(get_hall(self.theatre_hall.id).rows, 3)
+
+    def test_deploy_check_requires_a_shared_cache(self):
+        with override_settings(CACHE_SHARED=False):
+            self.assertEqual(
+                [error.id for error in check_shared_cache(None)],
+                ["theatre_api.E001"],
+            )
+        with override_settings(CACHE_SHARED=True):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class SalesAnalyticsTests(TestCase):
+
+    def setUp(self):
+        self.user = create_admin_user()
+        (
+            self.client,
+            self.actor,
+            self.genre,
+            self.theatre_hall,
+            self.play,
+            self.performance,
+            self.reservation_data,
+        ) = setup_common_data(get_admin_token())
+        self.reservation_ids = [
+            self.client.post(
+                reverse("theatre_api:reservation-list"),
+                {
+                    "tickets": [
+                        {
+                            "row": row,
+                            "seat": seat,
+                            "performance": self.performance.id,
+                        }
+                        for seat in range(1, tickets + 1)
+                    ]
+                },
+                format="json",
+            ).data["id"]
+            for row, tickets in ((1, 2), (2, 1))
+        ]
+        Worker().work(until_empty=True)
+
+    def _occupancy(self, **params):
+        return self.client.get(
+            reverse("theatre_api:analytics-occupancy"), params
+        )
+
+    def test_rollups_follow_reservations_and_cancellations(self):
+        response = self._occupancy()
+        self.assertEqual(
+            response.data,
+            [
+                {
+                    "key": str(self.play.id),
+                    "name": "The Godfather",
+                    "performances": 1,
+                    "capacity": 110,
+                    "tickets_sold": 3,
+                    "occupancy": 2.7,
+                }
+            ],
+        )
+        sales = self.client.get(reverse("theatre_api:analytics-sales")).data
+        self.assertEqual(
+            [(row["play"], row["tickets"]) for row in sales],
+            [(self.play.id, 3)],
+        )
+        hours = self.client.get(
+            reverse("theatre_api:analytics-booking-hours")
+        ).data
+        self.assertEqual(hours[0]["tickets"], 3)
+
+        self.client.delete(
+            reverse(
+                "theatre_api:reservation-detail",
+                args=[self.reservation_ids[0]],
+            )
+        )
+        Worker().work(until_empty=True)
+
+        self.assertEqual(self._occupancy(by="hall").data[0]["tickets_sold"], 1)
+        self.assertEqual(
+            self.client.get(reverse("theatre_api:analytics-sales")).data[0][
+                "tickets"
+            ],
+            1,
+        )
+
+    def test_rollups_follow_cascading_deletes(self):
+        other_play = Play.objects.create(title="Hamlet", description="")
+        other = Performance.objects.create(
+            play=other_play,
+            theatre_hall=self.theatre_hall,
+            show_time=self.performance.show_time,
+        )
+        self.client.post(
+            reverse("theatre_api:reservation-list"),
+            {"tickets": [{"row": 1, "seat": 1, "performance": other.id}]},
+            format="json",
+        )
+        Worker().work(until_empty=True)
+
+        other_play_id = other_play.id
+        other_play.delete()
+        Worker().work(until_empty=True)
+        self.assertEqual(self._occupancy().data[0]["tickets_sold"], 3)
+        self.assertEqual(
+            DailyPlaySales.objects.get(play_id=other_play_id).tickets, 0
+        )
+
+        self.user.delete()
+        Worker().work(until_empty=True)
+        self.assertEqual(
+            PerformanceSales.objects.get(
+                performance_id=self.performance.id
+            ).tickets,
+            0,
+        )
+        self.assertEqual(
+            sum(HourlyBookings.objects.values_list("tickets", flat=True)), 0
+        )
+
+    @override_settings(REFERENCE_CACHE_ENABLED=True)
+    def test_saving_a_performance_reads_the_hall_from_the_cache(self):
+        get_hall(self.theatre_hall.id)
+
+        with CaptureQueriesContext(connection) as queries:
+            Performance.objects.create(
+                play_id=self.play.id,
+                theatre_hall_id=self.theatre_hall.id,
+                show_time=self.performance.show_time,
+            )
+
+        self.assertFalse(
+            [
+                query["sql"]
+                for query in queries.captured_queries
+                if 'FROM "theatre_api_theatrehall"' in query["sql"]
+            ]
+        )
+        self.assertEqual(
+            PerformanceSales.objects.latest("performance_id").capacity, 110
+        )
+
+    def test_rebuild_matches_incremental_rollups(self):
+        incremental = self._occupancy(by="day").data
+        call_command("rebuild_sales_rollups", stdout=io.StringIO())
+        self.assertEqual(self._occupancy(by="day").data, incremental)
+
+    def test_occupancy_validates_parameters(self):
+        self.assertEqual(self._occupancy(by="actor").status_code, 400)
+        self.assertEqual(self._occupancy(date_from="June").status_code, 400)
+
+    def test_staff_only(self):
+        create_user()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Bearer " + get_user_token())
+        response = client.get(reverse("theatre_api:analytics-occupancy"))
+        self.assertEqual(response.status_code, 403)
+
+
+class SparseFieldsetTests(TestCase):
+
+    def setUp(self):
+        create_user()
+        (
+            self.client,
+            self.actor,
+            self.genre,
+            self.theatre_hall,
+            self.play,
+            self.performance,
+            self.reservation_data,
+        ) = setup_common_data(get_user_token())
+
+    def _get(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, [query["sql"] for query in queries.captured_queries]
+
+    def test_fields_prunes_columns_and_prefetches(self):
+        response, queries = self._get(
+            reverse("theatre_api:play-list"), fields="id,title"
+        )
+
+        self.assertEqual(
+            response.data["results"],
+            [{"id": self.play.id, "title": "The Godfather"}],
+        )
+        self.assertFalse([sql for sql in queries if "description" in sql])
+        self.assertFalse([sql for sql in queries if "genre" in sql])
+
+    def test_exclude(self):
+        response, queries = self._get(
+            reverse("theatre_api:play-detail", args=[self.play.id]),
+            exclude="description,actors",
+        )
+
+        self.assertEqual(
+            set(response.data), {"id", "title", "genres", "poster"}
+        )
+        self.assertFalse([sql for sql in queries if "actor" in sql])
+
+    def test_performance_list_skips_ticket_count(self):
+        response, queries = self._get(
+            reverse("theatre_api:performance-list"),
+            fields="id,show_time,play_title",
+        )
+
+        self.assertEqual(
+            set(response.data["results"][0]),
+            {"id", "show_time", "play_title"},
+        )
+        self.assertFalse(
+            [sql for sql in queries if "theatre_api_ticket" in sql]
+        )
+
+    def test_history_without_performances_skips_tickets(self):
+        self.client.post(
+            reverse("theatre_api:reservation-list"),
+            self.reservation_data,
+            format="json",
+        )
+        response, queries = self._get(
+            reverse("theatre_api:reservation-history"), fields="id"
+        )
+
+        self.assertEqual(list(response.data["results"][0]), ["id"])
+        self.assertFalse(
+            [sql for sql in queries if "theatre_api_ticket" in sql]
+        )
+
+    def test_unknown_field(self):
+        response = self.client.get(
+            reverse("theatre_api:play-list"), {"fields": "id,budget"}
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("budget", str(response.data["fields"]))
+
+
+class CatalogSnapshotTests(TestCase):
+
+    def setUp(self):
+        create_user()
+        (
+            self.client,
+            self.actor,
+            self.genre,
+            self.theatre_hall,
+            self.play,
+            self.performance,
+            self.reservation_data,
+        ) = setup_common_data(get_user_token())
+        self.performance.show_time = timezone.now() + datetime.timedelta(
+            days=1
+        )
+        self.performance.save()
+        catalog_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, catalog_dir)
+        settings_override = override_settings(CATALOG_DIR=catalog_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.url = reverse("theatre_api:catalog", args=["plays"])
+
+    def test_serves_compressed_snapshot_without_queries(self):
+        call_command("build_catalog", stdout=io.StringIO())
+        client = APIClient()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, br")
+            body = b"".join(response.streaming_content)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(response["Content-Encoding"], "br")
+        plays = json.loads(brotli.decompress(body))
+        self.assertEqual(plays[0]["genres"], ["Drama"])
+
+        response = client.get(
+            self.url,
+            HTTP_ACCEPT_ENCODING="gzip",
+            HTTP_IF_NONE_MATCH=response["ETag"].replace(".br", ".gz"),
+        )
+        self.assertEqual(response.status_code, 304)
+
+        performances = client.get(
+            reverse("theatre_api:catalog", args=["performances"])
+        )
+        self.assertEqual(
+            json.loads(b"".join(performances.streaming_content))[0][
+                "tickets_available"
+            ],
+            110,
+        )
+
+    def test_unchanged_catalog_keeps_its_version(self):
+        first = catalog.build_catalog()
+        self.assertEqual(catalog.build_catalog()["version"], first["version"])
+
+        self.play.title = "The Godfather II"
+        self.play.save()
+        self.assertNotEqual(
+            catalog.build_catalog()["etags"]["plays"],
+            first["etags"]["plays"],
+        )
+
+    def test_changes_schedule_a_single_build(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Genre.objects.create(name="Comedy")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.play.genres.clear()
+
+        self.assertEqual(
+            Job.objects.filter(
+                task="build_catalog", status=Job.QUEUED
+            ).count(),
+            1,
+        )
+
+    def test_missing_snapshot(self):
+        self.assertEqual(APIClient().get(self.url).status_code, 404)
+
+    @override_settings(CATALOG_BASE_URL="https://tickets.example.com")
+    def test_poster_urls_are_absolute(self):
+        Play.objects.filter(pk=self.play.pk).update(poster="posters/a.jpg")
+
+        catalog.build_catalog()
+
+        with open(
+            os.path.join(
+                settings.CATALOG_DIR,
+                catalog.current_manifest()["version"],
+                "plays.json",
+            )
+        ) as file:
+            plays = json.load(file)
+        self.assertEqual(
+            plays[0]["poster"],
+            "https://tickets.example.com/media/posters/a.jpg",
+        )
+
+    def test_periodic_builds_replace_finished_ones(self):
+        for _ in range(3):
+            catalog.schedule_build(0)
+            Worker().work(until_empty=True)
+
+        # The last build, and the next one it scheduled
+        self.assertEqual(
+            sorted(
+                Job.objects.filter(task="build_catalog").values_list(
+                    "status", flat=True
+                )
+            ),
+            [Job.DONE, Job.QUEUED],
+        )
+
+
+class PrebuiltSchemaTests(TestCase):
+
+    def setUp(self):
+        schema_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, schema_dir)
+        settings_override = override_settings(SCHEMA_DIR=schema_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = APIClient()
+
+    def test_serves_built_schema_with_etag(self):
+        call_command("build_schema", stdout=io.StringIO())
+
+        response = self.client.get(reverse("schema"), {"format": "json"})
+        self.assertEqual(response.status_code, 200)
+        schema = json.loads(b"".join(response.streaming_content))
+        self.assertIn("/api/theatre/plays/", schema["paths"])
+        self.assertIn("max-age", response["Cache-Control"])
+
+        response = self.client.get(
+            reverse("schema"),
+            {"format": "json"},
+            HTTP_IF_NONE_MATCH=response["ETag"],
+        )
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(reverse("schema"))
+        self.assertTrue(response["ETag"].endswith('-yaml"'))
+
+    def test_live_generation_only_in_debug(self):
+        self.assertEqual(self.client.get(reverse("schema")).status_code, 404)
+        with override_settings(DEBUG=True):
+            self.assertEqual(
+                self.client.get(reverse("schema")).status_code, 200
+            )
+
+
+class StartupTests(TestCase):
+
+    def test_migrate_if_pending_skips_applied_database(self):
+        self.assertEqual(pending_migrations(connection), [])
+        out = io.StringIO()
+        call_command("migrate_if_pending", stdout=out)
+        self.assertIn("No migrations to apply", out.getvalue())
+
+    def test_pending_migrations_lists_unrecorded_files(self):
+        MigrationRecorder(connection).record_unapplied(
+            "theatre_api", "0010_sales_rollups"
+        )
+        self.assertEqual(
+            pending_migrations(connection),
+            [("theatre_api", "0010_sales_rollups")],
+        )
+
+    def test_wait_for_db(self):
+        out = io.StringIO()
+        call_command("wait_for_db_script", stdout=out)
+        self.assertIn("Database available!", out.getvalue())
+
+    def test_parse_importtime(self):
+        rows = parse_importtime(
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   theatre_api.jobs\n"
+            "import time:       300 |       4200 | theatre_api\n"
+        )
+        self.assertEqual(
+            rows,
+            [("theatre_api.jobs", 120, 120), ("theatre_api", 300, 4200)],
+        )
+
+    def test_lazy_schema_pages(self):
+        response = self.client.get(reverse("swagger"))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, reverse("schema"))
+
+
+class HealthCheckTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        reset_readiness()
+        self.addCleanup(reset_readiness)
+
+    def test_healthz_does_no_io(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("healthz"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"status": "ok"})
+
+    def test_readyz_reports_checks_with_latency(self):
+        response = self.client.get(reverse("readyz"))
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual(report["status"], "ok")
+        self.assertEqual(
+            set(report["checks"]),
+            {"database", "migrations", "cache", "storage"},
+        )
+        for check in report["checks"].values():
+            self.assertEqual(check["status"], "ok")
+            self.assertGreaterEqual(check["latency_ms"], 0)
+        self.assertIn("no-cache", response["Cache-Control"])
+
+    def test_readyz_results_are_cached(self):
+        self.client.get(reverse("readyz"))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("readyz"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_readyz_fails_when_a_check_fails(self):
+        with override_settings(
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.dummy.DummyCache"
+                }
+            }
+        ):
+            response = self.client.get(reverse("readyz"))
+        self.assertEqual(response.status_code, 503)
+        checks = response.json()["checks"]
+        self.assertEqual(checks["cache"]["status"], "fail")
+        self.assertIn("error", checks["cache"])
+        self.assertEqual(checks["database"]["status"], "ok")
+
+
+class PerformanceSeriesTests(TestCase):
+
+    def setUp(self):
+        create_admin_user()
+        (
+            self.client,
+            self.actor,
+            self.genre,
+            self.theatre_hall,
+            self.play,
+            self.performance,
+            self.reservation_data,
+        ) = setup_common_data(get_admin_token())
+        # Fridays and Saturdays of June 2030, June 3rd is a Monday
+        self.data = {
+            "play": self.play.id,
+            "theatre_hall": self.theatre_hall.id,
+            "frequency": "weekly",
+            "weekdays": [4, 5],
+            "show_time": "19:30",
+            "start_date": "2030-06-03",
+            "end_date": "2030-06-30",
+        }
+
+    def create_series(self, **data):
+        return self.client.post(
+            reverse("theatre_api:performanceseries-list"),
+            {**self.data, **data},
+            format="json",
+        )
+
+    def test_creates_all_performances_at_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.create_series()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["performances"], 8)
+        inserts = [
+            query
+            for query in queries.captured_queries
+            if 'INSERT INTO "theatre_api_performance"' in query["sql"]
+        ]
+        self.assertEqual(len(inserts), 1)
+
+        performances = Performance.objects.filter(
+            series_id=response.data["id"]
+        ).order_by("show_time")
+        self.assertEqual(
+            [
+                timezone.localtime(performance.show_time).day
+                for performance in performances
+            ],
+            [7, 8, 14, 15, 21, 22, 28, 29],
+        )
+        self.assertTrue(
+            all(
+                timezone.localtime(performance.show_time).time()
+                == datetime.time(19, 30)
+                for performance in performances
+            )
+        )
+        self.assertEqual(
+            PerformanceSales.objects.filter(
+                performance_id__in=performances.values("pk")
+            ).count(),
+            8,
+        )
+
+    def test_list_with_sparse_fieldset(self):
+        self.create_series()
+
+        response = self.client.get(
+            reverse("theatre_api:performanceseries-list"),
+            {"fields": "id,performances"},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        [series] = response.data["results"]
+        self.assertEqual(list(series), ["id", "performances"])
+        self.assertEqual(series["performances"], 8)
+
+    def test_daily_interval(self):
+        response = self.create_series(frequency="daily", interval=10)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["weekdays"], [])
+        self.assertEqual(response.data["performances"], 3)
+
+    @override_settings(SERIES_MAX_PERFORMANCES=10)
+    def test_rejects_long_date_ranges_up_front(self):
+        response = self.create_series(end_date="2031-06-03")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("70 days", str(response.data["end_date"]))
+
+        response = self.create_series(end_date="2030-08-12", interval=2)
+        self.assertEqual(response.status_code, 201)
+
+    def test_rejects_hall_conflicts(self):
+        Performance.objects.create(
+            play=self.play,
+            theatre_hall=self.theatre_hall,
+            show_time=timezone.make_aware(
+                datetime.datetime(2030, 6, 14, 18, 0)
+            ),
+        )
+        performances = Performance.objects.count()
+        response = self.create_series()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.data["conflicts"]), 1)
+        self.assertIn("2030-06-14", response.data["conflicts"][0])
+        self.assertEqual(Performance.objects.count(), performances)
+        self.assertFalse(PerformanceSeries.objects.exists())
+
+        response = self.create_series(show_time="22:00")
+        self.assertEqual(response.status_code, 201)
+
+    def test_reschedule(self):
+        series_id = self.create_series().data["id"]
+        june_14 = Performance.objects.get(
+            series_id=series_id, show_time__day=14
+        )
+        self.client.post(
+            reverse("theatre_api:reservation-list"),
+            {"tickets": [{"row": 2, "seat": 3, "performance": june_14.id}]},
+            format="json",
+        )
+        small_hall = TheatreHall.objects.create(
+            name="Small", rows=1, seats_in_row=5
+        )
+        response = self.client.post(
+            reverse(
+                "theatre_api:performanceseries-reschedule", args=[series_id]
+            ),
+            {"theatre_hall": small_hall.id},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("theatre_hall", response.data)
+
+        other_hall = TheatreHall.objects.create(
+            name="Other", rows=5, seats_in_row=5
+        )
+        response = self.client.post(
+            reverse(
+                "theatre_api:performanceseries-reschedule", args=[series_id]
+            ),
+            {
+                "show_time": "20:15",
+                "theatre_hall": other_hall.id,
+                "from_date": "2030-06-10",
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["performances"], 6)
+
+        performances = Performance.objects.filter(series_id=series_id)
+        moved = performances.filter(show_time__gte=june_14.show_time.date())
+        self.assertEqual(
+            {
+                (
+                    timezone.localtime(performance.show_time).time(),
+                    performance.theatre_hall_id,
+                )
+                for performance in moved
+            },
+            {(datetime.time(20, 15), other_hall.id)},
+        )
+        self.assertEqual(
+            performances.filter(theatre_hall=self.theatre_hall).count(), 2
+        )
+        self.assertEqual(
+            set(
+                PerformanceSales.objects.filter(
+                    performance_id__in=moved.values("pk")
+                ).values_list("theatre_hall_id", "capacity")
+            ),
+            {(other_hall.id, 25)},
+        )
+        series = PerformanceSeries.objects.get(pk=series_id)
+        self.assertEqual(series.show_time, datetime.time(20, 15))
+        self.assertEqual(series.theatre_hall, other_hall)
+
+    def test_cancel_from_date(self):
+        series_id = self.create_series().data["id"]
+        june_29 = Performance.objects.get(
+            series_id=series_id, show_time__day=29
+        )
+        self.client.post(
+            reverse("theatre_api:reservation-list"),
+            {"tickets": [{"row": 1, "seat": 1, "performance": june_29.id}]},
+            format="json",
+        )
+        response = self.client.post(
+            reverse("theatre_api:performanceseries-cancel", args=[series_id]),
+            {"from_date": "2030-06-20"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["performances"], 4)
+        self.assertEqual(response.data["tickets"], 1)
+        self.assertEqual(
+            Performance.objects.filter(series_id=series_id).count(), 4
+        )
+
+        response = self.client.delete(
+            reverse("theatre_api:performanceseries-detail", args=[series_id])
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Performance.objects.filter(series_id=series_id))
+
+    def test_staff_only(self):
+        create_user()
+        self.client.credentials(
+            HTTP_AUTHORIZATION="Bearer " + get_user_token()
+        )
+        self.assertEqual(self.create_series().status_code, 403)
@@ -1,7 +1,17 @@
 from rest_framework.throttling import SimpleRateThrottle
 
+from theatre_api import metrics
 
-class StaffRateThrottle(SimpleRateThrottle):
+
+class MetricsThrottleMixin:
+    """Count rejected requests per throttle scope."""
+
+    def throttle_failure(self):
+        metrics.inc("theatre_throttle_rejections_total", {"scope": self.scope})
+        return super().throttle_failure()
+
+
+class StaffRateThrottle(MetricsThrottleMixin, SimpleRateThrottle):
     scope = "staff"
 
     def get_cache_key(self, request, view):
@@ -16,7 +26,7 @@ class StaffRateThrottle(SimpleRateThrottle):
         return None
 
 
-class UserRateThrottle(SimpleRateThrottle):
+class UserRateThrottle(MetricsThrottleMixin, SimpleRateThrottle):
     scope = "user"
 
     def get_cache_key(self, request, view):
@@ -6,8 +6,12 @@ from theatre_api.views import (
     ActorViewSet,
     PlayViewSet,
     PerformanceViewSet,
+    PerformanceSeriesViewSet,
     TheatreHallViewSet,
     ReservationViewSet,
+    ProfileViewSet,
+    AnalyticsViewSet,
+    catalog_view,
 )
 
 app_name = "theatre_api"
@@ -18,7 +22,13 @@ router.register("genres", GenreViewSet)
 router.register("actors", ActorViewSet)
 router.register("plays", PlayViewSet)
 router.register("performances", PerformanceViewSet)
+router.register("performance_series", PerformanceSeriesViewSet)
 router.register("theatre_halls", TheatreHallViewSet, basename="theatre_halls")
 router.register("reservations", ReservationViewSet)
+router.register("profiles", ProfileViewSet, basename="profiles")
+router.register("analytics", AnalyticsViewSet, basename="analytics")
 
-urlpatterns = [path("", include(router.urls))]
+urlpatterns = [
+    path("catalog/<str:name>.json", catalog_view, name="catalog"),
+    path("", include(router.urls)),
+]
@@ -1,6 +1,19 @@
-from datetime import datetime
+from datetime import datetime, time, timedelta
 
-from django.db.models import F, Count
+from django.db.models import F, Count, OuterRef, Prefetch, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.conf import settings
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseForbidden,
+    HttpResponseNotModified,
+    JsonResponse,
+)
+from django.utils import timezone
+from django.utils.cache import add_never_cache_headers, patch_vary_headers
+from django.utils.http import parse_etags
 from drf_spectacular.utils import (
     extend_schema,
     OpenApiExample,
@@ -10,24 +23,64 @@ from drf_spectacular.utils import (
 from rest_framework import mixins, status
 from rest_framework import viewsets
 from rest_framework.decorators import action as action_
-from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import (
+    AllowAny,
+    IsAdminUser,
+    IsAuthenticated,
+)
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
+from theatre_api import catalog, health, metrics
+from theatre_api.checkin import scan_tickets
+from theatre_api.deletion import delete_performances, delete_reservations
+from theatre_api.etickets import FORMATS, render_reservation
+from theatre_api.fieldsets import SparseFieldsetMixin
+from theatre_api.idempotency import REPLAYED_HEADER, IdempotentCreateMixin
+from theatre_api.instrumentation import SerializerTimingMixin
+from theatre_api.jobs import enqueue
+from theatre_api.manifest import (
+    SEQUENCE_HEADER,
+    SIGNATURE_HEADER,
+    build_manifest,
+    sign,
+)
 from theatre_api.models import (
     Genre,
     Actor,
     Play,
     Performance,
+    PerformanceSeries,
     TheatreHall,
     Reservation,
+    Ticket,
+    PerformanceSales,
+    DailyPlaySales,
+    HourlyBookings,
 )
 from theatre_api.paginators import LargeResultsSetPagination
+from theatre_api.reference_cache import get_hall, get_play
+from theatre_api.series import (
+    cancel_series,
+    create_series,
+    reschedule_series,
+)
+from theatre_api.profiling import (
+    get_profile_path,
+    list_profiles,
+    make_profile_token,
+)
 from theatre_api.permissions import (
     IsAdminOrIfAuthenticatedReadOnly,
     IsStaffToDelete,
     IsStaffToCreateDestroyPatchPut,
 )
+from theatre_api.waiting_room import (
+    ADMISSION_HEADER,
+    AdmissionControlMixin,
+    WaitingRoom,
+)
 from theatre_api.serializers import (
     GenreSerializer,
     ActorSerializer,
@@ -38,13 +91,26 @@ from theatre_api.serializers import (
     PerformanceSerializer,
     PerformanceListSerializer,
     PerformanceDetailSerializer,
+    PerformanceCalendarDaySerializer,
+    PerformanceSeriesSerializer,
+    PerformanceSeriesRescheduleSerializer,
+    PerformanceSeriesCancelSerializer,
+    OccupancySerializer,
+    PlaySalesDaySerializer,
+    BookingHourSerializer,
+    CheckInBatchSerializer,
+    CheckInResultSerializer,
+    WaitingRoomSerializer,
     TheatreHallSerializer,
     ReservationSerializer,
     ReservationListSerializer,
+    ReservationHistorySerializer,
 )
 
 
 class GenreViewSet(
+    SparseFieldsetMixin,
+    SerializerTimingMixin,
     mixins.CreateModelMixin,
     mixins.ListModelMixin,
     mixins.DestroyModelMixin,
@@ -78,6 +144,8 @@ class GenreViewSet(
 
 
 class ActorViewSet(
+    SparseFieldsetMixin,
+    SerializerTimingMixin,
     mixins.CreateModelMixin,
     mixins.ListModelMixin,
     mixins.DestroyModelMixin,
@@ -166,6 +234,8 @@ class ActorViewSet(
     ),
 )
 class TheatreHallViewSet(
+    SparseFieldsetMixin,
+    SerializerTimingMixin,
     mixins.CreateModelMixin,
     mixins.ListModelMixin,
     mixins.DestroyModelMixin,
@@ -237,7 +307,9 @@ class TheatreHallViewSet(
         ],
     ),
 )
-class PlayViewSet(viewsets.ModelViewSet):
+class PlayViewSet(
+    SparseFieldsetMixin, SerializerTimingMixin, viewsets.ModelViewSet
+):
     queryset = Play.objects.prefetch_related("genres", "actors")
     serializer_class = PlaySerializer
     permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
@@ -318,6 +390,20 @@ class PlayViewSet(viewsets.ModelViewSet):
                 required=False,
                 type={"type": "string", "format": "date"},
             ),
+            OpenApiParameter(
+                name="date_from",
+                description="Performances on or after a date "
+                "(?date_from=2024-06-01)",
+                required=False,
+                type={"type": "string", "format": "date"},
+            ),
+            OpenApiParameter(
+                name="date_to",
+                description="Performances on or before a date "
+                "(?date_to=2024-06-30)",
+                required=False,
+                type={"type": "string", "format": "date"},
+            ),
             OpenApiParameter(
                 name="play",
                 description="Filter movies that contain particular play name "
@@ -356,15 +442,10 @@ class PlayViewSet(viewsets.ModelViewSet):
         ],
     ),
 )
-class PerformanceViewSet(viewsets.ModelViewSet):
-    queryset = Performance.objects.select_related(
-        "play", "theatre_hall"
-    ).annotate(
-        tickets_available=(
-            F("theatre_hall__rows") * F("theatre_hall__seats_in_row")
-            - Count("tickets")
-        )
-    )
+class PerformanceViewSet(
+    SparseFieldsetMixin, SerializerTimingMixin, viewsets.ModelViewSet
+):
+    queryset = Performance.objects.select_related("play", "theatre_hall")
     serializer_class = PerformanceSerializer
     permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
 
@@ -377,28 +458,405 @@ class PerformanceViewSet(viewsets.ModelViewSet):
 
         return super().get_serializer_class()
 
+    @staticmethod
+    def _parse_date(value, param_name):
+        try:
+            return datetime.strptime(value, "%Y-%m-%d").date()
+        except ValueError:
+            raise ValidationError(
+                {param_name: "Date must be in YYYY-MM-DD format."}
+            )
+
+    @staticmethod
+    def _day_start(date_):
+        """Start of the day in the current timezone, as an aware datetime"""
+        return timezone.make_aware(datetime.combine(date_, time.min))
+
     def get_queryset(self):
         """Retrieve Performances through filters and/or order them."""
         date = self.request.query_params.get("date")
+        date_from = self.request.query_params.get("date_from")
+        date_to = self.request.query_params.get("date_to")
         play_name = self.request.query_params.get("play")
         order = self.request.query_params.get("order")
 
         queryset = self.queryset
 
+        # The ticket count join is the costly part of the list, skip it
+        # when ?fields= leaves tickets_available out
+        fields = self.sparse_fields()
+        if self.action == "list" and (
+            fields is None or "tickets_available" in fields
+        ):
+            queryset = queryset.annotate(
+                tickets_available=(
+                    F("theatre_hall__rows") * F("theatre_hall__seats_in_row")
+                    - Count("tickets")
+                )
+            )
+
+        # Half-open [start, end) ranges on the raw column keep the
+        # show_time index usable, unlike show_time__date casts.
         if date:
-            date = datetime.strptime(date, "%Y-%m-%d").date()
-            queryset = queryset.filter(show_time__date=date)
+            date = self._parse_date(date, "date")
+            date_from = date_to = None
+            queryset = queryset.filter(
+                show_time__gte=self._day_start(date),
+                show_time__lt=self._day_start(date + timedelta(days=1)),
+            )
+
+        if date_from:
+            date_from = self._parse_date(date_from, "date_from")
+            queryset = queryset.filter(
+                show_time__gte=self._day_start(date_from)
+            )
+
+        if date_to:
+            date_to = self._parse_date(date_to, "date_to")
+            queryset = queryset.filter(
+                show_time__lt=self._day_start(date_to + timedelta(days=1))
+            )
 
         if play_name:
             queryset = queryset.filter(play__title__icontains=play_name)
 
         if order == "ASC":
-            queryset = self.queryset.order_by("show_time")
+            queryset = queryset.order_by("show_time")
         elif order == "DESC":
-            queryset = self.queryset.order_by("-show_time")
+            queryset = queryset.order_by("-show_time")
 
         return queryset.distinct()
 
+    @extend_schema(
+        operation_id="performancesCalendar",
+        description="Per-day number of performances and available seats "
+        "for a month, for the booking calendar.",
+        parameters=[
+            OpenApiParameter(
+                name="month",
+                description="Month to show (?month=2024-06), "
+                "defaults to the current month",
+                required=False,
+                type={"type": "string"},
+            ),
+        ],
+        responses={200: PerformanceCalendarDaySerializer(many=True)},
+    )
+    @action_(methods=["GET"], detail=False)
+    def calendar(self, request):
+        """Per-day performances and available seats in one query"""
+        month = request.query_params.get("month")
+        if month:
+            try:
+                first_day = datetime.strptime(month, "%Y-%m").date()
+            except ValueError:
+                raise ValidationError(
+                    {"month": "Month must be in YYYY-MM format."}
+                )
+        else:
+            first_day = timezone.localdate().replace(day=1)
+        next_month = (first_day + timedelta(days=32)).replace(day=1)
+
+        tickets_sold = (
+            Ticket.objects.filter(performance=OuterRef("pk"))
+            .order_by()
+            .values("performance")
+            .annotate(count=Count("id"))
+            .values("count")
+        )
+        days = (
+            Performance.objects.filter(
+                show_time__gte=self._day_start(first_day),
+                show_time__lt=self._day_start(next_month),
+            )
+            .annotate(date=TruncDate("show_time"))
+            .order_by("date")
+            .values("date")
+            .annotate(
+                performances=Count("id"),
+                seats_available=Sum(
+                    F("theatre_hall__rows") * F("theatre_hall__seats_in_row")
+                    - Coalesce(Subquery(tickets_sold), 0)
+                ),
+            )
+        )
+
+        serializer = PerformanceCalendarDaySerializer(days, many=True)
+        return Response(serializer.data)
+
+    @extend_schema(
+        operation_id="performanceWaitingRoom",
+        description="Staff: enable the waiting room of a performance with "
+        "the number of concurrent purchasers (POST) or disable it (DELETE).",
+        request=WaitingRoomSerializer,
+        responses={200: WaitingRoomSerializer},
+    )
+    @action_(
+        methods=["POST", "DELETE"],
+        detail=True,
+        permission_classes=[IsAdminUser],
+        url_path="waiting-room",
+        serializer_class=WaitingRoomSerializer,
+    )
+    def waiting_room(self, request, pk=None):
+        performance = self.get_object()
+        room = WaitingRoom(performance.id)
+
+        if request.method == "DELETE":
+            room.disable()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        room.enable(serializer.validated_data["capacity"])
+        return Response(serializer.data)
+
+    @extend_schema(
+        operation_id="joinPerformanceQueue",
+        description="Join the waiting room of a performance. Poll "
+        "queue-status with the returned queue_token until admitted, then "
+        f"send the admission_token in the {ADMISSION_HEADER} header "
+        "when creating the reservation.",
+        request=None,
+    )
+    @action_(
+        methods=["POST"],
+        detail=True,
+        permission_classes=[IsAuthenticated],
+        url_path="queue",
+    )
+    def join_queue(self, request, pk=None):
+        room = WaitingRoom(self.get_object().id)
+        if room.capacity is None:
+            return Response({"admitted": True, "queue_token": None})
+
+        return Response(
+            room.join(request.user), status=status.HTTP_201_CREATED
+        )
+
+    @extend_schema(
+        operation_id="performanceQueueStatus",
+        description="Queue position or admission token for a queue_token. "
+        "Served from the cache only, no authentication needed.",
+        parameters=[
+            OpenApiParameter(
+                name="token",
+                description="queue_token returned when joining",
+                required=True,
+                type={"type": "string"},
+            ),
+        ],
+    )
+    @action_(
+        methods=["GET"],
+        detail=True,
+        authentication_classes=[],
+        permission_classes=[AllowAny],
+        throttle_classes=[],
+        url_path="queue-status",
+    )
+    def queue_status(self, request, pk=None):
+        token = request.query_params.get("token", "")
+        # Cache only: the queue token names the performance resolved when
+        # joining, a token for another pk is rejected
+        if not pk.isdigit():
+            raise Http404
+        return Response(WaitingRoom(pk).status(token))
+
+    def perform_destroy(self, instance):
+        delete_performances(Performance.objects.filter(pk=instance.pk))
+
+    @extend_schema(
+        operation_id="cancelPerformance",
+        description="Staff: cancel a performance, deleting it with all its "
+        "tickets and the reservations left empty. Returns deleted row "
+        "counts.",
+        request=None,
+    )
+    @action_(methods=["POST"], detail=True, permission_classes=[IsAdminUser])
+    def cancel(self, request, pk=None):
+        performance = self.get_object()
+        deleted = delete_performances(
+            Performance.objects.filter(pk=performance.pk)
+        )
+        return Response(deleted)
+
+    @extend_schema(
+        operation_id="checkInPerformanceTickets",
+        description="Staff: check in a batch of scanned e-ticket QR "
+        "tokens at an entrance. Returns one result per scan, in order. "
+        "Tokens are verified without database queries and check-ins are "
+        "recorded in the background.",
+        request=CheckInBatchSerializer,
+        responses={200: CheckInResultSerializer(many=True)},
+    )
+    @action_(
+        methods=["POST"],
+        detail=True,
+        permission_classes=[IsAdminUser],
+        url_path="check-in",
+        serializer_class=CheckInBatchSerializer,
+    )
+    def check_in(self, request, pk=None):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            performance_id = int(pk)
+        except ValueError:
+            raise Http404
+        results = scan_tickets(
+            performance_id,
+            serializer.validated_data["scans"],
+            request.user,
+            serializer.validated_data["entrance"],
+        )
+        return Response(results)
+
+    @extend_schema(
+        operation_id="performanceCheckInManifest",
+        description="Staff: signed, compressed binary list of the valid "
+        "tickets of a performance for offline scanners (format in "
+        "theatre_api/manifest.py). With ?since=<sequence> only tickets "
+        "sold or cancelled after that sequence are returned.",
+        parameters=[
+            OpenApiParameter(
+                "since",
+                type=int,
+                description="Sequence of the last manifest synced",
+            ),
+        ],
+        responses={(200, "application/octet-stream"): bytes},
+    )
+    @action_(methods=["GET"], detail=True, permission_classes=[IsAdminUser])
+    def manifest(self, request, pk=None):
+        since = request.query_params.get("since")
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                raise ValidationError({"since": "Must be an integer."})
+
+        performance = self.get_object()
+        body, sequence = build_manifest(performance.pk, since)
+        response = HttpResponse(body, content_type="application/octet-stream")
+        response[SEQUENCE_HEADER] = sequence
+        response[SIGNATURE_HEADER] = sign(body)
+        return response
+
+    @extend_schema(
+        operation_id="renderPerformanceETickets",
+        description="Staff: render the e-tickets of all reservations for "
+        "this performance in the background, so downloads are served from "
+        "the cache. Returns the id of the queued job.",
+        request=None,
+    )
+    @action_(
+        methods=["POST"],
+        detail=True,
+        permission_classes=[IsAdminUser],
+        url_path="render-etickets",
+    )
+    def render_etickets(self, request, pk=None):
+        performance = self.get_object()
+        job = enqueue(
+            "render_performance_etickets",
+            {"performance_id": performance.pk, "formats": list(FORMATS)},
+        )
+        return Response({"job": job.pk}, status=status.HTTP_202_ACCEPTED)
+
+
+@extend_schema_view(
+    create=extend_schema(
+        operation_id="createPerformanceSeries",
+        description="Staff: schedule a play in a hall daily or on some "
+        "weekdays, every interval days or weeks between two dates. All "
+        "performances are created at once; the series is rejected with "
+        "the conflicting dates if the hall has another show too close.",
+        examples=[
+            OpenApiExample(
+                "Create a performance series example",
+                summary="Friday and Saturday evenings in November.",
+                value={
+                    "play": 1,
+                    "theatre_hall": 1,
+                    "frequency": "weekly",
+                    "weekdays": [4, 5],
+                    "show_time": "19:30",
+                    "start_date": "2024-11-01",
+                    "end_date": "2024-11-30",
+                },
+            )
+        ],
+    ),
+    destroy=extend_schema(
+        operation_id="deletePerformanceSeries",
+        description="Staff: cancel the upcoming performances of a series "
+        "and delete it. Past performances are kept.",
+    ),
+)
+class PerformanceSeriesViewSet(
+    SparseFieldsetMixin,
+    SerializerTimingMixin,
+    mixins.CreateModelMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet,
+):
+    queryset = (
+        PerformanceSeries.objects.select_related("play", "theatre_hall")
+        .annotate(performance_count=Count("performances"))
+        .order_by("-start_date", "-pk")
+    )
+    serializer_class = PerformanceSeriesSerializer
+    permission_classes = (IsAdminUser,)
+
+    def perform_create(self, serializer):
+        series = PerformanceSeries(**serializer.validated_data)
+        series.performance_count = len(create_series(series))
+        serializer.instance = series
+
+    def perform_destroy(self, instance):
+        cancel_series(instance)
+        instance.delete()
+
+    @extend_schema(
+        operation_id="reschedulePerformanceSeries",
+        description="Staff: move the performances of a series from a day "
+        "on (today by default) to another time of day and/or hall. "
+        "Returns the number of performances moved.",
+        request=PerformanceSeriesRescheduleSerializer,
+    )
+    @action_(
+        methods=["POST"],
+        detail=True,
+        serializer_class=PerformanceSeriesRescheduleSerializer,
+    )
+    def reschedule(self, request, pk=None):
+        series = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        moved = reschedule_series(series, **serializer.validated_data)
+        return Response({"performances": moved})
+
+    @extend_schema(
+        operation_id="cancelPerformanceSeries",
+        description="Staff: cancel the performances of a series from a day "
+        "on (today by default), deleting them with all their tickets and "
+        "the reservations left empty. Returns deleted row counts.",
+        request=PerformanceSeriesCancelSerializer,
+    )
+    @action_(
+        methods=["POST"],
+        detail=True,
+        serializer_class=PerformanceSeriesCancelSerializer,
+    )
+    def cancel(self, request, pk=None):
+        series = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(cancel_series(series, **serializer.validated_data))
+
 
 @extend_schema_view(
     list=extend_schema(
@@ -418,7 +876,18 @@ class PerformanceViewSet(viewsets.ModelViewSet):
     create=extend_schema(
         operation_id="createReservation",
         methods=["POST"],
-        description="Create a new reservation with tickets info specified.",
+        description="Create a new reservation with tickets info specified. "
+        "Send an Idempotency-Key header to make retries safe: a retry "
+        "with the same key and body returns the first response.",
+        parameters=[
+            OpenApiParameter(
+                name="Idempotency-Key",
+                location=OpenApiParameter.HEADER,
+                description="Unique key of this reservation attempt",
+                required=False,
+                type={"type": "string"},
+            ),
+        ],
         request=ReservationSerializer,
         responses={201: ReservationSerializer},
         examples=[
@@ -444,6 +913,10 @@ class PerformanceViewSet(viewsets.ModelViewSet):
     ),
 )
 class ReservationViewSet(
+    SparseFieldsetMixin,
+    SerializerTimingMixin,
+    IdempotentCreateMixin,
+    AdmissionControlMixin,
     mixins.ListModelMixin,
     mixins.CreateModelMixin,
     mixins.DestroyModelMixin,
@@ -454,20 +927,30 @@ class ReservationViewSet(
     Staff users can delete any reservation, regular users cannot delete any.
     """
 
-    queryset = Reservation.objects.prefetch_related(
-        "tickets__performance__play", "tickets__performance__theatre_hall"
-    )
+    # Play and hall data comes from the reference cache
+    queryset = Reservation.objects.prefetch_related("tickets__performance")
     serializer_class = ReservationSerializer
     permission_classes = (IsAuthenticated, IsStaffToDelete)
+    sparse_fieldset_actions = ("list", "history")
 
     def get_serializer_class(self):
         if self.action == "list":
             return ReservationListSerializer
+        if self.action == "history":
+            return ReservationHistorySerializer
         return super().get_serializer_class()
 
     def get_queryset(self):
         queryset = self.queryset
 
+        if self.action == "history":
+            queryset = Reservation.objects.prefetch_related(
+                Prefetch(
+                    "tickets",
+                    queryset=Ticket.objects.select_related("performance"),
+                )
+            )
+
         if self.request.user.is_staff:
             user = self.request.query_params.get("user")
 
@@ -477,5 +960,313 @@ class ReservationViewSet(
             return queryset.distinct()
         return queryset.filter(user=self.request.user)
 
+    @staticmethod
+    def _is_seat_conflict(error) -> bool:
+        codes = error.get_codes()
+        pending = [codes]
+        while pending:
+            item = pending.pop()
+            if isinstance(item, dict):
+                pending.extend(item.values())
+            elif isinstance(item, list):
+                pending.extend(item)
+            elif item == "unique":
+                return True
+        return False
+
+    def create(self, request, *args, **kwargs):
+        try:
+            response = super().create(request, *args, **kwargs)
+        except ValidationError as error:
+            outcome = (
+                "seat_conflict"
+                if self._is_seat_conflict(error)
+                else "validation_error"
+            )
+            metrics.inc("theatre_reservations_total", {"outcome": outcome})
+            raise
+        if not response.has_header(REPLAYED_HEADER):
+            metrics.inc("theatre_reservations_total", {"outcome": "success"})
+        return response
+
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+
+    def perform_destroy(self, instance):
+        delete_reservations(Reservation.objects.filter(pk=instance.pk))
+
+    @extend_schema(
+        operation_id="listReservationHistory",
+        description="Your reservations (or any user's with ?user= for "
+        "staff) with tickets grouped by performance. Each performance is "
+        "listed once per reservation with its seats as [row, seat] pairs.",
+    )
+    @action_(methods=["GET"], detail=False)
+    def history(self, request):
+        """Reservation history in a fixed number of queries"""
+        return self.list(request)
+
+    @extend_schema(
+        operation_id="downloadReservationETickets",
+        description="Printable tickets of a reservation with a signed QR "
+        "code each: a PDF with one page per ticket, or a PNG with "
+        "?type=png.",
+        parameters=[
+            OpenApiParameter(
+                "type",
+                type=str,
+                enum=list(FORMATS),
+                description="File type, pdf by default",
+            ),
+        ],
+        responses={(200, "application/pdf"): bytes},
+    )
+    @action_(methods=["GET"], detail=True)
+    def etickets(self, request, pk=None):
+        file_format = request.query_params.get("type", "pdf")
+        if file_format not in FORMATS:
+            raise ValidationError(
+                {"type": f"Must be one of: {', '.join(FORMATS)}."}
+            )
+
+        reservation = self.get_object()
+        path = render_reservation(reservation, file_format)
+        if path is None:
+            raise Http404("Reservation has no tickets.")
+
+        return FileResponse(
+            open(path, "rb"),
+            as_attachment=True,
+            filename=f"reservation-{reservation.pk}.{file_format}",
+            content_type=FORMATS[file_format],
+        )
+
+
+_DATE_RANGE_PARAMETERS = [
+    OpenApiParameter(
+        name=name,
+        description=f"{description} (ex. ?{name}=2024-06-01)",
+        required=False,
+        type={"type": "string"},
+    )
+    for name, description in (
+        ("date_from", "First day to include"),
+        ("date_to", "Last day to include"),
+    )
+]
+
+
+class AnalyticsViewSet(viewsets.ViewSet):
+    """
+    Staff-only sales reports, read from the rollup tables maintained by
+    `theatre_api.analytics` instead of the ticket table.
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    OCCUPANCY_GROUPS = {
+        "play": "play_id",
+        "hall": "theatre_hall_id",
+        "day": "show_date",
+    }
+
+    def _filter_dates(self, queryset, field):
+        for param, lookup in (("date_from", "gte"), ("date_to", "lte")):
+            value = self.request.query_params.get(param)
+            if value:
+                queryset = queryset.filter(
+                    **{
+                        f"{field}__{lookup}": PerformanceViewSet._parse_date(
+                            value, param
+                        )
+                    }
+                )
+        return queryset
+
+    @staticmethod
+    def _group_name(group, key) -> str:
+        if group == "day":
+            return key.isoformat()
+        info = get_play(key) if group == "play" else get_hall(key)
+        if info is None:
+            return ""
+        return info.title if group == "play" else info.name
+
+    @extend_schema(
+        operation_id="analyticsOccupancy",
+        description="Staff: seats sold and occupancy per play, hall or "
+        "show day, for performances in the date range.",
+        parameters=[
+            OpenApiParameter(
+                name="by",
+                description="Group by play (default), hall or day",
+                required=False,
+                type=str,
+                enum=["play", "hall", "day"],
+            ),
+            *_DATE_RANGE_PARAMETERS,
+        ],
+        responses={200: OccupancySerializer(many=True)},
+    )
+    @action_(methods=["GET"], detail=False)
+    def occupancy(self, request):
+        group = request.query_params.get("by", "play")
+        if group not in self.OCCUPANCY_GROUPS:
+            raise ValidationError(
+                {"by": f"Must be one of: {', '.join(self.OCCUPANCY_GROUPS)}."}
+            )
+        field = self.OCCUPANCY_GROUPS[group]
+
+        rows = (
+            self._filter_dates(PerformanceSales.objects.all(), "show_date")
+            .values(field)
+            .annotate(
+                performances=Count("pk"),
+                capacity=Sum("capacity"),
+                tickets_sold=Sum("tickets"),
+            )
+            .order_by(field)
+        )
+        data = [
+            {
+                "key": str(row[field]),
+                "name": self._group_name(group, row[field]),
+                "performances": row["performances"],
+                "capacity": row["capacity"],
+                "tickets_sold": row["tickets_sold"],
+                "occupancy": (
+                    round(100 * row["tickets_sold"] / row["capacity"], 1)
+                    if row["capacity"]
+                    else 0.0
+                ),
+            }
+            for row in rows
+        ]
+        return Response(OccupancySerializer(data, many=True).data)
+
+    @extend_schema(
+        operation_id="analyticsSales",
+        description="Staff: tickets booked per play and day, from the "
+        "reservation dates.",
+        parameters=[
+            OpenApiParameter(
+                name="play",
+                description="Only this play (ex. ?play=2)",
+                required=False,
+                type=int,
+            ),
+            *_DATE_RANGE_PARAMETERS,
+        ],
+        responses={200: PlaySalesDaySerializer(many=True)},
+    )
+    @action_(methods=["GET"], detail=False)
+    def sales(self, request):
+        days = self._filter_dates(DailyPlaySales.objects.all(), "date")
+        play = request.query_params.get("play")
+        if play:
+            if not play.isdigit():
+                raise ValidationError({"play": "Must be a play id."})
+            days = days.filter(play_id=play)
+
+        data = [
+            {
+                "date": date,
+                "play": play_id,
+                "title": self._group_name("play", play_id),
+                "tickets": tickets,
+            }
+            for date, play_id, tickets in days.order_by(
+                "date", "play_id"
+            ).values_list("date", "play_id", "tickets")
+        ]
+        return Response(PlaySalesDaySerializer(data, many=True).data)
+
+    @extend_schema(
+        operation_id="analyticsBookingHours",
+        description="Staff: tickets booked per weekday and hour of the "
+        "day, busiest first.",
+        responses={200: BookingHourSerializer(many=True)},
+    )
+    @action_(methods=["GET"], detail=False, url_path="booking-hours")
+    def booking_hours(self, request):
+        hours = HourlyBookings.objects.order_by(
+            "-tickets", "weekday", "hour"
+        ).values("weekday", "hour", "tickets")
+        return Response(BookingHourSerializer(hours, many=True).data)
+
+
+class ProfileViewSet(viewsets.ViewSet):
+    """
+    Staff-only access to request profiles stored by
+    `SamplingProfilerMiddleware`: list them, download one,
+    or get a signed token that makes requests run profiled.
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def list(self, request):
+        return Response(list_profiles())
+
+    def retrieve(self, request, pk=None):
+        path = get_profile_path(pk)
+        if path is None:
+            raise Http404
+
+        return FileResponse(open(path, "rb"), as_attachment=True)
+
+    @action_(methods=["POST"], detail=False)
+    def token(self, request):
+        """Token to send in the `X-Profile` header or `_profile` param"""
+        return Response({"token": make_profile_token(request.user)})
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, see `metrics.scrape_allowed`"""
+    if not metrics.scrape_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        metrics.render_metrics(), content_type=metrics.CONTENT_TYPE
+    )
+
+
+def healthz_view(request):
+    """Liveness probe: the process answers, no I/O"""
+    response = JsonResponse({"status": "ok"})
+    add_never_cache_headers(response)
+    return response
+
+
+def readyz_view(request):
+    """Readiness probe: cached deep checks, see `theatre_api.health`"""
+    report = health.readiness()
+    response = JsonResponse(
+        report, status=200 if report["status"] == "ok" else 503
+    )
+    add_never_cache_headers(response)
+    return response
+
+
+def catalog_view(request, name):
+    """
+    Public catalog snapshot built by `theatre_api.catalog`, served
+    pre-compressed with a strong ETag and without any query.
+    """
+    manifest = catalog.current_manifest()
+    if manifest is None or name not in manifest["etags"]:
+        raise Http404("No catalog snapshot.")
+
+    path, encoding, etag = catalog.snapshot_file(
+        manifest, name, request.headers.get("Accept-Encoding", "")
+    )
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(
+            open(path, "rb"), content_type="application/json"
+        )
+        if encoding:
+            response["Content-Encoding"] = encoding
+    response["ETag"] = etag
+    response["Cache-Control"] = f"public, max-age={settings.CATALOG_MAX_AGE}"
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
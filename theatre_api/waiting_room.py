@@ -0,0 +1,214 @@
+"""
+Virtual waiting room for on-sale spikes.
+
+Staff enable it per performance with a capacity N. Buyers join the queue
+and get a signed queue token with their position; polling the status
+with that token admits them once one of the N purchase slots is free and
+their turn has come, and returns a signed admission token. The
+reservation endpoint only accepts tickets for gated performances with a
+valid admission token whose slot is still held; the slot is released
+once the reservation is created or after `WAITING_ROOM_ADMISSION_TTL`.
+
+All state lives in the Django cache, the database is never touched, so
+the cache must be shared by all workers (`CACHE_URL`, enforced by the
+`theatre_api.E001` deploy check).
+"""
+
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from rest_framework.exceptions import PermissionDenied
+
+ADMISSION_HEADER = "X-Admission-Token"
+_QUEUE_SALT = "theatre_api.waiting_room.queue"
+_ADMISSION_SALT = "theatre_api.waiting_room.admission"
+
+
+class WaitingRoom:
+    def __init__(self, performance_id):
+        self.performance_id = int(performance_id)
+        self._prefix = f"waiting_room:{self.performance_id}"
+
+    def _key(self, name) -> str:
+        return f"{self._prefix}:{name}"
+
+    def _slot_key(self, slot) -> str:
+        return self._key(f"slot:{slot}")
+
+    @property
+    def capacity(self):
+        """Number of concurrent purchasers, `None` when the room is off"""
+        return cache.get(self._key("capacity"))
+
+    def enable(self, capacity):
+        cache.set(self._key("capacity"), capacity, timeout=None)
+        cache.add(self._key("joined"), 0, timeout=None)
+        cache.add(self._key("serving"), 0, timeout=None)
+
+    def disable(self):
+        cache.delete_many(
+            [
+                self._key("capacity"),
+                self._key("joined"),
+                self._key("serving"),
+                self._key("advanced_at"),
+            ]
+        )
+
+    def join(self, user) -> dict:
+        cache.add(self._key("joined"), 0, timeout=None)
+        position = cache.incr(self._key("joined"))
+        token = signing.dumps(
+            {"p": self.performance_id, "q": position, "u": user.pk},
+            salt=_QUEUE_SALT,
+        )
+        return {"position": position, "queue_token": token}
+
+    def status(self, queue_token) -> dict:
+        try:
+            data = signing.loads(queue_token, salt=_QUEUE_SALT)
+        except signing.BadSignature:
+            raise PermissionDenied("Invalid queue token.")
+        if data["p"] != self.performance_id:
+            raise PermissionDenied("Queue token is for another performance.")
+
+        capacity = self.capacity
+        if capacity is None:
+            return {"admitted": True, "admission_token": None}
+
+        position = data["q"]
+        slot_keys = [self._slot_key(slot) for slot in range(capacity)]
+        values = cache.get_many(
+            [*slot_keys, self._key("serving"), self._key("advanced_at")]
+        )
+        serving = values.get(self._key("serving"), 0)
+        taken = {
+            slot: values[key]
+            for slot, key in enumerate(slot_keys)
+            if key in values
+        }
+
+        for slot, holder in taken.items():
+            if holder == position:
+                return self._admitted(data, slot)
+
+        free_slots = [slot for slot in range(capacity) if slot not in taken]
+        serving = self._advance(serving, free_slots, values)
+        if free_slots and position <= serving + len(free_slots):
+            for slot in free_slots:
+                if cache.add(
+                    self._slot_key(slot),
+                    position,
+                    timeout=settings.WAITING_ROOM_ADMISSION_TTL,
+                ):
+                    if position > serving:
+                        cache.set(self._key("serving"), position, None)
+                    return self._admitted(data, slot)
+
+        return {
+            "admitted": False,
+            "position": position,
+            "ahead": max(position - serving - 1, 0),
+        }
+
+    def _advance(self, serving, free_slots, values):
+        """
+        Let the queue move past buyers who left: when slots stay free
+        for `WAITING_ROOM_CALL_GRACE` seconds, call the next positions.
+        """
+        now = time.time()
+        advanced_at = values.get(self._key("advanced_at"))
+        if advanced_at is None:
+            cache.set(self._key("advanced_at"), now, None)
+        elif (
+            free_slots and now - advanced_at > settings.WAITING_ROOM_CALL_GRACE
+        ):
+            serving += len(free_slots)
+            cache.set_many(
+                {self._key("serving"): serving, self._key("advanced_at"): now},
+                None,
+            )
+        return serving
+
+    def _admitted(self, data, slot) -> dict:
+        token = signing.dumps({**data, "s": slot}, salt=_ADMISSION_SALT)
+        return {"admitted": True, "admission_token": token}
+
+    def check_admission(self, tokens, user):
+        """
+        Admission data of the first of `tokens` that holds a live slot
+        for this performance, raise `PermissionDenied` if there is none.
+        """
+        if not tokens:
+            raise PermissionDenied(
+                f"Performance {self.performance_id} is in high demand, "
+                f"join its waiting room first."
+            )
+        for token in tokens:
+            try:
+                data = signing.loads(
+                    token,
+                    salt=_ADMISSION_SALT,
+                    max_age=settings.WAITING_ROOM_ADMISSION_TTL,
+                )
+            except signing.BadSignature:
+                continue
+            if (
+                data["p"] == self.performance_id
+                and data["u"] == user.pk
+                and cache.get(self._slot_key(data["s"])) == data["q"]
+            ):
+                return data
+        raise PermissionDenied("Invalid or expired admission token.")
+
+    def release(self, admission):
+        if cache.get(self._slot_key(admission["s"])) == admission["q"]:
+            cache.delete(self._slot_key(admission["s"]))
+
+
+def gated_rooms(performance_ids) -> list:
+    """Waiting rooms that are enabled, in one cache round trip"""
+    rooms = {
+        performance_id: WaitingRoom(performance_id)
+        for performance_id in performance_ids
+    }
+    capacities = cache.get_many(
+        [room._key("capacity") for room in rooms.values()]
+    )
+    return [
+        room for room in rooms.values() if room._key("capacity") in capacities
+    ]
+
+
+class AdmissionControlMixin:
+    """Require admission tokens when reserving gated performances."""
+
+    def create(self, request, *args, **kwargs):
+        tickets = request.data.get("tickets")
+        performance_ids = set()
+        for ticket in tickets if isinstance(tickets, list) else []:
+            try:
+                performance_ids.add(int(ticket["performance"]))
+            except (KeyError, TypeError, ValueError):
+                continue
+
+        rooms = gated_rooms(performance_ids) if performance_ids else []
+        if not rooms:
+            return super().create(request, *args, **kwargs)
+
+        # One token per gated performance, comma separated
+        tokens = [
+            token.strip()
+            for token in request.headers.get(ADMISSION_HEADER, "").split(",")
+            if token.strip()
+        ]
+        admissions = [
+            (room, room.check_admission(tokens, request.user))
+            for room in rooms
+        ]
+        response = super().create(request, *args, **kwargs)
+        for room, admission in admissions:
+            room.release(admission)
+        return response
@@ -5,3 +5,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "theatre_core.settings")
 
 application = get_asgi_application()
+
+from theatre_core.startup import warm_up  # noqa: E402
+
+warm_up()
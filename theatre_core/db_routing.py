@@ -0,0 +1,127 @@
+"""
+Read-replica routing.
+
+`ReplicaRoutingMiddleware` sends safe-method requests to theatre_api views
+to one of `DATABASE_REPLICAS`, picked once per request. The first write statement
+run on the primary (not merely routing a query there, as lookups that
+must see fresh rows do) pins the rest of the request to the primary,
+and sets a short-lived
+cookie so the client keeps reading from the primary for
+`REPLICA_LAG_SECONDS`, long enough for replicas to catch up.
+Clients can also force the primary with `X-Read-Consistency: primary`.
+"""
+
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+PRIMARY = "default"
+PIN_COOKIE = "db_primary_pin"
+CONSISTENCY_HEADER = "X-Read-Consistency"
+REPLICA_APP_LABELS = {"theatre_api"}
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+WRITE_STATEMENTS = {"INSERT", "UPDATE", "DELETE"}
+
+_state = ContextVar("db_routing_state", default=None)
+
+
+class RoutingState:
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+
+
+def _pin_on_write(state):
+    """Primary `execute_wrapper` noting the first write statement"""
+
+    def wrapper(execute, sql, params, many, context):
+        if not state.wrote and sql.lstrip()[:6].upper() in WRITE_STATEMENTS:
+            state.replica = None
+            state.wrote = True
+        return execute(sql, params, many, context)
+
+    return wrapper
+
+
+def pin_to_primary():
+    """Send the remaining reads of the current request to the primary"""
+    state = _state.get()
+    if state is not None:
+        state.replica = None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if (
+            state is not None
+            and state.replica
+            and model._meta.app_label in REPLICA_APP_LABELS
+        ):
+            return state.replica
+        return None
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            with connections[PRIMARY].execute_wrapper(_pin_on_write(state)):
+                response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote:
+            response.set_cookie(
+                PIN_COOKIE,
+                "1",
+                max_age=settings.REPLICA_LAG_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+    @staticmethod
+    def _wants_primary(request) -> bool:
+        return (
+            request.headers.get(CONSISTENCY_HEADER, "").lower() == "primary"
+            or PIN_COOKIE in request.COOKIES
+        )
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _state.get()
+        view_class = getattr(view_func, "cls", None)
+        if (
+            state is None
+            or request.method not in SAFE_METHODS
+            or view_class is None
+            or not view_class.__module__.startswith("theatre_api.")
+            or self._wants_primary(request)
+        ):
+            return None
+
+        state.replica = random.choice(settings.DATABASE_REPLICAS)
+        return None
@@ -0,0 +1,127 @@
+"""
+PostgreSQL backend that borrows connections from a psycopg 3
+`ConnectionPool` instead of opening one per thread.
+
+Enabled with `?pool=true` on `DATABASE_URL`; other pool options:
+`pool_min_size`, `pool_max_size`, `pool_timeout` (seconds to wait for a
+free connection), `pool_max_idle`, `pool_max_lifetime` and `pool_check`
+(health-check connections before handing them out).
+Django "closes" the connection at the end of each request, which puts
+it back into the pool, rolling back any transaction left open.
+"""
+
+import os
+import threading
+import time
+
+from django.db import OperationalError
+from django.db.backends.postgresql import base
+from psycopg import IsolationLevel
+from psycopg_pool import ConnectionPool, PoolTimeout
+
+from theatre_api import metrics
+
+POOL_OPTIONS = {
+    "pool": bool,
+    "pool_min_size": int,
+    "pool_max_size": int,
+    "pool_timeout": float,
+    "pool_max_idle": float,
+    "pool_max_lifetime": float,
+    "pool_check": bool,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(alias, conn_params, options) -> ConnectionPool:
+    # Pools are per process: their worker threads do not survive a fork.
+    key = (alias, os.getpid())
+    pool = _pools.get(key)
+    if pool is not None:
+        return pool
+
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            min_size = options.get("pool_min_size", 1)
+            pool = ConnectionPool(
+                kwargs=conn_params,
+                min_size=min_size,
+                max_size=max(options.get("pool_max_size", 10), min_size),
+                timeout=options.get("pool_timeout", 30.0),
+                max_idle=options.get("pool_max_idle", 10 * 60.0),
+                max_lifetime=options.get("pool_max_lifetime", 60 * 60.0),
+                check=(
+                    ConnectionPool.check_connection
+                    if options.get("pool_check", True)
+                    else None
+                ),
+                name=f"theatre-{alias}",
+                open=True,
+            )
+            _pools[key] = pool
+    return pool
+
+
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    @property
+    def pool_options(self) -> dict:
+        options = self.settings_dict["OPTIONS"]
+        return {
+            name: cast(options[name])
+            for name, cast in POOL_OPTIONS.items()
+            if name in options
+        }
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        for name in POOL_OPTIONS:
+            conn_params.pop(name, None)
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        pool = _get_pool(self.alias, conn_params, self.pool_options)
+
+        self.pool = pool
+        started = time.perf_counter()
+        try:
+            connection = pool.getconn()
+        except PoolTimeout as error:
+            metrics.inc(
+                "theatre_db_pool_timeouts_total", {"alias": self.alias}
+            )
+            raise OperationalError(str(error)) from error
+        metrics.observe(
+            "theatre_db_pool_wait_seconds",
+            time.perf_counter() - started,
+            {"alias": self.alias},
+        )
+
+        options = self.settings_dict["OPTIONS"]
+        isolation_level = options.get("isolation_level")
+        self.isolation_level = IsolationLevel(
+            isolation_level or IsolationLevel.READ_COMMITTED
+        )
+        if isolation_level is not None:
+            connection.isolation_level = self.isolation_level
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+
+        connection = self.connection
+        with self.wrap_database_errors:
+            if not connection.closed and not connection.autocommit:
+                # Don't hand a half-done transaction to the next request.
+                connection.rollback()
+            self.pool.putconn(connection)
@@ -0,0 +1,109 @@
+"""
+Pre-generated OpenAPI schema.
+
+`manage.py build_schema` generates the schema once, as YAML and JSON
+files named after the API version and a hash of the content, in
+`SCHEMA_DIR`; `current.json` there points to the latest build.
+`PrebuiltSchemaView` serves those files with a strong ETag and caching
+headers, so neither the Swagger and ReDoc pages nor API clients make
+the app introspect every view again. Without a build the schema is
+generated live, in DEBUG only.
+"""
+
+import hashlib
+import json
+import os
+import uuid
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils.http import parse_etags
+from drf_spectacular.generators import SchemaGenerator
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SCHEMA_KWARGS, SpectacularAPIView
+
+CURRENT = "current.json"
+RENDERERS = {"yaml": OpenApiYamlRenderer, "json": OpenApiJsonRenderer}
+
+
+def build_schema() -> dict:
+    """Generate the schema files, switch to them and return the manifest"""
+    schema = SchemaGenerator().get_schema(request=None, public=True)
+    bodies = {
+        suffix: renderer().render(schema, renderer_context={})
+        for suffix, renderer in RENDERERS.items()
+    }
+    etag = hashlib.sha256(bodies["json"]).hexdigest()[:16]
+    prefix = f"openapi-{spectacular_settings.VERSION}-{etag}"
+
+    os.makedirs(settings.SCHEMA_DIR, exist_ok=True)
+    manifest = {"etag": etag, "files": {}}
+    for suffix, body in bodies.items():
+        name = f"{prefix}.{suffix}"
+        tmp = os.path.join(settings.SCHEMA_DIR, f".{name}.{uuid.uuid4().hex}")
+        with open(tmp, "wb") as file:
+            file.write(body)
+        os.replace(tmp, os.path.join(settings.SCHEMA_DIR, name))
+        manifest["files"][suffix] = name
+
+    current = os.path.join(settings.SCHEMA_DIR, CURRENT)
+    tmp = f"{current}.{uuid.uuid4().hex}"
+    with open(tmp, "w") as file:
+        json.dump(manifest, file)
+    os.replace(tmp, current)
+
+    for name in os.listdir(settings.SCHEMA_DIR):
+        if name.startswith("openapi-") and not name.startswith(prefix):
+            os.remove(os.path.join(settings.SCHEMA_DIR, name))
+    return manifest
+
+
+_current = {"mtime": None, "manifest": None}
+
+
+def current_manifest() -> dict | None:
+    """Manifest of the latest build, re-read when the file changes"""
+    path = os.path.join(settings.SCHEMA_DIR, CURRENT)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if mtime != _current["mtime"]:
+        with open(path) as file:
+            _current["manifest"] = json.load(file)
+        _current["mtime"] = mtime
+    return _current["manifest"]
+
+
+class PrebuiltSchemaView(SpectacularAPIView):
+    """`SpectacularAPIView` serving the files of `build_schema`"""
+
+    @extend_schema(**SCHEMA_KWARGS)
+    def get(self, request, *args, **kwargs):
+        manifest = current_manifest()
+        if manifest is None:
+            if settings.DEBUG:
+                return super().get(request, *args, **kwargs)
+            raise Http404("Schema not built, run manage.py build_schema.")
+
+        renderer, media_type = self.perform_content_negotiation(
+            request, force=True
+        )
+        suffix = "json" if renderer.format == "json" else "yaml"
+        etag = f'"{manifest["etag"]}-{suffix}"'
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+        else:
+            name = manifest["files"][suffix]
+            response = FileResponse(
+                open(os.path.join(settings.SCHEMA_DIR, name), "rb"),
+                content_type=media_type,
+                filename=name,
+            )
+        response["ETag"] = etag
+        response["Cache-Control"] = (
+            f"public, max-age={settings.SCHEMA_CACHE_MAX_AGE}"
+        )
+        return response
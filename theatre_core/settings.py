@@ -1,8 +1,10 @@
 from datetime import timedelta
 from pathlib import Path
+from urllib.parse import urlsplit
 
 import dj_database_url
-from decouple import config
+from decouple import Csv, config
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -36,6 +38,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "theatre_api.metrics.MetricsMiddleware",
+    "theatre_api.instrumentation.QueryTimingMiddleware",
+    "theatre_api.profiling.SamplingProfilerMiddleware",
+    "theatre_core.db_routing.ReplicaRoutingMiddleware",
+    "theatre_api.reference_cache.ReferenceCacheMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -71,6 +78,70 @@ DATABASE_URL = config("DATABASE_URL", default="sqlite:///db.sqlite3")
 
 DATABASES = {"default": dj_database_url.parse(DATABASE_URL, conn_max_age=600)}
 
+# Read replicas (comma separated URLs). Safe-method theatre_api requests
+# read from them, see theatre_core/db_routing.py. In tests they mirror
+# the default database.
+DATABASE_REPLICA_URLS = config("DATABASE_REPLICA_URLS", default="", cast=Csv())
+
+for index, replica_url in enumerate(DATABASE_REPLICA_URLS):
+    DATABASES[f"replica_{index}"] = {
+        **dj_database_url.parse(replica_url, conn_max_age=600),
+        "TEST": {"MIRROR": "default"},
+    }
+
+# `?pool=true` on a Postgres URL switches to the pooled backend, see
+# theatre_core/postgresql_pool/base.py. Connections go back to the pool
+# at the end of every request, so they are not kept by Django itself.
+for database in DATABASES.values():
+    if database.get("OPTIONS", {}).get("pool"):
+        database["ENGINE"] = "theatre_core.postgresql_pool"
+        database["CONN_MAX_AGE"] = 0
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+DATABASE_ROUTERS = ["theatre_core.db_routing.ReplicaRouter"]
+
+# How long a client keeps reading from the primary after a write
+REPLICA_LAG_SECONDS = config("REPLICA_LAG_SECONDS", default=5, cast=int)
+
+# Cache shared by all worker processes: waiting rooms, check-in
+# deduplication, reference cache versions and throttling rely on it.
+# CACHE_URL is redis://host:6379/0, memcached://host:11211 (needs
+# pymemcache), db://table_name (run createcachetable first) or locmem://,
+# which is per process and only fit for a single-process development
+# server. `manage.py check --deploy` rejects it.
+CACHE_URL = config("CACHE_URL", default="locmem://")
+_cache_url = urlsplit(CACHE_URL)
+if _cache_url.scheme in ("redis", "rediss"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_URL,
+        }
+    }
+elif _cache_url.scheme == "memcached":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache",
+            "LOCATION": _cache_url.netloc,
+        }
+    }
+elif _cache_url.scheme == "db":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": _cache_url.netloc or "theatre_cache",
+        }
+    }
+elif _cache_url.scheme == "locmem":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"Unsupported CACHE_URL: {CACHE_URL}")
+CACHE_SHARED = _cache_url.scheme != "locmem"
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework_simplejwt.authentication.JWTAuthentication",
@@ -90,6 +161,136 @@ REST_FRAMEWORK = {
     },
 }
 
+# Per-request SQL/serializer timings (Server-Timing header) and query budgets
+SERVER_TIMING_ENABLED = config(
+    "SERVER_TIMING_ENABLED", default=True, cast=bool
+)
+
+# Max number of queries per "<METHOD> <url name>", exceeding it logs a warning
+# or raises `QueryBudgetExceeded` when QUERY_BUDGET_STRICT is on.
+QUERY_BUDGETS = {
+    "GET theatre_api:play-list": 5,
+    "GET theatre_api:performance-list": 5,
+    "GET theatre_api:performance-detail": 5,
+    "GET theatre_api:reservation-list": 8,
+    "GET theatre_api:reservation-history": 7,
+}
+QUERY_BUDGET_DEFAULT = config(
+    "QUERY_BUDGET_DEFAULT", default="", cast=lambda v: int(v) if v else None
+)
+QUERY_BUDGET_STRICT = config("QUERY_BUDGET_STRICT", default=False, cast=bool)
+
+# On-demand request profiling, see theatre_api/profiling.py
+PROFILING_ENABLED = config("PROFILING_ENABLED", default=False, cast=bool)
+PROFILING_SAMPLE_RATE = config(
+    "PROFILING_SAMPLE_RATE", default=0.0, cast=float
+)
+PROFILING_MODE = config("PROFILING_MODE", default="sampler")  # or "cprofile"
+PROFILING_SAMPLER_INTERVAL = 0.005
+PROFILING_TOKEN_MAX_AGE = 60 * 60
+PROFILING_DIR = config("PROFILING_DIR", default=str(BASE_DIR / "profiles"))
+# Older profiles are deleted when a new one is saved
+PROFILING_MAX_PROFILES = config(
+    "PROFILING_MAX_PROFILES", default=200, cast=int
+)
+
+# Prometheus metrics at /metrics. Set METRICS_DIR to a directory shared
+# by all worker processes of one instance to merge their metrics.
+METRICS_DIR = config("METRICS_DIR", default="")
+METRICS_FLUSH_INTERVAL = config(
+    "METRICS_FLUSH_INTERVAL", default=5, cast=float
+)
+# Only these client addresses, or requests with an "Authorization: Bearer
+# <METRICS_TOKEN>" header, may read /metrics
+METRICS_ALLOWED_IPS = config(
+    "METRICS_ALLOWED_IPS", default="127.0.0.1,::1", cast=Csv()
+)
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+
+# How long reservation Idempotency-Key responses are kept, in seconds
+IDEMPOTENCY_KEY_TTL = config(
+    "IDEMPOTENCY_KEY_TTL", default=24 * 60 * 60, cast=int
+)
+
+# Waiting room: how long an admitted buyer keeps the purchase slot, and
+# how long free slots wait for the next buyers before the queue skips on.
+# All its state is in the shared cache, see CACHE_URL.
+WAITING_ROOM_ADMISSION_TTL = config(
+    "WAITING_ROOM_ADMISSION_TTL", default=10 * 60, cast=int
+)
+WAITING_ROOM_CALL_GRACE = config(
+    "WAITING_ROOM_CALL_GRACE", default=30, cast=int
+)
+
+# Where archive_past_performances --to file writes NDJSON archives
+ARCHIVE_DIR = config("ARCHIVE_DIR", default=str(BASE_DIR / "archive"))
+
+# Rendered e-ticket cache, see theatre_api/etickets.py
+ETICKET_DIR = config("ETICKET_DIR", default=str(BASE_DIR / "etickets"))
+# Files unused for this many seconds are deleted by prune_etickets
+ETICKET_MAX_AGE = config(
+    "ETICKET_MAX_AGE", default=30 * 24 * 60 * 60, cast=int
+)
+
+# Static catalog snapshots, see theatre_api/catalog.py: rebuilt this
+# many seconds after a catalog change, and at least every
+# CATALOG_MAX_AGE seconds to refresh availability. Poster URLs in them
+# are built on CATALOG_BASE_URL, the public address of the API.
+CATALOG_DIR = config("CATALOG_DIR", default=str(BASE_DIR / "catalog"))
+CATALOG_BASE_URL = config("CATALOG_BASE_URL", default="http://localhost:8000")
+CATALOG_REBUILD_DELAY = config("CATALOG_REBUILD_DELAY", default=5, cast=int)
+CATALOG_MAX_AGE = config("CATALOG_MAX_AGE", default=60, cast=int)
+CATALOG_KEEP_VERSIONS = 3
+
+# Performance series, see theatre_api/series.py: the minimum time between
+# two performances in a hall, and the largest series created at once.
+PERFORMANCE_MIN_GAP_MINUTES = config(
+    "PERFORMANCE_MIN_GAP_MINUTES", default=180, cast=int
+)
+SERIES_MAX_PERFORMANCES = 1000
+
+# Entrance check-in, see theatre_api/checkin.py: how often each process
+# reloads a performance's tickets and scans, the max scans per request,
+# and how long scanned tickets are remembered in the shared cache, which
+# deduplicates scans across processes (see CACHE_URL).
+CHECKIN_REFRESH_INTERVAL = config(
+    "CHECKIN_REFRESH_INTERVAL", default=60, cast=int
+)
+CHECKIN_MAX_BATCH = 500
+CHECKIN_CACHE_TTL = 24 * 60 * 60
+
+# Offline check-in manifests, see theatre_api/manifest.py. Scanner
+# devices are provisioned with the signing key.
+MANIFEST_SIGNING_KEY = config("MANIFEST_SIGNING_KEY", default=SECRET_KEY)
+MANIFEST_SETTLE_SECONDS = 10
+
+# Process-local cache of halls, plays and performances, see
+# theatre_api/reference_cache.py: only with a shared CACHE_URL by
+# default, how often each process checks the shared version numbers, and
+# the max cached rows per kind.
+REFERENCE_CACHE_ENABLED = config(
+    "REFERENCE_CACHE_ENABLED", default=CACHE_SHARED, cast=bool
+)
+REFERENCE_CACHE_CHECK_INTERVAL = config(
+    "REFERENCE_CACHE_CHECK_INTERVAL", default=1.0, cast=float
+)
+REFERENCE_CACHE_MAX_ITEMS = 10_000
+
+# Background jobs, see theatre_api/jobs.py. Retries wait
+# JOB_RETRY_BACKOFF * 2 ** (attempt - 1) seconds, capped at the max, and
+# running jobs whose worker died are picked up after JOB_LOCK_TIMEOUT.
+# Done and failed jobs are deleted after their retention (`prune_jobs`).
+JOB_WORKER_THREADS = config("JOB_WORKER_THREADS", default=2, cast=int)
+JOB_POLL_INTERVAL = config("JOB_POLL_INTERVAL", default=1.0, cast=float)
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BACKOFF = 10
+JOB_RETRY_BACKOFF_MAX = 60 * 60
+JOB_LOCK_TIMEOUT = config("JOB_LOCK_TIMEOUT", default=15 * 60, cast=int)
+JOB_RETENTION = config("JOB_RETENTION", default=7 * 24 * 60 * 60, cast=int)
+JOB_FAILED_RETENTION = config(
+    "JOB_FAILED_RETENTION", default=30 * 24 * 60 * 60, cast=int
+)
+
 SPECTACULAR_SETTINGS = {
     "TITLE": "Theatre Service API",
     "DESCRIPTION": "Order theatre tickets, reservation, etc.",
@@ -103,6 +304,19 @@ SPECTACULAR_SETTINGS = {
     },
 }
 
+# Import URL conf, views and DRF auth when the WSGI/ASGI app loads
+# instead of on the first request, see theatre_core/startup.py
+STARTUP_WARMUP = config("STARTUP_WARMUP", default=True, cast=bool)
+
+# How long /readyz reuses its deep checks, see theatre_api/health.py
+READINESS_CACHE_SECONDS = config(
+    "READINESS_CACHE_SECONDS", default=5, cast=float
+)
+
+# Pre-generated OpenAPI schema, see theatre_core/schema.py
+SCHEMA_DIR = config("SCHEMA_DIR", default=str(BASE_DIR / "openapi"))
+SCHEMA_CACHE_MAX_AGE = 60 * 60
+
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
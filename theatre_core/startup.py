@@ -0,0 +1,77 @@
+"""
+Startup helpers for fast-starting replicas.
+
+`warm_up` imports what the first request would otherwise import (URL
+conf, views, DRF authentication), so the cost is paid before the
+process accepts traffic. `lazy_view` keeps rarely used views with heavy
+imports, like schema generation, out of that path until first called.
+`pending_migrations` tells whether `migrate` has anything to do
+without loading the migration graph.
+"""
+
+import pkgutil
+from importlib import import_module
+
+from django.apps import apps
+from django.conf import settings
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.recorder import MigrationRecorder
+from django.utils.module_loading import import_string
+from django.views.decorators.csrf import csrf_exempt
+
+
+def lazy_view(path, **initkwargs):
+    """View of class `path`, imported and built on the first request"""
+    view = None
+
+    @csrf_exempt
+    def dispatch(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            view = import_string(path).as_view(**initkwargs)
+        return view(request, *args, **kwargs)
+
+    return dispatch
+
+
+def warm_up():
+    from django.urls import get_resolver
+    from rest_framework.settings import api_settings
+
+    if not settings.STARTUP_WARMUP:
+        return
+    # Resolving anything imports the URL conf and every view module
+    get_resolver().reverse_dict
+    api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    api_settings.DEFAULT_RENDERER_CLASSES
+    api_settings.DEFAULT_PARSER_CLASSES
+
+
+def pending_migrations(connection) -> list:
+    """
+    (app_label, name) of migration files not recorded as applied.
+    Only lists the migration packages instead of importing and
+    graphing every migration, as `migrate` does even when there is
+    nothing to apply.
+    """
+    recorder = MigrationRecorder(connection)
+    applied = (
+        set(recorder.applied_migrations()) if recorder.has_table() else set()
+    )
+    pending = []
+    for app_config in apps.get_app_configs():
+        module_name, _ = MigrationLoader.migrations_module(app_config.label)
+        if module_name is None:
+            continue
+        try:
+            module = import_module(module_name)
+        except ModuleNotFoundError:
+            continue
+        if not hasattr(module, "__path__"):
+            continue
+        for _, name, is_package in pkgutil.iter_modules(module.__path__):
+            if is_package or name[0] in "_~":
+                continue
+            if (app_config.label, name) not in applied:
+                pending.append((app_config.label, name))
+    return sorted(pending)
@@ -2,25 +2,35 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
-from drf_spectacular.views import (
-    SpectacularAPIView,
-    SpectacularSwaggerView,
-    SpectacularRedocView,
-)
+
+from theatre_api.views import healthz_view, metrics_view, readyz_view
+from theatre_core.startup import lazy_view
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics", metrics_view, name="metrics"),
+    path("healthz", healthz_view, name="healthz"),
+    path("readyz", readyz_view, name="readyz"),
     path("api/user/", include("user.urls", namespace="user")),
     path("api/theatre/", include("theatre_api.urls", namespace="theatre_api")),
-    path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
+    # Schema views import the whole schema generator, load them lazily
+    path(
+        "api/schema/",
+        lazy_view("theatre_core.schema.PrebuiltSchemaView"),
+        name="schema",
+    ),
     path(
         "api/schema/swagger/",
-        SpectacularSwaggerView.as_view(url_name="schema"),
+        lazy_view(
+            "drf_spectacular.views.SpectacularSwaggerView", url_name="schema"
+        ),
         name="swagger",
     ),
     path(
         "api/schema/redoc/",
-        SpectacularRedocView.as_view(url_name="schema"),
+        lazy_view(
+            "drf_spectacular.views.SpectacularRedocView", url_name="schema"
+        ),
         name="redoc",
     ),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)